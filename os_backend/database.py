@@ -1,13 +1,41 @@
-from sqlalchemy import create_engine, Column, Integer, String, Date, ForeignKey, Float
+import os
+from sqlalchemy import create_engine, event, text, Column, Integer, String, Date, ForeignKey, Float, Index
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import declarative_base, sessionmaker, relationship
+from sqlalchemy.pool import QueuePool
 
 DATABASE_URL = "sqlite:///./monk_os.db"
 
+# Vision recognition threads, the admin dashboard and quiz saves all hit the database at
+# once. A pool lets them each hold a connection instead of serialising on one.
+POOL_SIZE = int(os.getenv("MONK_DB_POOL_SIZE", "8"))
+POOL_OVERFLOW = int(os.getenv("MONK_DB_POOL_OVERFLOW", "8"))
+BUSY_TIMEOUT_MS = 5000      # Writers wait for the lock instead of failing with "database is locked"
+MMAP_SIZE = 64 * 1024 * 1024
+CACHE_SIZE_KB = 16 * 1024
+
 # Create Database Engine
 engine = create_engine(
-    DATABASE_URL, connect_args={"check_same_thread": False}
+    DATABASE_URL,
+    connect_args={"check_same_thread": False, "timeout": BUSY_TIMEOUT_MS / 1000},
+    poolclass=QueuePool,
+    pool_size=POOL_SIZE,
+    max_overflow=POOL_OVERFLOW,
+    pool_timeout=30,
 )
 
+@event.listens_for(engine, "connect")
+def _configure_sqlite(dbapi_connection, connection_record):
+    """Per-connection tuning. WAL lets admin reads run while vision is writing attendance."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")  # Safe with WAL; only fsyncs at checkpoints
+    cursor.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    cursor.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KB}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -17,9 +45,9 @@ class Student(Base):
     __tablename__ = "students"
 
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String, index=True)
+    name = Column(String, unique=True, index=True) # Recognition and quiz saves look students up by name
     face_id = Column(String, unique=True, index=True, nullable=True) # ID from FaceRec
-    grade = Column(String, default="Unassigned")
+    grade = Column(String, default="Unassigned", index=True)
 
     attendance = relationship("Attendance", back_populates="student")
     quiz_results = relationship("QuizResult", back_populates="student")
@@ -35,6 +63,11 @@ class Attendance(Base):
 
     student = relationship("Student", back_populates="attendance")
 
+    __table_args__ = (
+        # Per-student history and the daily "already marked present?" check; one row per day
+        Index("ix_attendance_student_date", "student_id", "date", unique=True),
+    )
+
 class QuizResult(Base):
     __tablename__ = "quiz_results"
 
@@ -43,10 +76,142 @@ class QuizResult(Base):
     topic = Column(String)
     score = Column(Integer)
     total = Column(Integer)
-    date = Column(String)
+    date = Column(String, index=True)
 
     student = relationship("Student", back_populates="quiz_results")
 
+    __table_args__ = (
+        Index("ix_quiz_results_student_date", "student_id", "date"),
+    )
+
+# --- Rollups ---
+# Pre-aggregated counters kept up to date by rollups.py as attendance and quiz rows are
+# written, so reports scan one row per day (or per topic) instead of every raw event.
+# Quiz averages are kept as a sum of percentages; avg = pct_sum / quizzes.
+
+class DailyStudentStats(Base):
+    __tablename__ = "daily_student_stats"
+
+    student_id = Column(Integer, ForeignKey("students.id"), primary_key=True)
+    date = Column(String, primary_key=True, index=True)
+    present = Column(Integer, default=0) # 1 once the student is marked present that day
+    first_seen = Column(String, nullable=True) # HH:MM:SS of the first sighting
+    quizzes = Column(Integer, default=0)
+    pct_sum = Column(Float, default=0.0)
+
+class DailyClassStats(Base):
+    __tablename__ = "daily_class_stats"
+
+    date = Column(String, primary_key=True)
+    grade = Column(String, primary_key=True) # Grade of the student at the time of the event
+    present = Column(Integer, default=0)
+    quizzes = Column(Integer, default=0)
+    pct_sum = Column(Float, default=0.0)
+
+class StudentTopicStats(Base):
+    __tablename__ = "student_topic_stats"
+
+    student_id = Column(Integer, ForeignKey("students.id"), primary_key=True)
+    topic = Column(String, primary_key=True)
+    quizzes = Column(Integer, default=0)
+    pct_sum = Column(Float, default=0.0)
+    best_pct = Column(Float, default=0.0)
+    last_date = Column(String)
+
+def ensure_indexes():
+    """create_all() only builds indexes with new tables; add any missing ones to existing databases."""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+# --- Migrations ---
+# Each step runs once, in order, tracked by SQLite's PRAGMA user_version.
+
+def _merge_duplicate_students(conn):
+    """Fold students sharing a name into the oldest row so students.name can become unique."""
+    dupes = conn.execute(text(
+        "SELECT s.id, keep.id FROM students s "
+        "JOIN (SELECT name, MIN(id) AS id FROM students WHERE name IS NOT NULL GROUP BY name HAVING COUNT(*) > 1) keep "
+        "ON s.name = keep.name AND s.id != keep.id"
+    )).all()
+    for dupe_id, keep_id in dupes:
+        for table in ("attendance", "quiz_results"):
+            conn.execute(text(f"UPDATE {table} SET student_id = :keep WHERE student_id = :dupe"),
+                         {"keep": keep_id, "dupe": dupe_id})
+        face_id = conn.execute(text("SELECT face_id FROM students WHERE id = :dupe"), {"dupe": dupe_id}).scalar()
+        conn.execute(text("DELETE FROM students WHERE id = :dupe"), {"dupe": dupe_id})
+        # Keep a face_id that was only enrolled on the duplicate
+        conn.execute(text("UPDATE students SET face_id = :face_id WHERE id = :keep AND face_id IS NULL"),
+                     {"keep": keep_id, "face_id": face_id})
+    if dupes:
+        print(f"[Database] Merged {len(dupes)} duplicate student record(s)")
+
+    # Merging can leave a student marked present twice on the same day
+    conn.execute(text(
+        "DELETE FROM attendance WHERE id NOT IN (SELECT MIN(id) FROM attendance GROUP BY student_id, date)"
+    ))
+    conn.execute(text("DROP INDEX IF EXISTS ix_students_name"))
+    conn.execute(text("DROP INDEX IF EXISTS ix_attendance_student_date"))
+
+def _backfill_rollups(conn):
+    """Build the rollup tables from existing history (quizzes with total <= 0 carry no score)."""
+    for table in ("daily_student_stats", "daily_class_stats", "student_topic_stats"):
+        conn.execute(text(f"DELETE FROM {table}"))
+    conn.execute(text(
+        "INSERT INTO daily_student_stats (student_id, date, present, first_seen, quizzes, pct_sum) "
+        "SELECT student_id, date, MAX(present), MIN(first_seen), SUM(quizzes), SUM(pct_sum) FROM ("
+        "  SELECT student_id, date, 1 AS present, time AS first_seen, 0 AS quizzes, 0.0 AS pct_sum "
+        "  FROM attendance WHERE status = 'Present' AND student_id IS NOT NULL "
+        "  UNION ALL "
+        "  SELECT student_id, date, 0, NULL, 1, score * 100.0 / total "
+        "  FROM quiz_results WHERE total > 0 AND student_id IS NOT NULL"
+        ") GROUP BY student_id, date"
+    ))
+    conn.execute(text(
+        "INSERT INTO daily_class_stats (date, grade, present, quizzes, pct_sum) "
+        "SELECT d.date, COALESCE(s.grade, 'Unassigned'), SUM(d.present), SUM(d.quizzes), SUM(d.pct_sum) "
+        "FROM daily_student_stats d LEFT JOIN students s ON s.id = d.student_id "
+        "GROUP BY d.date, COALESCE(s.grade, 'Unassigned')"
+    ))
+    conn.execute(text(
+        "INSERT INTO student_topic_stats (student_id, topic, quizzes, pct_sum, best_pct, last_date) "
+        "SELECT student_id, COALESCE(topic, ''), COUNT(*), SUM(score * 100.0 / total), MAX(score * 100.0 / total), MAX(date) "
+        "FROM quiz_results WHERE total > 0 AND student_id IS NOT NULL "
+        "GROUP BY student_id, COALESCE(topic, '')"
+    ))
+
+MIGRATIONS = [
+    _merge_duplicate_students,
+    _backfill_rollups,
+]
+
+def migrate():
+    """Bring an existing database up to date with the models. Call after create_all()."""
+    with engine.begin() as conn:
+        version = conn.execute(text("PRAGMA user_version")).scalar()
+        for step, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            migration(conn)
+            conn.execute(text(f"PRAGMA user_version = {step}"))
+            print(f"[Database] Applied migration {step}: {migration.__name__}")
+    # Recreates anything a migration dropped, now with the model's (unique) definition
+    ensure_indexes()
+
+def get_or_create_student(db, name: str, grade: str = "Auto-Enrolled"):
+    """Look a student up by name, enrolling them if needed. Safe against a concurrent enrol."""
+    student = db.query(Student).filter(Student.name == name).first()
+    if student:
+        return student
+    try:
+        student = Student(name=name, grade=grade)
+        db.add(student)
+        db.commit()
+    except IntegrityError:
+        # Another thread enrolled the same name between our lookup and insert
+        db.rollback()
+        return db.query(Student).filter(Student.name == name).one()
+    db.refresh(student)
+    return student
+
 # Dependency for FastAPI routers
 def get_db():
     db = SessionLocal()
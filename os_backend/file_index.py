@@ -0,0 +1,311 @@
+"""
+In-memory index of the MyFiles tree (routers/files.py).
+
+Each directory is read with a single `os.scandir` pass and cached together with the
+directory's mtime. A later lookup costs one `stat` of the directory: if its mtime is
+unchanged the cached entries are served as-is, otherwise the directory is re-scanned and
+unchanged files (same size and mtime) keep their already-classified entry.
+
+Changes are picked up in the background by watchdog (inotify) when it is installed, or by
+polling directory mtimes otherwise. Other modules can subscribe with `add_listener` to be
+told which files were added, modified or removed (thumbnails, search indexing).
+"""
+import os
+import time
+import mimetypes
+import threading
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:  # Optional: fall back to polling directory mtimes
+    Observer = None
+    FileSystemEventHandler = object
+
+POLL_INTERVAL = float(os.getenv("FILE_INDEX_POLL", "10"))  # Seconds between mtime sweeps without watchdog
+FULL_RESCAN_INTERVAL = 300.0  # Catch in-place edits, which don't touch the directory mtime
+SETTLE_DELAY = 0.5            # Let a burst of watchdog events (a copy in progress) settle before re-scanning
+
+DOC_EXTS = {'.doc', '.docx', '.txt', '.md', '.csv', '.xlsx', '.xls', '.ppt', '.pptx'}
+
+
+def get_file_category(mime_type: str, ext: str) -> str:
+    if mime_type:
+        if mime_type.startswith('image/'):
+            return 'image'
+        if mime_type.startswith('video/'):
+            return 'video'
+        if mime_type == 'application/pdf':
+            return 'pdf'
+
+    # Fallback to extensions for documents and text
+    if ext.lower() in DOC_EXTS:
+        return 'document'
+
+    return 'unknown'
+
+
+class FileEntry(NamedTuple):
+    path: str     # Relative to the index root, always '/'-separated
+    name: str
+    is_dir: bool
+    size: int
+    mtime: float
+    type: str     # 'folder', 'image', 'video', 'pdf', 'document', 'unknown'
+    mime: Optional[str]
+
+
+class _Dir:
+    __slots__ = ("mtime_ns", "scanned_at", "files", "subdirs")
+
+    def __init__(self, mtime_ns: int, files: Dict[str, FileEntry], subdirs: Dict[str, FileEntry]):
+        self.mtime_ns = mtime_ns
+        self.scanned_at = time.monotonic()
+        self.files = files
+        self.subdirs = subdirs
+
+
+SORT_KEYS = {
+    "name": lambda e: e.name.lower(),
+    "size": lambda e: e.size,
+    "mtime": lambda e: e.mtime,
+    "type": lambda e: (e.type, e.name.lower()),
+}
+
+
+class FileIndex:
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self._dirs: Dict[str, _Dir] = {}
+        self._dirty = set()
+        self._lock = threading.RLock()
+        self._wake = threading.Event()
+        self._listeners: List[Callable[[str, FileEntry], None]] = []
+        self._observer = None
+        self._started = False
+        self.scanned = False  # True once the initial full scan is done: later 'added' events are new files
+
+    # --- Paths ---
+
+    def resolve(self, rel_path: str) -> Optional[str]:
+        """Absolute path for a relative one, or None if it escapes the root."""
+        full = os.path.realpath(os.path.join(self.root, rel_path.strip("/")))
+        root = os.path.realpath(self.root)
+        if full != root and os.path.commonpath([full, root]) != root:
+            return None
+        return full
+
+    def _rel(self, full_path: str) -> str:
+        rel = os.path.relpath(full_path, self.root)
+        return "" if rel == "." else rel.replace(os.sep, "/")
+
+    # --- Listeners ---
+
+    def add_listener(self, callback: Callable[[str, FileEntry], None]):
+        """
+        callback(change, entry) with change in 'added', 'modified', 'removed'. Files only.
+        Runs with the index lock held, so hand any real work off to a queue or thread.
+        """
+        self._listeners.append(callback)
+
+    def _emit(self, change: str, entry: FileEntry):
+        for callback in list(self._listeners):
+            try:
+                callback(change, entry)
+            except Exception as e:
+                print(f"[FileIndex] Listener error: {e}")
+
+    # --- Scanning ---
+
+    def _scan(self, rel_dir: str, dir_mtime_ns: int) -> _Dir:
+        previous = self._dirs.get(rel_dir)
+        old_files = previous.files if previous else {}
+        files, subdirs = {}, {}
+        prefix = f"{rel_dir}/" if rel_dir else ""
+
+        with os.scandir(os.path.join(self.root, rel_dir)) as it:
+            for item in it:
+                if item.name.startswith("."):
+                    continue
+                try:
+                    if item.is_dir():
+                        st = item.stat()
+                        subdirs[item.name] = FileEntry(prefix + item.name, item.name, True, 0, st.st_mtime, "folder", None)
+                    elif item.is_file():
+                        st = item.stat()
+                        old = old_files.get(item.name)
+                        if old and old.size == st.st_size and old.mtime == st.st_mtime:
+                            files[item.name] = old
+                            continue
+                        mime_type, _ = mimetypes.guess_type(item.name)
+                        ext = os.path.splitext(item.name)[1]
+                        files[item.name] = FileEntry(prefix + item.name, item.name, False, st.st_size, st.st_mtime,
+                                                     get_file_category(mime_type, ext), mime_type)
+                except OSError:
+                    continue  # Vanished mid-scan
+
+        scanned = _Dir(dir_mtime_ns, files, subdirs)
+        self._dirs[rel_dir] = scanned
+
+        changes = []
+        for name, entry in files.items():
+            old = old_files.get(name)
+            if old is None:
+                changes.append(("added", entry))
+            elif old is not entry:
+                changes.append(("modified", entry))
+        changes.extend(("removed", old) for name, old in old_files.items() if name not in files)
+
+        # Forget cached subdirectories that no longer exist
+        if previous:
+            for name in previous.subdirs:
+                if name not in subdirs:
+                    self._forget(prefix + name)
+        for change, entry in changes:
+            self._emit(change, entry)
+        return scanned
+
+    def _forget(self, rel_dir: str):
+        gone = [d for d in self._dirs if d == rel_dir or d.startswith(rel_dir + "/")]
+        for d in gone:
+            for entry in self._dirs.pop(d).files.values():
+                self._emit("removed", entry)
+
+    def _get_dir(self, rel_dir: str, force: bool = False) -> Optional[_Dir]:
+        """Cached listing of one directory, re-scanned only if it changed."""
+        with self._lock:
+            try:
+                st = os.stat(os.path.join(self.root, rel_dir))
+            except (FileNotFoundError, NotADirectoryError):
+                self._forget(rel_dir)
+                return None
+            cached = self._dirs.get(rel_dir)
+            stale = (
+                force
+                or cached is None
+                or rel_dir in self._dirty
+                or cached.mtime_ns != st.st_mtime_ns
+                or time.monotonic() - cached.scanned_at > FULL_RESCAN_INTERVAL
+            )
+            self._dirty.discard(rel_dir)
+            return self._scan(rel_dir, st.st_mtime_ns) if stale else cached
+
+    def _walk(self, rel_dir: str):
+        pending = [rel_dir]
+        while pending:
+            current = pending.pop()
+            listing = self._get_dir(current)
+            if listing is None:
+                continue
+            yield listing
+            pending.extend(entry.path for entry in listing.subdirs.values())
+
+    def refresh(self):
+        """Re-check every directory under the root (mtime diff), emitting changes to listeners."""
+        for _ in self._walk(""):
+            pass
+
+    # --- Queries ---
+
+    def get(self, rel_path: str) -> Optional[FileEntry]:
+        rel_path = rel_path.strip("/")
+        parent, _, name = rel_path.rpartition("/")
+        listing = self._get_dir(parent)
+        if listing is None:
+            return None
+        return listing.files.get(name) or listing.subdirs.get(name)
+
+    def files(self) -> List[FileEntry]:
+        """Every file in the tree (used to seed listeners at startup)."""
+        return [entry for listing in self._walk("") for entry in listing.files.values()]
+
+    def list(self, subdir: str = "", recursive: bool = False, include_dirs: bool = False,
+             file_type: Optional[str] = None, sort: str = "name", descending: bool = False,
+             offset: int = 0, limit: Optional[int] = None) -> Tuple[int, List[FileEntry]]:
+        """(total matching, requested page). Raises FileNotFoundError for a missing subdir."""
+        subdir = subdir.strip("/")
+        listings = list(self._walk(subdir)) if recursive else [self._get_dir(subdir)]
+        if not listings or listings[0] is None:
+            raise FileNotFoundError(subdir)
+
+        entries = []
+        for listing in listings:
+            if include_dirs:
+                entries.extend(listing.subdirs.values())
+            entries.extend(listing.files.values())
+        if file_type:
+            entries = [e for e in entries if e.type == file_type]
+
+        entries.sort(key=SORT_KEYS.get(sort, SORT_KEYS["name"]), reverse=descending)
+        if include_dirs:
+            entries.sort(key=lambda e: not e.is_dir)  # Stable: folders first, each group keeps its order
+        total = len(entries)
+        end = None if limit is None else offset + limit
+        return total, entries[offset:end]
+
+    # --- Background refresh ---
+
+    def start(self):
+        """Build the index and keep it fresh in the background (idempotent)."""
+        if self._started:
+            return
+        self._started = True
+        if Observer is not None:
+            try:
+                self._observer = Observer()
+                self._observer.schedule(_WatchHandler(self), self.root, recursive=True)
+                self._observer.daemon = True
+                self._observer.start()
+                print(f"[FileIndex] Watching {self.root} with watchdog")
+            except Exception as e:
+                print(f"[FileIndex] watchdog unavailable ({e}), polling every {POLL_INTERVAL:.0f}s")
+                self._observer = None
+        else:
+            print(f"[FileIndex] watchdog not installed, polling every {POLL_INTERVAL:.0f}s")
+        threading.Thread(target=self._refresh_loop, daemon=True, name="file-index").start()
+
+    def mark_dirty(self, full_path: str):
+        rel = self._rel(full_path)
+        if rel.startswith(".."):
+            return
+        with self._lock:
+            self._dirty.add(rel)
+        self._wake.set()
+
+    def _refresh_loop(self):
+        self.refresh()
+        self.scanned = True
+        print(f"[FileIndex] Indexed {sum(len(d.files) for d in list(self._dirs.values()))} file(s) in {len(self._dirs)} folder(s)")
+        while True:
+            if self._observer is not None:
+                self._wake.wait()
+                time.sleep(SETTLE_DELAY)
+                self._wake.clear()
+                with self._lock:
+                    dirty = sorted(self._dirty)
+                for rel_dir in dirty:
+                    try:
+                        self._get_dir(rel_dir, force=True)
+                    except OSError as e:
+                        print(f"[FileIndex] Rescan of '{rel_dir}' failed: {e}")
+            else:
+                time.sleep(POLL_INTERVAL)
+                try:
+                    self.refresh()
+                except OSError as e:
+                    print(f"[FileIndex] Refresh failed: {e}")
+
+
+class _WatchHandler(FileSystemEventHandler):
+    """Marks the directories touched by a filesystem event for re-scanning."""
+
+    def __init__(self, index: FileIndex):
+        self.index = index
+
+    def on_any_event(self, event):
+        paths = [event.src_path, getattr(event, "dest_path", "")]
+        for path in filter(None, paths):
+            self.index.mark_dirty(os.path.dirname(path))
+            if event.is_directory:
+                self.index.mark_dirty(path)
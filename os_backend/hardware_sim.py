@@ -0,0 +1,232 @@
+"""
+Virtual Arduino + latency benchmark for the Robot Hardware Bridge (routers/hardware.py).
+
+Runs a pty-backed fake Arduino that speaks the same command set as the real firmware,
+so the bridge can be tuned on a laptop without the robot (Linux/macOS only: needs a pty).
+
+  python hardware_sim.py serve [--delay 0.05] [--framed]
+      Start the virtual Arduino and print its port. Point the backend at it with
+      ARDUINO_PORT=<port> (and MONK_ROBOT_FRAMED=1 if --framed).
+
+  python hardware_sim.py bench [--delay 0.02] [--framed] [--window 4] [--drop 0.0]
+      Start the virtual Arduino, connect a RobotBridge to it and measure commands/sec,
+      enqueue->ack latency percentiles, emergency-stop flush latency and burst behaviour.
+"""
+import os
+import sys
+import tty
+import time
+import queue
+import random
+import select
+import argparse
+import threading
+
+COMMANDS = ["dance start", "dance stop", "s", "bf", "bb", "bl", "br", "hf", "hb", "xf", "xb"]
+STOP_COMMANDS = ("s", "dance stop")
+
+
+class VirtualArduino:
+    """
+    Fake Arduino on a pseudo-terminal. Motion commands are executed one at a time, each
+    taking `servo_delay` seconds before it is acked; stop commands flush pending motion
+    and are acked immediately, like checkStop() in the firmware.
+    """
+    def __init__(self, servo_delay: float = 0.02, framed: bool = False, drop_rate: float = 0.0):
+        self.servo_delay = servo_delay
+        self.framed = framed
+        self.drop_rate = drop_rate
+        self.master_fd, self.slave_fd = os.openpty()
+        tty.setraw(self.slave_fd)  # No echo or line editing: behave like a raw USB CDC port
+        self.port = os.ttyname(self.slave_fd)
+        self.motion = queue.Queue()
+        self.received = 0
+        self.write_lock = threading.Lock()
+        self.running = True
+        threading.Thread(target=self._read_loop, daemon=True).start()
+        threading.Thread(target=self._motion_loop, daemon=True).start()
+
+    def _reply(self, seq, text: str):
+        line = f"#{seq} {text}\n" if self.framed and seq is not None else f"{text}\n"
+        with self.write_lock:
+            os.write(self.master_fd, line.encode())
+
+    def _read_loop(self):
+        buffer = b""
+        while self.running:
+            ready, _, _ = select.select([self.master_fd], [], [], 0.1)
+            if not ready:
+                continue
+            try:
+                buffer += os.read(self.master_fd, 1024)
+            except OSError:
+                return
+            while b"\n" in buffer:
+                raw, buffer = buffer.split(b"\n", 1)
+                self._handle(raw.decode(errors="replace").strip())
+
+    def _handle(self, line: str):
+        if not line:
+            return
+        self.received += 1
+        seq, cmd = None, line
+        if line.startswith("#") and " " in line:
+            head, cmd = line.split(" ", 1)
+            seq = head[1:]
+        if cmd not in COMMANDS:
+            self._reply(seq, f"ERR unknown {cmd}")
+        elif cmd in STOP_COMMANDS:
+            with self.motion.mutex:
+                self.motion.queue.clear()
+            self._reply(seq, "OK stopped")
+        else:
+            self.motion.put((seq, cmd))
+
+    def _motion_loop(self):
+        while self.running:
+            seq, cmd = self.motion.get()
+            time.sleep(self.servo_delay)
+            if random.random() >= self.drop_rate:
+                self._reply(seq, f"OK {cmd}")
+
+    def close(self):
+        self.running = False
+        os.close(self.master_fd)
+        os.close(self.slave_fd)
+
+
+def _percentiles(samples: list) -> str:
+    if not samples:
+        return "no samples"
+    s = sorted(samples)
+    pick = lambda q: s[min(len(s) - 1, int(len(s) * q))] * 1000
+    return f"p50 {pick(0.5):.1f} ms | p95 {pick(0.95):.1f} ms | p99 {pick(0.99):.1f} ms | max {s[-1] * 1000:.1f} ms (n={len(s)})"
+
+
+def run_benchmark(args):
+    sim = VirtualArduino(servo_delay=args.delay, framed=args.framed, drop_rate=args.drop)
+    # The bridge reads its configuration at import time, so point it at the simulator first
+    os.environ["ARDUINO_PORT"] = sim.port
+    os.environ["MONK_ROBOT_FRAMED"] = "1" if args.framed else "0"
+    if args.window:
+        os.environ["MONK_ROBOT_WINDOW"] = str(args.window)
+    from routers import hardware
+
+    robot = hardware.robot
+    replies = queue.Queue()
+    robot.add_listener(lambda event: event["type"] in ("reply", "timeout") and replies.put((time.perf_counter(), event)))
+
+    print(f"[Sim] Virtual Arduino on {sim.port} (servo delay {args.delay * 1000:.0f} ms, "
+          f"{'framed' if args.framed else 'legacy'}, window {hardware.ACK_WINDOW}, drop {args.drop:.0%})")
+    deadline = time.time() + hardware.RESET_SETTLE + 5
+    while not robot.connected and time.time() < deadline:
+        time.sleep(0.05)
+    if not robot.connected:
+        sys.exit("[Sim] Bridge never connected to the virtual Arduino")
+
+    def wait_reply(command: str, timeout: float = 5.0):
+        end = time.perf_counter() + timeout
+        while time.perf_counter() < end:
+            try:
+                at, event = replies.get(timeout=end - time.perf_counter())
+            except queue.Empty:
+                break
+            if event.get("command") == command:
+                return at, event
+        return None, None
+
+    def drain():
+        while not replies.empty():
+            replies.get_nowait()
+
+    # 1. Raw windowed throughput: writes gated only by the ack window
+    n = args.count
+    drain()
+    t0 = time.perf_counter()
+    for i in range(n):
+        robot._send_command_immediate(COMMANDS[3 + i % 8])
+    acked = 0
+    while acked < n:
+        try:
+            replies.get(timeout=hardware.ACK_TIMEOUT + 1)
+            acked += 1
+        except queue.Empty:
+            break
+    elapsed = time.perf_counter() - t0
+    print(f"[Bench] Raw throughput: {acked}/{n} acked in {elapsed:.2f}s -> {acked / elapsed:.1f} cmd/s")
+
+    # 2. Enqueue -> ack latency through the motion scheduler (spaced so nothing coalesces)
+    drain()
+    latencies = []
+    for i in range(args.samples):
+        cmd = COMMANDS[3 + i % 8]
+        t_enqueue = time.perf_counter()
+        robot.enqueue_command(cmd)
+        at, event = wait_reply(cmd)
+        if at is not None and event["type"] == "reply":
+            latencies.append(at - t_enqueue)
+        time.sleep(max(hardware.GROUP_MIN_INTERVAL.values()))
+    print(f"[Bench] Enqueue->ack latency: {_percentiles(latencies)}")
+
+    # 3. Emergency stop while a burst is pending
+    drain()
+    for cmd in ["bf", "hf", "xf"] * 5:
+        robot.enqueue_command(cmd)
+    t_stop = time.perf_counter()
+    robot.enqueue_command("s")
+    at, _ = wait_reply("s")
+    if at is not None:
+        print(f"[Bench] Emergency stop ack: {(at - t_stop) * 1000:.1f} ms (pending moves flushed: {robot.scheduler.stats['flushed']})")
+    else:
+        print("[Bench] Emergency stop: no ack")
+
+    # 4. Burst load: a held-down button from several controllers at once
+    time.sleep(hardware.ACK_TIMEOUT)
+    drain()
+    before = robot.scheduler.snapshot()
+    max_depth = 0
+    t0 = time.perf_counter()
+    for i in range(args.burst):
+        robot.enqueue_command(["bf", "bl", "hf", "xf"][i % 4])
+        max_depth = max(max_depth, robot.scheduler.snapshot()["depth"])
+    submit_time = time.perf_counter() - t0
+    while robot.scheduler.snapshot()["depth"] or robot.inflight:
+        time.sleep(0.01)
+    drain_time = time.perf_counter() - t0
+    after = robot.scheduler.snapshot()
+    print(f"[Bench] Burst of {args.burst}: submitted in {submit_time * 1000:.1f} ms, max depth {max_depth}, "
+          f"coalesced {after['coalesced'] - before['coalesced']}, dropped {after['dropped'] - before['dropped']}, "
+          f"sent {after['sent'] - before['sent']}, drained in {drain_time * 1000:.0f} ms")
+    print(f"[Bench] Bridge latency stats: {robot.latency_stats()}")
+    sim.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("mode", choices=["serve", "bench"])
+    parser.add_argument("--delay", type=float, default=0.02, help="Seconds each motion command takes before its ack")
+    parser.add_argument("--framed", action="store_true", help="Speak the '#<seq> <cmd>' framed protocol")
+    parser.add_argument("--drop", type=float, default=0.0, help="Fraction of motion acks to swallow")
+    parser.add_argument("--window", type=int, default=0, help="Override MONK_ROBOT_WINDOW for the bench")
+    parser.add_argument("--count", type=int, default=200, help="Commands in the raw throughput test")
+    parser.add_argument("--samples", type=int, default=20, help="Enqueue->ack latency samples")
+    parser.add_argument("--burst", type=int, default=500, help="Commands in the burst test")
+    args = parser.parse_args()
+
+    if args.mode == "bench":
+        run_benchmark(args)
+        return
+
+    sim = VirtualArduino(servo_delay=args.delay, framed=args.framed, drop_rate=args.drop)
+    print(f"[Sim] Virtual Arduino listening on {sim.port}")
+    print(f"[Sim] Start the backend with ARDUINO_PORT={sim.port}{' MONK_ROBOT_FRAMED=1' if args.framed else ''}")
+    try:
+        while True:
+            time.sleep(5)
+            print(f"[Sim] {sim.received} command(s) received, {sim.motion.qsize()} moving")
+    except KeyboardInterrupt:
+        sim.close()
+
+
+if __name__ == "__main__":
+    main()
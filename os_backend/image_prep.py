@@ -0,0 +1,88 @@
+"""
+Shared image preparation for every vision-LLM call (Math Wizard, Smart Killer, RAG).
+
+Uploads are decoded, downscaled and re-encoded as JPEG in a small worker pool so the
+event loop never stalls on PIL. JPEGs use `draft()` so libjpeg decodes straight at
+1/2, 1/4 or 1/8 scale instead of inflating a 12 MP phone photo first. Results are
+cached by content hash, so re-sending the same photo costs nothing.
+"""
+import io
+import asyncio
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Union
+
+from PIL import Image as PILImage, ImageOps
+
+# Per use-case target: (longest side in px, JPEG quality)
+PRESETS = {
+    "math_wizard":  (800, 80),   # one handwritten answer on a scrap of paper
+    "smart_killer": (1600, 85),  # textbook pages: small print has to stay legible
+    "rag":          (2048, 85),  # charts and diagrams for full document analysis
+}
+
+CACHE_SIZE = 64
+_cache: "OrderedDict[tuple, PreparedImage]" = OrderedDict()
+_cache_lock = threading.Lock()
+_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="image-prep")
+
+
+class PreparedImage(NamedTuple):
+    b64: str
+    width: int
+    height: int
+    mime: str = "image/jpeg"  # always re-encoded, whatever the upload was
+
+    @property
+    def data_url(self) -> str:
+        return f"data:{self.mime};base64,{self.b64}"
+
+
+def _file_digest(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def prepare_image(data: Union[bytes, str], preset: str, digest: str = None) -> PreparedImage:
+    """
+    Blocking version; call from a worker thread (or use `prepare_image_async`).
+    `data` is the image bytes or a path to the image (e.g. a spooled upload, see uploads.py).
+    """
+    max_side, quality = PRESETS[preset]
+    if digest is None:
+        digest = _file_digest(data) if isinstance(data, str) else hashlib.sha256(data).hexdigest()
+    key = (digest, max_side, quality)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    img = PILImage.open(data if isinstance(data, str) else io.BytesIO(data))
+    # No-op for non-JPEG sources; for JPEG this is where most of the speedup comes from
+    img.draft("RGB", (max_side, max_side))
+    # Phone photos of worksheets are often stored sideways with an EXIF rotation flag
+    img = ImageOps.exif_transpose(img)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    img.thumbnail((max_side, max_side))
+
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=quality)
+    prepared = PreparedImage(base64.b64encode(out.getvalue()).decode(), img.width, img.height)
+
+    with _cache_lock:
+        _cache[key] = prepared
+        if len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return prepared
+
+
+async def prepare_image_async(data: Union[bytes, str], preset: str, digest: str = None) -> PreparedImage:
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(_pool, prepare_image, data, preset, digest)
@@ -1,7 +1,6 @@
-from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, Request
 import os
+from contextlib import asynccontextmanager
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 
@@ -9,11 +8,26 @@ load_dotenv()  # Safely load local API keys from .env
 
 from routers import vision, voice, rag, smart_killer, admin, math_wizard, hardware, files
 import database
+import speech
+from static_serving import StaticBundle
+from uploads import UploadLimitMiddleware
 
 # Initialize SQLite Database Tables
 database.Base.metadata.create_all(bind=database.engine)
+database.migrate()
 
-app = FastAPI(title="Monk OS Backend (Pi 5 AI Core)", version="3.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Whisper and Piper worker processes: loaded in the background, voice routes answer 503 until ready
+    speech.start()
+    yield
+    speech.stop()
+
+app = FastAPI(title="Monk OS Backend (Pi 5 AI Core)", version="3.0.0", lifespan=lifespan)
+
+# Per-route upload size caps, enforced while the body is still arriving (see uploads.py).
+# Added before CORS so CORS is the outer layer and its headers reach the 413 too.
+app.add_middleware(UploadLimitMiddleware)
 
 # Allow React frontend to access API
 app.add_middleware(
@@ -22,6 +36,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Total-Count"],  # Paged file listings (routers/files.py)
 )
 
 # Mount endpoints
@@ -39,19 +54,17 @@ app.include_router(files.router, prefix="/api/files", tags=["MyFiles Explorer"])
 FRONTEND_BUILD_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__main__.__file__ if '__main__' in str(globals()) else __file__))), "dist")
 
 if os.path.exists(FRONTEND_BUILD_DIR):
-    app.mount("/assets", StaticFiles(directory=os.path.join(FRONTEND_BUILD_DIR, "assets")), name="assets")
-    
+    # Ranges, ETag/304s, immutable caching of hashed /assets and pre-compressed .br/.gz siblings
+    frontend_bundle = StaticBundle(FRONTEND_BUILD_DIR)
+
     # Catch-all to serve index.html for React Router compatibility
-    @app.get("/{full_path:path}")
-    async def serve_frontend(full_path: str):
+    @app.api_route("/{full_path:path}", methods=["GET", "HEAD"])
+    def serve_frontend(full_path: str, request: Request):
         # Prevent intercepting valid API calls if they somehow missed a router
         if full_path.startswith("api"):
             return {"error": "API route not found"}
-            
-        file_path = os.path.join(FRONTEND_BUILD_DIR, full_path)
-        if os.path.exists(file_path) and os.path.isfile(file_path):
-            return FileResponse(file_path)
-        return FileResponse(os.path.join(FRONTEND_BUILD_DIR, "index.html"))
+
+        return frontend_bundle.serve(request, full_path)
 else:
     @app.get("/")
     def read_root():
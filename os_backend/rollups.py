@@ -0,0 +1,91 @@
+"""
+Incremental maintenance of the rollup tables defined in database.py.
+
+Call these in the same session (and transaction) that inserts the raw Attendance /
+QuizResult row, before commit, so the counters can never drift from the history:
+if the insert is rolled back, so is the rollup update.
+"""
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from database import Student, DailyStudentStats, DailyClassStats, StudentTopicStats
+
+
+def _grade_of(db: Session, student_id: int) -> str:
+    student = db.get(Student, student_id)
+    return (student.grade if student and student.grade else "Unassigned")
+
+
+def record_attendance(db: Session, student_id: int, date: str, time: str):
+    """Count a 'Present' mark. Callers insert at most one per student per day (unique index)."""
+    stmt = insert(DailyStudentStats).values(student_id=student_id, date=date, present=1, first_seen=time,
+                                            quizzes=0, pct_sum=0.0)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["student_id", "date"],
+        set_={"present": 1, "first_seen": func.coalesce(DailyStudentStats.first_seen, stmt.excluded.first_seen)},
+    ))
+
+    stmt = insert(DailyClassStats).values(date=date, grade=_grade_of(db, student_id), present=1, quizzes=0, pct_sum=0.0)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["date", "grade"],
+        set_={"present": DailyClassStats.present + 1},
+    ))
+
+
+def record_quiz(db: Session, student_id: int, topic: str, score: int, total: int, date: str):
+    """Fold one quiz result into the daily, class and per-topic counters."""
+    if not total or total <= 0:
+        return  # Nothing to average
+    pct = score * 100.0 / total
+
+    stmt = insert(DailyStudentStats).values(student_id=student_id, date=date, present=0, quizzes=1, pct_sum=pct)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["student_id", "date"],
+        set_={"quizzes": DailyStudentStats.quizzes + 1, "pct_sum": DailyStudentStats.pct_sum + pct},
+    ))
+
+    stmt = insert(DailyClassStats).values(date=date, grade=_grade_of(db, student_id), present=0, quizzes=1, pct_sum=pct)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["date", "grade"],
+        set_={"quizzes": DailyClassStats.quizzes + 1, "pct_sum": DailyClassStats.pct_sum + pct},
+    ))
+
+    stmt = insert(StudentTopicStats).values(student_id=student_id, topic=topic or "", quizzes=1, pct_sum=pct,
+                                            best_pct=pct, last_date=date)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["student_id", "topic"],
+        set_={
+            "quizzes": StudentTopicStats.quizzes + 1,
+            "pct_sum": StudentTopicStats.pct_sum + pct,
+            "best_pct": func.max(StudentTopicStats.best_pct, pct),
+            "last_date": date,
+        },
+    ))
+
+
+def forget_student(db: Session, student_id: int):
+    """Take a student's contributions back out of every rollup. Call before deleting the student."""
+    grade = _grade_of(db, student_id)
+    days = db.execute(
+        select(DailyStudentStats.date, DailyStudentStats.present, DailyStudentStats.quizzes, DailyStudentStats.pct_sum)
+        .where(DailyStudentStats.student_id == student_id)
+    ).all()
+    for date, present, quizzes, pct_sum in days:
+        db.execute(
+            update(DailyClassStats)
+            .where(DailyClassStats.date == date, DailyClassStats.grade == grade)
+            .values(present=DailyClassStats.present - (present or 0),
+                    quizzes=DailyClassStats.quizzes - (quizzes or 0),
+                    pct_sum=DailyClassStats.pct_sum - (pct_sum or 0.0))
+        )
+    if days:
+        # As if the student had never been counted: no empty class rows left behind
+        db.execute(delete(DailyClassStats).where(
+            DailyClassStats.date.in_([day.date for day in days]),
+            DailyClassStats.grade == grade,
+            DailyClassStats.present <= 0,
+            DailyClassStats.quizzes <= 0,
+        ))
+    db.execute(delete(DailyStudentStats).where(DailyStudentStats.student_id == student_id))
+    db.execute(delete(StudentTopicStats).where(StudentTopicStats.student_id == student_id))
@@ -1,7 +1,18 @@
+import io
+import csv
+import json
+import time
+import threading
+from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi.responses import StreamingResponse
+from sqlalchemy import event, func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload
 from datetime import datetime
-from database import get_db, Student, Attendance, QuizResult
+from database import (get_db, SessionLocal, Student, Attendance, QuizResult,
+                      DailyStudentStats, DailyClassStats, StudentTopicStats)
+import rollups
 from pydantic import BaseModel
 
 router = APIRouter()
@@ -16,11 +27,36 @@ def get_students(db: Session = Depends(get_db)):
     students = db.query(Student).all()
     return students
 
+MAX_PAGE_SIZE = 500
+EXPORT_BATCH = 500  # Rows fetched from SQLite (and flushed to the client) at a time
+
+@router.get("/students/page")
+def get_students_page(cursor: int = 0, limit: int = 50, grade: Optional[str] = None,
+                      q: Optional[str] = None, db: Session = Depends(get_db)):
+    """Keyset-paginated roster: pass `next_cursor` back as `cursor` for the next page."""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = db.query(Student).filter(Student.id > cursor)
+    if grade:
+        query = query.filter(Student.grade == grade)
+    if q:
+        query = query.filter(Student.name.ilike(f"%{q}%"))
+    items = query.order_by(Student.id).limit(limit + 1).all()
+    has_more = len(items) > limit
+    items = items[:limit]
+    return {
+        "items": [{"id": s.id, "name": s.name, "face_id": s.face_id, "grade": s.grade} for s in items],
+        "next_cursor": items[-1].id if has_more else None,
+    }
+
 @router.post("/students")
 def create_student(student: StudentCreate, db: Session = Depends(get_db)):
     db_student = Student(name=student.name, grade=student.grade, face_id=student.face_id)
     db.add(db_student)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="A student with that name or face ID already exists")
     db.refresh(db_student)
     return db_student
 
@@ -29,43 +65,333 @@ def delete_student(student_id: int, db: Session = Depends(get_db)):
     student = db.query(Student).filter(Student.id == student_id).first()
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
+    rollups.forget_student(db, student.id)  # Same transaction: reports stop counting them with the delete
     db.delete(student)
     db.commit()
     return {"message": "Deleted"}
 
-@router.get("/dashboard")
-def get_dashboard_stats(db: Session = Depends(get_db)):
-    today = datetime.now().strftime("%Y-%m-%d")
-    
-    # Calculate total students
-    total_students = db.query(Student).count()
-    
-    # Calculate present today
-    present_today = db.query(Attendance).filter(
-        Attendance.date == today,
-        Attendance.status == "Present"
-    ).count()
-
-    # Get recent quiz scores (last 10)
-    recent_quizzes = db.query(QuizResult).order_by(QuizResult.id.desc()).limit(10).all()
-    
-    quiz_data = []
-    for q in recent_quizzes:
-        student = db.query(Student).filter(Student.id == q.student_id).first()
-        quiz_data.append({
-            "id": q.id,
-            "student_name": student.name if student else "Unknown",
-            "topic": q.topic,
-            "score": q.score,
-            "total": q.total,
-            "date": q.date
-        })
+# --- Dashboard cache ---
+# The dashboard is polled by every open admin tab; a few seconds of staleness is fine,
+# and any write to the tables it summarises clears it immediately.
+DASHBOARD_TTL = 10.0
+_dashboard_cache = {"key": None, "at": 0.0, "data": None, "generation": 0}
+_dashboard_lock = threading.Lock()
+
+def invalidate_dashboard_cache():
+    with _dashboard_lock:
+        _dashboard_cache["data"] = None
+        _dashboard_cache["generation"] += 1
+
+@event.listens_for(SessionLocal, "after_commit")
+def _invalidate_on_write(session):
+    # Catches writes from every router (vision attendance, quiz scores, roster edits), including
+    # the Core upserts into the rollup tables. Only once committed: a rebuild between flush and
+    # commit would read (and cache) the old rows, and a rolled-back write changed nothing.
+    invalidate_dashboard_cache()
+
+def _build_dashboard(db: Session, today: str) -> dict:
+    # 1) Headline numbers in a single SELECT of scalar subqueries, read from the daily rollups
+    total_students, present_today, school_days = db.query(
+        select(func.count(Student.id)).scalar_subquery(),
+        select(func.coalesce(func.sum(DailyClassStats.present), 0)).where(DailyClassStats.date == today).scalar_subquery(),
+        select(func.count(func.distinct(DailyClassStats.date))).where(DailyClassStats.present > 0).scalar_subquery(),
+    ).one()
+
+    # 2) Recent quiz scores (last 10) with their students eagerly joined (no per-row lookup)
+    recent_quizzes = (
+        db.query(QuizResult)
+        .options(joinedload(QuizResult.student))
+        .order_by(QuizResult.id.desc())
+        .limit(10)
+        .all()
+    )
+    quiz_data = [{
+        "id": q.id,
+        "student_name": q.student.name if q.student else "Unknown",
+        "topic": q.topic,
+        "score": q.score,
+        "total": q.total,
+        "date": q.date
+    } for q in recent_quizzes]
+
+    # 3) Roster with per-student attendance rate and average score, aggregated from the rollups
+    attendance = (
+        select(DailyStudentStats.student_id, func.count().label("days_present"))
+        .where(DailyStudentStats.present > 0)
+        .group_by(DailyStudentStats.student_id)
+        .subquery()
+    )
+    quizzes = (
+        select(
+            StudentTopicStats.student_id,
+            func.sum(StudentTopicStats.quizzes).label("quizzes"),
+            (func.sum(StudentTopicStats.pct_sum) / func.sum(StudentTopicStats.quizzes)).label("avg_score"),
+        )
+        .group_by(StudentTopicStats.student_id)
+        .subquery()
+    )
+    rows = (
+        db.query(Student, attendance.c.days_present, quizzes.c.quizzes, quizzes.c.avg_score)
+        .outerjoin(attendance, attendance.c.student_id == Student.id)
+        .outerjoin(quizzes, quizzes.c.student_id == Student.id)
+        .order_by(Student.id)
+        .all()
+    )
+    students = [{
+        "id": s.id,
+        "name": s.name,
+        "face_id": s.face_id,
+        "grade": s.grade,
+        "days_present": days_present or 0,
+        "attendance_rate": round((days_present or 0) / school_days * 100, 1) if school_days else None,
+        "quizzes": quiz_count or 0,
+        "avg_score": round(avg_score, 1) if avg_score is not None else None,
+    } for s, days_present, quiz_count, avg_score in rows]
 
     return {
         "stats": {
             "total_students": total_students,
             "present_today": present_today,
+            "school_days": school_days,
             "date": today
         },
-        "recent_activity": quiz_data
+        "recent_activity": quiz_data,
+        "students": students
     }
+
+@router.get("/dashboard")
+def get_dashboard_stats(db: Session = Depends(get_db)):
+    """Everything the admin dashboard shows, in one round-trip and a fixed number of queries."""
+    today = datetime.now().strftime("%Y-%m-%d")
+    now = time.monotonic()
+    with _dashboard_lock:
+        cached = _dashboard_cache["data"]
+        if cached is not None and _dashboard_cache["key"] == today and now - _dashboard_cache["at"] < DASHBOARD_TTL:
+            return cached
+        generation = _dashboard_cache["generation"]
+
+    data = _build_dashboard(db, today)
+    with _dashboard_lock:
+        # A write landed while we were building: this result may predate it, so don't keep it
+        if _dashboard_cache["generation"] == generation:
+            _dashboard_cache.update(key=today, at=now, data=data)
+    return data
+
+# --- Reports (rollup tables only: cost grows with school days, not with raw rows) ---
+
+def _avg(pct_sum, quizzes):
+    return round(pct_sum / quizzes, 1) if quizzes else None
+
+@router.get("/reports/daily")
+def daily_report(date_from: Optional[str] = None, date_to: Optional[str] = None,
+                 grade: Optional[str] = None, db: Session = Depends(get_db)):
+    """Per-day attendance and quiz averages, for the whole school or one grade."""
+    query = db.query(
+        DailyClassStats.date,
+        func.sum(DailyClassStats.present),
+        func.sum(DailyClassStats.quizzes),
+        func.sum(DailyClassStats.pct_sum),
+    )
+    if grade:
+        query = query.filter(DailyClassStats.grade == grade)
+    if date_from:
+        query = query.filter(DailyClassStats.date >= date_from)
+    if date_to:
+        query = query.filter(DailyClassStats.date <= date_to)
+    rows = query.group_by(DailyClassStats.date).order_by(DailyClassStats.date).all()
+    return [{
+        "date": date,
+        "present": present,
+        "quizzes": quiz_count,
+        "avg_score": _avg(pct_sum, quiz_count),
+    } for date, present, quiz_count, pct_sum in rows]
+
+@router.get("/reports/grades")
+def grade_report(date_from: Optional[str] = None, date_to: Optional[str] = None, db: Session = Depends(get_db)):
+    """Attendance and average score per grade over a date range."""
+    query = db.query(
+        DailyClassStats.grade,
+        func.sum(DailyClassStats.present),
+        func.count(func.distinct(DailyClassStats.date)),
+        func.sum(DailyClassStats.quizzes),
+        func.sum(DailyClassStats.pct_sum),
+    )
+    if date_from:
+        query = query.filter(DailyClassStats.date >= date_from)
+    if date_to:
+        query = query.filter(DailyClassStats.date <= date_to)
+    rows = query.group_by(DailyClassStats.grade).order_by(DailyClassStats.grade).all()
+    return [{
+        "grade": grade,
+        "present_total": present,
+        "days": days,
+        "quizzes": quiz_count,
+        "avg_score": _avg(pct_sum, quiz_count),
+    } for grade, present, days, quiz_count, pct_sum in rows]
+
+@router.get("/reports/students/{student_id}")
+def student_report(student_id: int, db: Session = Depends(get_db)):
+    """A student's day-by-day record, attendance streaks and average score per topic."""
+    student = db.query(Student).filter(Student.id == student_id).first()
+    if not student:
+        raise HTTPException(status_code=404, detail="Student not found")
+
+    days = (
+        db.query(DailyStudentStats)
+        .filter(DailyStudentStats.student_id == student_id)
+        .order_by(DailyStudentStats.date)
+        .all()
+    )
+    present_days = {d.date for d in days if d.present}
+
+    # A streak counts consecutive school days (days anyone was present), so weekends don't break it
+    school_days = [row[0] for row in (
+        db.query(DailyClassStats.date)
+        .filter(DailyClassStats.present > 0)
+        .group_by(DailyClassStats.date)
+        .order_by(DailyClassStats.date)
+        .all()
+    )]
+    longest = current = 0
+    for date in school_days:
+        current = current + 1 if date in present_days else 0
+        longest = max(longest, current)
+
+    topics = (
+        db.query(StudentTopicStats)
+        .filter(StudentTopicStats.student_id == student_id)
+        .order_by(StudentTopicStats.last_date.desc())
+        .all()
+    )
+    return {
+        "student": {"id": student.id, "name": student.name, "grade": student.grade},
+        "days_present": len(present_days),
+        "school_days": len(school_days),
+        "current_streak": current,
+        "longest_streak": longest,
+        "days": [{
+            "date": d.date,
+            "present": bool(d.present),
+            "first_seen": d.first_seen,
+            "quizzes": d.quizzes,
+            "avg_score": _avg(d.pct_sum, d.quizzes),
+        } for d in days],
+        "topics": [{
+            "topic": t.topic,
+            "quizzes": t.quizzes,
+            "avg_score": _avg(t.pct_sum, t.quizzes),
+            "best_score": round(t.best_pct, 1),
+            "last_date": t.last_date,
+        } for t in topics],
+    }
+
+@router.get("/reports/topics")
+def topic_report(grade: Optional[str] = None, db: Session = Depends(get_db)):
+    """Average score per quiz topic across students (optionally one grade)."""
+    query = db.query(
+        StudentTopicStats.topic,
+        func.count(StudentTopicStats.student_id),
+        func.sum(StudentTopicStats.quizzes),
+        func.sum(StudentTopicStats.pct_sum),
+    )
+    if grade:
+        query = query.join(Student, Student.id == StudentTopicStats.student_id).filter(Student.grade == grade)
+    rows = query.group_by(StudentTopicStats.topic).order_by(StudentTopicStats.topic).all()
+    return [{
+        "topic": topic,
+        "students": students,
+        "quizzes": quiz_count,
+        "avg_score": _avg(pct_sum, quiz_count),
+    } for topic, students, quiz_count, pct_sum in rows]
+
+# --- History listings & exports ---
+# Attendance and quiz history are listed newest-first with keyset pagination on id
+# (no OFFSET scans), and exported as CSV/NDJSON straight off a streaming cursor.
+
+def _history_select(dataset: str, student_id: Optional[int], grade: Optional[str],
+                    date_from: Optional[str], date_to: Optional[str], topic: Optional[str] = None):
+    if dataset == "attendance":
+        model = Attendance
+        columns = [Attendance.id, Attendance.student_id, Student.name.label("student_name"), Student.grade,
+                   Attendance.date, Attendance.time, Attendance.status]
+    elif dataset == "quiz-results":
+        model = QuizResult
+        columns = [QuizResult.id, QuizResult.student_id, Student.name.label("student_name"), Student.grade,
+                   QuizResult.topic, QuizResult.score, QuizResult.total, QuizResult.date]
+    else:
+        raise HTTPException(status_code=404, detail="Unknown dataset")
+
+    stmt = select(*columns).outerjoin(Student, Student.id == model.student_id)
+    if student_id is not None:
+        stmt = stmt.where(model.student_id == student_id)
+    if grade:
+        stmt = stmt.where(Student.grade == grade)
+    # Dates are stored as YYYY-MM-DD strings, so lexical comparison is chronological
+    if date_from:
+        stmt = stmt.where(model.date >= date_from)
+    if date_to:
+        stmt = stmt.where(model.date <= date_to)
+    if topic and model is QuizResult:
+        stmt = stmt.where(QuizResult.topic == topic)
+    return model, stmt
+
+def _history_page(dataset: str, db: Session, cursor: Optional[int], limit: int, **filters):
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    model, stmt = _history_select(dataset, **filters)
+    if cursor:
+        stmt = stmt.where(model.id < cursor)
+    rows = db.execute(stmt.order_by(model.id.desc()).limit(limit + 1)).mappings().all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {"items": [dict(r) for r in rows], "next_cursor": rows[-1]["id"] if has_more else None}
+
+@router.get("/attendance")
+def list_attendance(cursor: Optional[int] = None, limit: int = 100, student_id: Optional[int] = None,
+                    grade: Optional[str] = None, date_from: Optional[str] = None, date_to: Optional[str] = None,
+                    db: Session = Depends(get_db)):
+    return _history_page("attendance", db, cursor, limit, student_id=student_id, grade=grade,
+                         date_from=date_from, date_to=date_to)
+
+@router.get("/quiz-results")
+def list_quiz_results(cursor: Optional[int] = None, limit: int = 100, student_id: Optional[int] = None,
+                      grade: Optional[str] = None, date_from: Optional[str] = None, date_to: Optional[str] = None,
+                      topic: Optional[str] = None, db: Session = Depends(get_db)):
+    return _history_page("quiz-results", db, cursor, limit, student_id=student_id, grade=grade,
+                         date_from=date_from, date_to=date_to, topic=topic)
+
+@router.get("/export/{dataset}")
+def export_history(dataset: str, format: str = "csv", student_id: Optional[int] = None,
+                   grade: Optional[str] = None, date_from: Optional[str] = None, date_to: Optional[str] = None,
+                   topic: Optional[str] = None):
+    """Streams a whole term of attendance or quiz results without loading it into memory."""
+    if format not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be csv or ndjson")
+    model, stmt = _history_select(dataset, student_id, grade, date_from, date_to, topic)
+    stmt = stmt.order_by(model.id).execution_options(yield_per=EXPORT_BATCH)
+
+    def rows():
+        # Own session: the request-scoped one may be closed before the body finishes streaming
+        db = SessionLocal()
+        try:
+            result = db.execute(stmt)
+            columns = list(result.keys())
+            if format == "csv":
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(columns)
+                for batch in result.partitions():
+                    writer.writerows(batch)
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+                yield buffer.getvalue()
+            else:
+                for batch in result.partitions():
+                    yield "".join(json.dumps(dict(zip(columns, row))) + "\n" for row in batch)
+        finally:
+            db.close()
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    filename = f"{dataset}-{datetime.now().strftime('%Y%m%d')}.{format}"
+    return StreamingResponse(rows(), media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
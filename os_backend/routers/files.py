@@ -1,9 +1,13 @@
 import os
-import mimetypes
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse
+import stat
+from urllib.parse import quote
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
+from file_index import FileIndex, FileEntry, SORT_KEYS, get_file_category
+from static_serving import FileStat, IMMUTABLE, REVALIDATE, file_response, file_stat
+import thumbnails
+from search_index import SearchIndex
 
 router = APIRouter()
 
@@ -13,66 +17,119 @@ MYFILES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__fil
 # Ensure the directory exists
 os.makedirs(MYFILES_DIR, exist_ok=True)
 
+# Cached scandir index of MYFILES_DIR, kept fresh in the background (see file_index.py)
+index = FileIndex(MYFILES_DIR)
+# Full-text index of the PDFs and text files, updated as the directory index sees changes
+text_index = SearchIndex(MYFILES_DIR)
+# New and changed media get their grid thumbnail rendered ahead of time. Not what the initial
+# scan finds: that would render the whole library at every startup (those render on first view)
+index.add_listener(lambda change, entry: index.scanned and thumbnails.on_index_change(change, entry, MYFILES_DIR))
+index.add_listener(text_index.on_index_change)
+text_index.start()
+index.start()
+
+MAX_PAGE_SIZE = 1000
+
 class FileInfo(BaseModel):
     name: str
     size: int
-    type: str # 'image', 'video', 'pdf', 'document', 'unknown'
+    type: str # 'folder', 'image', 'video', 'pdf', 'document', 'unknown'
     url: str
+    path: str # Relative to MyFiles, '/'-separated
+    modified: float
+    thumbnail: Optional[str] = None
 
-def get_file_category(mime_type: str, ext: str) -> str:
-    if mime_type:
-        if mime_type.startswith('image/'):
-            return 'image'
-        if mime_type.startswith('video/'):
-            return 'video'
-        if mime_type == 'application/pdf':
-            return 'pdf'
-            
-    # Fallback to extensions for documents and text
-    doc_exts = ['.doc', '.docx', '.txt', '.md', '.csv', '.xlsx', '.xls', '.ppt', '.pptx']
-    if ext.lower() in doc_exts:
-        return 'document'
-        
-    return 'unknown'
+def _file_info(entry: FileEntry) -> FileInfo:
+    return FileInfo(
+        name=entry.name,
+        size=entry.size,
+        type=entry.type,
+        url=f"/api/files/view/{quote(entry.path)}" if not entry.is_dir else f"/api/files/list?path={quote(entry.path)}",
+        path=entry.path,
+        modified=entry.mtime,
+        # `v` changes whenever the file does, so the browser may keep each thumbnail URL forever
+        thumbnail=(f"/api/files/thumbnail/{quote(entry.path)}?v={entry.size:x}-{int(entry.mtime * 1000):x}"
+                   if entry.type in thumbnails.RENDERERS else None),
+    )
 
 @router.get("/list", response_model=List[FileInfo])
-def list_files():
-    """Lists all files available in the MyFiles directory."""
-    files_list = []
-    
+def list_files(response: Response, path: str = "", recursive: bool = False, include_dirs: bool = False,
+               file_type: Optional[str] = Query(None, alias="type"), sort: str = "name", order: str = "asc",
+               offset: int = 0, limit: Optional[int] = None):
+    """
+    Lists files in the MyFiles directory (or a subfolder of it) from the cached index.
+    Without `limit` every match is returned; the total is always in the X-Total-Count header.
+    """
+    if sort not in SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(SORT_KEYS)}")
+    if index.resolve(path) is None:
+        raise HTTPException(status_code=403, detail="Access denied")
+    if limit is not None:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    try:
+        total, entries = index.list(path, recursive=recursive, include_dirs=include_dirs, file_type=file_type,
+                                    sort=sort, descending=order == "desc", offset=max(0, offset), limit=limit)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Folder not found")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    response.headers["X-Total-Count"] = str(total)
+    return [_file_info(entry) for entry in entries]
+
+@router.get("/search")
+def search_files(q: str, limit: int = 20, offset: int = 0):
+    """Ranked full-text hits (one per matching page) across PDFs, TXT and MD files in MyFiles."""
     try:
-        for filename in os.listdir(MYFILES_DIR):
-            filepath = os.path.join(MYFILES_DIR, filename)
-            
-            # Skip directories, only list files
-            if os.path.isfile(filepath):
-                size = os.path.getsize(filepath)
-                mime_type, _ = mimetypes.guess_type(filepath)
-                _, ext = os.path.splitext(filename)
-                
-                category = get_file_category(mime_type, ext)
-                
-                files_list.append(FileInfo(
-                    name=filename,
-                    size=size,
-                    type=category,
-                    url=f"/api/files/view/{filename}"
-                ))
+        hits, has_more = text_index.search(q, limit=limit, offset=max(0, offset))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-        
-    return files_list
-
-@router.get("/view/{filename}")
-def view_file(filename: str):
-    """Serves the actual file content for streaming or viewing."""
-    filepath = os.path.join(MYFILES_DIR, filename)
-    
+    for hit in hits:
+        hit["url"] = f"/api/files/view/{quote(hit['path'])}"
+        if hit["path"].lower().endswith(".pdf"):
+            hit["url"] += f"#page={hit['page']}"  # Opens the browser's PDF viewer on the hit
+    return {"query": q, "hits": hits, "next_offset": offset + len(hits) if has_more else None}
+
+@router.api_route("/view/{filepath:path}", methods=["GET", "HEAD"])
+def view_file(filepath: str, request: Request):
+    """Serves the actual file content for streaming or viewing (byte ranges for video seeking, 304s)."""
     # Security: Prevent path traversal attacks
-    if not os.path.abspath(filepath).startswith(os.path.abspath(MYFILES_DIR)):
+    full_path = index.resolve(filepath)
+    if full_path is None:
         raise HTTPException(status_code=403, detail="Access denied")
-        
-    if not os.path.exists(filepath):
+
+    try:
+        st = os.stat(full_path)
+    except OSError:
+        st = None
+    if st is None or not stat.S_ISREG(st.st_mode):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    return file_response(request, file_stat(full_path, st))
+
+@router.api_route("/thumbnail/{filepath:path}", methods=["GET", "HEAD"])
+def get_thumbnail(filepath: str, request: Request, size: int = thumbnails.DEFAULT_SIZE, v: Optional[str] = None):
+    """JPEG preview of an image, PDF (first page) or video (poster frame), rendered once and cached."""
+    if size not in thumbnails.SIZES:
+        raise HTTPException(status_code=400, detail=f"size must be one of {thumbnails.SIZES}")
+    full_path = index.resolve(filepath)
+    if full_path is None:
+        raise HTTPException(status_code=403, detail="Access denied")
+    entry = index.get(filepath)
+    if entry is None or entry.is_dir:
         raise HTTPException(status_code=404, detail="File not found")
-        
-    return FileResponse(filepath)
+
+    try:
+        thumb_path = thumbnails.get_thumbnail(full_path, entry.type, size)
+    except thumbnails.ThumbnailError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except Exception as e:
+        print(f"[Thumbnails] Failed for {filepath}: {e}")
+        raise HTTPException(status_code=500, detail="Could not render preview")
+
+    # Thumbnails are named by content hash + size: that name is a validator that never goes stale
+    st = os.stat(thumb_path)
+    etag = f'"{os.path.splitext(os.path.basename(thumb_path))[0]}"'
+    return file_response(request, FileStat(thumb_path, st.st_size, st.st_mtime, etag), media_type="image/jpeg",
+                         cache_control=IMMUTABLE if v else REVALIDATE)
@@ -1,108 +1,591 @@
 import serial
+import serial.tools.list_ports
+import os
+import re
+import glob
 import time
 import threading
-import queue
-from fastapi import APIRouter, HTTPException
+import itertools
+import json
+from collections import OrderedDict, deque
+import asyncio
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
 from pydantic import BaseModel
 import logging
 
 router = APIRouter()
 
 # --- Hardware Configuration ---
-# You may need to change 'COM8' to whatever your Arduino Mega is registering as on your Windows/Pi
-ARDUINO_PORT = 'COM8'  # On Linux/Pi, this is usually '/dev/ttyACM0' or '/dev/ttyUSB0'
+# Leave ARDUINO_PORT unset to auto-detect the Arduino Mega (e.g. /dev/ttyACM0 on the Pi, COM8 on Windows).
+# Set it in .env to pin a specific port.
+ARDUINO_PORT = os.getenv("ARDUINO_PORT")
 BAUD_RATE = 9600
+ARDUINO_USB_VIDS = {0x2341, 0x2A03, 0x1A86, 0x0403}  # Arduino, Arduino.org, CH340 clones, FTDI
+LINUX_PORT_GLOBS = ["/dev/ttyACM*", "/dev/ttyUSB*"]
 
-class RobotBridge:
+# --- Connection Manager ---
+RESET_SETTLE = 2.0         # Arduino reboots when the port opens; it is deaf for about this long
+RECONNECT_MIN = 0.5        # Backoff between failed connection attempts doubles from here...
+RECONNECT_MAX = 30.0       # ...up to this ceiling
+PORT_POLL_INTERVAL = 1.0   # Hot-plug scan cadence (new device nodes cut the backoff short)
+
+# --- Serial Protocol ---
+# Framed mode sends "#<seq> <cmd>\n" and expects the firmware to answer "#<seq> <reply>",
+# so acks are matched exactly. Legacy firmware (plain "cmd\n") answers "OK <cmd>" / "ERR ...":
+# only lines like that count as acks, matched to the oldest in-flight command they name (or
+# else the oldest one). Anything else (debug prints, a boot banner) is just logged.
+FRAMED_PROTOCOL = os.getenv("MONK_ROBOT_FRAMED", "0") == "1"
+# How many commands may be on the wire awaiting an ack. 1 keeps the old one-move-at-a-time pacing.
+ACK_WINDOW = int(os.getenv("MONK_ROBOT_WINDOW", "4" if FRAMED_PROTOCOL else "1"))
+ACK_TIMEOUT = 2.0  # Seconds before an unacknowledged command gives its window slot back
+READ_TIMEOUT = 0.1  # Reader thread wake-up cadence (also how often overdue acks are swept)
+FRAME_RE = re.compile(r"^#(\d+)\s?(.*)$")
+STOP_COMMANDS = ("s", "dance stop")
+LEGACY_ACK_RE = re.compile(os.getenv("MONK_ROBOT_ACK_PATTERN", r"^(OK|ERR)\b\s*(.*)$"), re.IGNORECASE)
+
+VALID_COMMANDS = ["dance start", "dance stop", "s", "bf", "bb", "bl", "br", "hf", "hb", "xf", "xb"]
+
+# --- Motion Scheduling ---
+# Commands are coalesced per actuator group: holding "bf" for two seconds should mean
+# "keep driving forward", not forty queued steps that keep running after the button is released.
+ACTUATOR_GROUPS = {
+    "bf": "base", "bb": "base", "bl": "base", "br": "base",
+    "hf": "hands", "hb": "hands",
+    "xf": "head", "xb": "head",
+    "dance start": "show",
+}
+# Minimum spacing between two commands to the same group, roughly one servo/motor step
+GROUP_MIN_INTERVAL = {"base": 0.15, "hands": 0.3, "head": 0.3, "show": 1.0}
+MAX_COMMANDS_PER_SEC = 10  # What the 9600-baud link + Arduino loop comfortably executes
+
+class MotionScheduler:
+    """
+    Holds only the latest pending intent per actuator group and releases commands no
+    faster than the Arduino can execute them. Groups are served in arrival order.
+    """
     def __init__(self):
+        self.cond = threading.Condition()
+        self.pending: "OrderedDict[str, str]" = OrderedDict()  # group -> latest command
+        self.last_sent = {}   # group -> perf_counter of its last dispatch
+        self.next_slot = 0.0  # Earliest time the global rate limit allows another command
+        self.epoch = 0        # Bumped by flush(); lets the bridge void moves already handed out
+        self.stats = {"enqueued": 0, "coalesced": 0, "dropped": 0, "flushed": 0, "sent": 0}
+
+    def submit(self, cmd: str) -> str:
+        group = ACTUATOR_GROUPS.get(cmd, cmd)
+        with self.cond:
+            self.stats["enqueued"] += 1
+            coalesced = group in self.pending
+            if coalesced:
+                self.stats["coalesced"] += 1
+            # Re-assigning keeps the group's place in line, only the intent is replaced
+            self.pending[group] = cmd
+            self.cond.notify()
+        return "coalesced" if coalesced else "queued"
+
+    def flush(self) -> int:
+        with self.cond:
+            flushed = len(self.pending)
+            self.pending.clear()
+            self.stats["flushed"] += flushed
+            self.epoch += 1
+            return flushed
+
+    def record_drop(self):
+        with self.cond:
+            self.stats["dropped"] += 1
+
+    def next_command(self):
+        """Blocks until some group's command is allowed out; returns (cmd, epoch)."""
+        with self.cond:
+            while True:
+                now = time.perf_counter()
+                wake_at = None
+                for group, cmd in self.pending.items():
+                    ready_at = max(self.last_sent.get(group, 0.0) + GROUP_MIN_INTERVAL.get(group, 0.0), self.next_slot)
+                    if ready_at <= now:
+                        del self.pending[group]
+                        self.last_sent[group] = now
+                        self.next_slot = now + 1.0 / MAX_COMMANDS_PER_SEC
+                        self.stats["sent"] += 1
+                        return cmd, self.epoch
+                    wake_at = ready_at if wake_at is None else min(wake_at, ready_at)
+                self.cond.wait(timeout=None if wake_at is None else wake_at - now)
+
+    def snapshot(self) -> dict:
+        with self.cond:
+            return {"depth": len(self.pending), "pending": dict(self.pending), **self.stats}
+
+class _InFlight:
+    """A command written to the Arduino that is still waiting for its ack."""
+    __slots__ = ("seq", "cmd", "sent_at", "holds_slot")
+
+    def __init__(self, seq: int, cmd: str, holds_slot: bool):
+        self.seq = seq
+        self.cmd = cmd
+        self.sent_at = time.perf_counter()
+        self.holds_slot = holds_slot
+
+class RobotUnavailable(Exception):
+    """Raised when a command is sent while no Arduino is connected."""
+
+class RobotBridge:
+    def __init__(self, port: str = None):
+        self.port_setting = port or ARDUINO_PORT  # None -> auto-detect
+        self.port = None  # Port of the live connection
         self.serial_conn = None
-        self.lock = threading.Lock()
+        self.lock = threading.Lock()  # Serialises writes to the port
         self.connected = False
-        self.command_queue = queue.Queue(maxsize=50) # Prevent memory explosion if spammed
+        self.scheduler = MotionScheduler() # At most one pending command per actuator group
+
+        # Ack tracking: commands on the wire, keyed by sequence number (insertion order = send order)
+        self.window = threading.Semaphore(ACK_WINDOW)
+        self.inflight: "OrderedDict[int, _InFlight]" = OrderedDict()
+        self.inflight_lock = threading.Lock()
+        self.seq = itertools.count(1)
+        self.latencies = deque(maxlen=200)  # Round-trip times (s) of the most recent acks
+        self.timeouts = 0
+        self.listeners = []  # Callables fed live bridge events (WebSocket teleop clients)
         
-        self.connect()
+        # Connecting (and the Arduino's 2 s reset) happens in the background, never at import time
+        self.manager_thread = threading.Thread(target=self._manage_connection, daemon=True)
+        self.manager_thread.start()
         
         # Start the persistent background worker thread that drains the queue safely
         self.worker_thread = threading.Thread(target=self._process_queue, daemon=True)
         self.worker_thread.start()
 
-    def connect(self):
+        # Dedicated reader: matches Arduino replies to in-flight commands as they arrive
+        self.reader_thread = threading.Thread(target=self._read_replies, daemon=True)
+        self.reader_thread.start()
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self.listeners:
+            self.listeners.remove(callback)
+
+    def _emit(self, event: dict):
+        # Runs on the bridge threads: listeners must hand off quickly and never raise into us
+        for callback in list(self.listeners):
+            try:
+                callback(event)
+            except Exception as e:
+                logging.error(f"[Hardware Bridge] Listener failed: {e}")
+
+    def _set_connected(self, connected: bool):
+        changed = connected != self.connected
+        self.connected = connected
+        if changed:
+            self._emit({"type": "connection", "connected": connected, "port": self.port})
+
+    def detect_ports(self) -> list:
+        """Candidate ports, most likely first: the pinned port, Linux CDC/USB-serial nodes, then known USB VIDs."""
+        if self.port_setting:
+            return [self.port_setting]
+        ports = []
+        for pattern in LINUX_PORT_GLOBS:
+            ports.extend(sorted(glob.glob(pattern)))
         try:
-            self.serial_conn = serial.Serial(ARDUINO_PORT, BAUD_RATE, timeout=1)
-            time.sleep(2)  # Wait for Arduino to reset upon serial connection
-            self.connected = True
-            logging.info(f"[Hardware Bridge] Successfully connected to Arduino on {ARDUINO_PORT}")
+            for info in serial.tools.list_ports.comports():
+                if info.device not in ports and (info.vid in ARDUINO_USB_VIDS or "arduino" in (info.description or "").lower()):
+                    ports.append(info.device)
         except Exception as e:
-            self.connected = False
-            logging.error(f"[Hardware Bridge] Failed to connect to Arduino: {e}")
+            logging.debug(f"[Hardware Bridge] Port enumeration failed: {e}")
+        return ports
 
-    def enqueue_command(self, cmd: str):
-        """Public method to push a command into the safe execution queue."""
+    def connect(self, port: str) -> bool:
+        try:
+            conn = serial.Serial(port, BAUD_RATE, timeout=READ_TIMEOUT)
+            time.sleep(RESET_SETTLE)  # Wait for Arduino to reset upon serial connection (manager thread only)
+            conn.reset_input_buffer()  # Discard the boot banner
+            self.serial_conn = conn
+            self.port = port
+            self._set_connected(True)
+            logging.info(f"[Hardware Bridge] Successfully connected to Arduino on {port}")
+            return True
+        except Exception as e:
+            logging.error(f"[Hardware Bridge] Failed to connect to Arduino on {port}: {e}")
+            return False
+
+    def _drop_connection(self, reason: str):
+        if not self.connected:
+            return
+        logging.error(f"[Hardware Bridge] Connection to {self.port} lost: {reason}")
+        self._set_connected(False)
+        # Moves queued for a robot that vanished are stale by the time it comes back
+        self.scheduler.flush()
+        self._fail_inflight()
+        try:
+            self.serial_conn.close()
+        except Exception:
+            pass
+
+    def _manage_connection(self):
+        """Background daemon thread: finds the Arduino, reconnects with exponential backoff, notices unplugs."""
+        backoff = RECONNECT_MIN
+        known_ports = set()
+        while True:
+            # The reader only sweeps while connected; overdue acks must free their slots regardless
+            self._expire_overdue()
+            if self.connected:
+                # A vanished device node is noticed here before any write has to fail
+                if self.port and self.port.startswith("/dev/") and not os.path.exists(self.port):
+                    self._drop_connection("device unplugged")
+                time.sleep(PORT_POLL_INTERVAL)
+                continue
+
+            ports = self.detect_ports()
+            known_ports = set(ports)
+            if any(self.connect(port) for port in ports):
+                backoff = RECONNECT_MIN
+                continue
+
+            # Back off, but wake early if a new port shows up (cable plugged in)
+            plugged_in = False
+            deadline = time.monotonic() + backoff
+            while time.monotonic() < deadline and not plugged_in:
+                time.sleep(min(PORT_POLL_INTERVAL, backoff))
+                self._expire_overdue()
+                plugged_in = bool(set(self.detect_ports()) - known_ports)
+            backoff = RECONNECT_MIN if plugged_in else min(backoff * 2, RECONNECT_MAX)
+
+    def enqueue_command(self, cmd: str) -> str:
+        """Public method to push a command into the safe execution queue. Returns what happened to it."""
         cmd = cmd.strip().lower()
         
         # EMERGENCY STOP PROTOCOL
         if cmd == "s" or cmd == "dance stop":
-            with self.lock:
-                # Flush the entire queue instantly so we don't finish pending moves
-                self.command_queue.queue.clear()
+            # Flush every pending move instantly so we don't finish them after the stop
+            flushed = self.scheduler.flush()
+            # Running choreography listens for this and aborts its timeline
+            self._emit({"type": "emergency_stop", "command": cmd})
+            if not self.connected:
+                raise RobotUnavailable("Arduino is disconnected.")
             # Push stop to the very front so it executes immediately next
-            logging.warning("[Hardware Bridge] EMERGENCY FLUSH! Stop command jump to front of queue.")
-            self._send_command_immediate(cmd)
-            return
+            logging.warning(f"[Hardware Bridge] EMERGENCY FLUSH! Dropped {flushed} pending move(s). Stop command jump to front of queue.")
+            # Stop never waits for a window slot: it must reach the Arduino even if acks are overdue
+            self._send_command_immediate(cmd, wait_for_slot=False)
+            return "stopped"
 
-        try:
-            self.command_queue.put_nowait(cmd)
-        except queue.Full:
-            logging.error("[Hardware Bridge] WARNING: Hardware Command Queue is FULL. Dropping command.")
+        # Fail fast: don't queue moves for a robot that isn't there
+        if not self.connected:
+            self.scheduler.record_drop()
+            raise RobotUnavailable("Arduino is disconnected.")
+        return self.scheduler.submit(cmd)
+
+    def send_now(self, cmd: str):
+        """Bypasses scheduling and the ack window; for pre-timed choreography steps."""
+        if not self.connected:
+            raise RobotUnavailable("Arduino is disconnected.")
+        self._send_command_immediate(cmd, wait_for_slot=False)
 
     def _process_queue(self):
-        """Background daemon thread that pops commands one by one to prevent buffer overruns."""
+        """Background daemon thread that releases scheduled commands one by one to prevent buffer overruns."""
         while True:
-            cmd = self.command_queue.get() # Blocks until a command is available
+            cmd, epoch = self.scheduler.next_command() # Blocks until a command is due
             try:
-                self._send_command_immediate(cmd)
+                self._send_command_immediate(cmd, epoch=epoch)
             except Exception as e:
+                self.scheduler.record_drop()
                 logging.error(f"[Hardware Bridge] Queue execution failed: {e}")
-            finally:
-                self.command_queue.task_done()
                 
-    def _send_command_immediate(self, cmd: str):
+    def _send_command_immediate(self, cmd: str, wait_for_slot: bool = True, epoch: int = None):
         if not self.connected or not self.serial_conn:
-            self.connect()
-            if not self.connected:
-                logging.error("Arduino is disconnected. Dropping command.")
+            self.scheduler.record_drop()
+            logging.error("Arduino is disconnected. Dropping command.")
+            return
+
+        # WAIT STATE: block until the Arduino has acked enough earlier moves to open a window slot.
+        # This prevents "Ghost Movement" buffer overruns without sleep-polling the port.
+        if wait_for_slot:
+            self.window.acquire()
+            if epoch is not None and epoch != self.scheduler.epoch:
+                # An emergency stop landed while we waited: this move must not run after it
+                self.window.release()
                 return
+
+        record = _InFlight(next(self.seq), cmd, holds_slot=wait_for_slot)
+        with self.inflight_lock:
+            self.inflight[record.seq] = record
         
         with self.lock:
             try:
                 # The Arduino code expects commands ending in '\n'
-                command_str = f"{cmd}\n"
+                command_str = f"#{record.seq} {cmd}\n" if FRAMED_PROTOCOL else f"{cmd}\n"
                 self.serial_conn.write(command_str.encode('utf-8'))
-                
-                # WAIT STATE: Let the Arduino physically move its servos before we allow the next command 
-                # This prevents "Ghost Movement" buffer overruns.
-                timeout_start = time.time()
-                while time.time() < timeout_start + 2.0: # Max wait 2 seconds per command
-                    if self.serial_conn.in_waiting > 0:
-                        response = self.serial_conn.readline().decode('utf-8').strip()
-                        logging.info(f"[Hardware Bridge] Arduino replied: {response}")
-                        break
-                    time.sleep(0.05)
-                
             except Exception as e:
-                self.connected = False
+                self.scheduler.record_drop()
                 logging.error(f"Serial Write Failed: {e}")
+                self._drop_connection(f"write failed ({e})")
+
+    def _read_replies(self):
+        """Background daemon thread: one blocking readline at a time, acks matched the moment they land."""
+        while True:
+            conn = self.serial_conn
+            if not self.connected or conn is None:
+                time.sleep(READ_TIMEOUT)
+                continue
+            try:
+                line = conn.readline()  # Returns early on '\n', or empty after READ_TIMEOUT
+            except Exception as e:
+                self._drop_connection(f"read failed ({e})")
+                continue
+            if line:
+                self._match_reply(line.decode('utf-8', errors='replace').strip())
+            self._expire_overdue()
+
+    def _match_reply(self, response: str):
+        record = None
+        with self.inflight_lock:
+            if FRAMED_PROTOCOL:
+                frame = FRAME_RE.match(response)
+                if frame:
+                    record = self.inflight.pop(int(frame.group(1)), None)
+                    response = frame.group(2)
+            elif self.inflight:
+                ack = LEGACY_ACK_RE.match(response)
+                if ack:
+                    named = (ack.group(ack.lastindex) or "").strip().lower() if ack.lastindex else ""
+                    names = STOP_COMMANDS if named == "stopped" else (named,)  # Firmware acks a stop as "OK stopped"
+                    seq = next((r.seq for r in self.inflight.values() if r.cmd in names), None)
+                    record = self.inflight.pop(seq) if seq is not None else self.inflight.popitem(last=False)[1]
+
+        if record is None:
+            # Unsolicited output (boot banner, debug prints, late ack after a timeout)
+            logging.info(f"[Hardware Bridge] Arduino says: {response}")
+            self._emit({"type": "reply", "command": None, "reply": response})
+            return
+        latency = time.perf_counter() - record.sent_at
+        self.latencies.append(latency)
+        logging.info(f"[Hardware Bridge] Arduino replied to '{record.cmd}' in {latency * 1000:.0f} ms: {response}")
+        self._release(record)
+        self._emit({"type": "reply", "command": record.cmd, "reply": response, "latency_ms": round(latency * 1000, 1)})
+
+    def _expire_overdue(self):
+        deadline = time.perf_counter() - ACK_TIMEOUT
+        expired = []
+        with self.inflight_lock:
+            while self.inflight and next(iter(self.inflight.values())).sent_at < deadline:
+                expired.append(self.inflight.popitem(last=False)[1])
+        for record in expired:
+            self.timeouts += 1
+            logging.warning(f"[Hardware Bridge] No ack for '{record.cmd}' within {ACK_TIMEOUT}s. Moving on.")
+            self._release(record)
+            self._emit({"type": "timeout", "command": record.cmd})
+
+    def _fail_inflight(self):
+        """Connection lost: nothing on the wire will ever be acked, so free every slot."""
+        with self.inflight_lock:
+            lost = list(self.inflight.values())
+            self.inflight.clear()
+        for record in lost:
+            self._release(record)
+
+    def _release(self, record: _InFlight):
+        if record.holds_slot:
+            self.window.release()
+
+    def latency_stats(self) -> dict:
+        """Round-trip (write -> ack) latency summary for the status endpoint."""
+        samples = sorted(self.latencies)
+        stats = {
+            "samples": len(samples),
+            "in_flight": len(self.inflight),
+            "timeouts": self.timeouts,
+            "last_ms": round(self.latencies[-1] * 1000, 1) if samples else None,
+            "avg_ms": None,
+            "p95_ms": None,
+        }
+        if samples:
+            stats["avg_ms"] = round(sum(samples) / len(samples) * 1000, 1)
+            stats["p95_ms"] = round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 1)
+        return stats
+
+# --- Choreography ---
+# Motion scripts live in data/motions as JSON (or YAML if PyYAML is installed):
+#   {"title": "...", "repeat": 2, "period": 4.0, "steps": [{"at": 0.0, "command": "hf"}, ...]}
+# `at` is seconds from the start of one repeat; `period` is the length of one repeat.
+MOTIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "motions")
+SPIN_WINDOW = 0.002  # Final stretch before a step is busy-waited; OS sleep is too coarse for it
+
+def _load_motion_file(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        if path.endswith((".yaml", ".yml")):
+            import yaml  # Optional: only needed for YAML scripts
+            return yaml.safe_load(f)
+        return json.load(f)
+
+def compile_motion_script(script: dict) -> list:
+    """Flattens a motion script into a sorted timeline of (offset seconds, command)."""
+    steps = []
+    for step in script.get("steps", []):
+        command = str(step["command"]).strip().lower()
+        if command not in VALID_COMMANDS:
+            raise ValueError(f"Unknown hardware command in motion script: {command}")
+        steps.append((float(step["at"]), command))
+    steps.sort()
+    period = float(script.get("period", (steps[-1][0] if steps else 0.0)))
+    repeat = max(1, int(script.get("repeat", 1)))
+    return [(offset + i * period, command) for i in range(repeat) for offset, command in steps]
+
+class SequencePlayer:
+    """
+    Plays precompiled motion timelines from one high-resolution scheduler thread.
+    Emergency stop (any "s"/"dance stop" through the bridge) aborts playback.
+    """
+    def __init__(self, bridge: RobotBridge):
+        self.bridge = bridge
+        self.scripts = {}  # name -> {"title", "timeline", "duration"}
+        self.lock = threading.Lock()
+        self.thread = None
+        self.name = None
+        self.state = "idle"  # idle | playing | paused
+        self.position = 0
+        self.abort_event = threading.Event()
+        self.resume_event = threading.Event()
+        self.wake_event = threading.Event()  # Cuts the wait for the next step short (pause/abort)
+        self.jitter = deque(maxlen=1000)  # ms late (or early) per dispatched step, current run
+        bridge.add_listener(self._on_bridge_event)
+
+    def load_scripts(self, directory: str = MOTIONS_DIR):
+        scripts = {}
+        if os.path.isdir(directory):
+            for filename in sorted(os.listdir(directory)):
+                name, ext = os.path.splitext(filename)
+                if ext not in (".json", ".yaml", ".yml"):
+                    continue
+                try:
+                    script = _load_motion_file(os.path.join(directory, filename))
+                    timeline = compile_motion_script(script)
+                    scripts[name] = {
+                        "title": script.get("title", name),
+                        "timeline": timeline,
+                        "duration": timeline[-1][0] if timeline else 0.0,
+                    }
+                except Exception as e:
+                    logging.error(f"[Choreography] Skipping motion script {filename}: {e}")
+        self.scripts = scripts
+        logging.info(f"[Choreography] Loaded {len(scripts)} motion script(s)")
+
+    def play(self, name: str):
+        script = self.scripts[name]  # KeyError -> 404 at the endpoint
+        self.abort()
+        if self.thread:
+            self.thread.join(timeout=1.0)
+        with self.lock:
+            self.abort_event = threading.Event()
+            self.resume_event = threading.Event()
+            self.resume_event.set()
+            self.wake_event = threading.Event()
+            self.name, self.state, self.position = name, "playing", 0
+            self.jitter.clear()
+            self.thread = threading.Thread(target=self._run, args=(script["timeline"], self.abort_event, self.resume_event,
+                                                                   self.wake_event), daemon=True)
+            self.thread.start()
+
+    def pause(self):
+        with self.lock:
+            if self.state != "playing":
+                return
+            self.state = "paused"
+            self.resume_event.clear()
+            self.wake_event.set()
+        # Freeze the robot where it is without tripping the emergency-stop abort
+        try:
+            self.bridge.send_now("s")
+        except RobotUnavailable:
+            pass
+
+    def resume(self):
+        with self.lock:
+            if self.state == "paused":
+                self.state = "playing"
+                self.resume_event.set()
+
+    def abort(self):
+        self.abort_event.set()
+        self.resume_event.set()  # Wake a paused timeline so it can exit
+        self.wake_event.set()
+
+    def _on_bridge_event(self, event: dict):
+        if event["type"] == "emergency_stop" and self.state != "idle":
+            logging.warning("[Choreography] Emergency stop: aborting sequence.")
+            self.abort()
+
+    def _run(self, timeline: list, abort_event: threading.Event, resume_event: threading.Event,
+             wake_event: threading.Event):
+        start = time.perf_counter()
+        for index, (offset, command) in enumerate(timeline):
+            target = start + offset
+            while True:
+                remaining = target - time.perf_counter()
+                if remaining > SPIN_WINDOW:
+                    # Returns early on pause or abort, so a long gap between steps can't delay either
+                    wake_event.wait(remaining - SPIN_WINDOW)
+                    wake_event.clear()
+                if abort_event.is_set():
+                    break
+                if not resume_event.is_set():
+                    # Paused: shift the rest of the timeline by however long we were held
+                    paused_at = time.perf_counter()
+                    resume_event.wait()
+                    start += time.perf_counter() - paused_at
+                    target = start + offset
+                    continue
+                if target - time.perf_counter() <= SPIN_WINDOW:
+                    break
+            if abort_event.is_set():
+                break
+            while time.perf_counter() < target:
+                pass
+            try:
+                self.bridge.send_now(command)
+            except RobotUnavailable:
+                logging.error("[Choreography] Arduino disconnected: aborting sequence.")
+                break
+            self.jitter.append((time.perf_counter() - target) * 1000)
+            self.position = index + 1
+        with self.lock:
+            if self.abort_event is abort_event:
+                self.state = "idle"
+
+    def status(self) -> dict:
+        samples = sorted(self.jitter)
+        jitter = {"samples": len(samples), "mean_ms": None, "p95_ms": None, "max_ms": None}
+        if samples:
+            jitter["mean_ms"] = round(sum(samples) / len(samples), 3)
+            jitter["p95_ms"] = round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 3)
+            jitter["max_ms"] = round(samples[-1], 3)
+        total = len(self.scripts[self.name]["timeline"]) if self.name in self.scripts else 0
+        return {"state": self.state, "sequence": self.name, "position": self.position, "steps": total, "jitter": jitter}
 
 # Global persistent instance
 robot = RobotBridge()
+choreographer = SequencePlayer(robot)
+choreographer.load_scripts()
+
+STATUS_PUSH_INTERVAL = 0.5  # WebSocket clients get a fresh status at most this often, only on change
 
 class CommandPayload(BaseModel):
     command: str
 
+def _status_snapshot() -> dict:
+    return {
+        "connected": robot.connected,
+        "port": robot.port,
+        "port_setting": robot.port_setting or "auto",
+        "protocol": "framed" if FRAMED_PROTOCOL else "legacy",
+        "ack_window": ACK_WINDOW,
+        "latency": robot.latency_stats(),
+        "queue": robot.scheduler.snapshot(),
+    }
+
 @router.get("/status")
 def get_status():
     """Checks if the internal PySerial connection is active."""
-    return {"connected": robot.connected, "port": ARDUINO_PORT}
+    return _status_snapshot()
 
 @router.post("/execute")
 def execute_hardware_command(payload: CommandPayload):
@@ -114,14 +597,107 @@ def execute_hardware_command(payload: CommandPayload):
     - "hf", "hb" (Hands: Forward, Backward)
     - "xf", "xb" (Head: Forward, Backward)
     """
-    valid_commands = ["dance start", "dance stop", "s", "bf", "bb", "bl", "br", "hf", "hb", "xf", "xb"]
-    
-    if payload.command.lower() not in valid_commands:
+    if payload.command.lower() not in VALID_COMMANDS:
         raise HTTPException(status_code=400, detail="Unknown hardware command")
 
     try:
         # Instead of slamming the hardware instantly, we push to the safe queue
-        robot.enqueue_command(payload.command)
-        return {"status": "success (queued)", "command_queued": payload.command}
+        outcome = robot.enqueue_command(payload.command)
+        return {"status": f"success ({outcome})", "command_queued": payload.command}
     except Exception as e:
         raise HTTPException(status_code=503, detail=str(e))
+
+@router.websocket("/ws")
+async def teleop_socket(websocket: WebSocket):
+    """
+    Persistent teleop channel: one socket replaces a POST per move plus /status polling.
+    Client sends {"command": "bf", "id": 7}; server answers with an `ack` per command and
+    pushes `status` (on change), `reply`, `timeout` and `connection` events as they happen.
+    """
+    await websocket.accept()
+    loop = asyncio.get_event_loop()
+    outbox = asyncio.Queue(maxsize=256)
+
+    def offer(event: dict):
+        # Slow client: drop bridge chatter rather than buffer without bound
+        if not outbox.full():
+            outbox.put_nowait(event)
+
+    def on_bridge_event(event: dict):
+        loop.call_soon_threadsafe(offer, event)
+
+    async def pump():
+        last_status = None
+        while True:
+            try:
+                event = await asyncio.wait_for(outbox.get(), timeout=STATUS_PUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                event = None
+            status = _status_snapshot()
+            if status != last_status:
+                await websocket.send_json({"type": "status", **status})
+                last_status = status
+            if event is not None:
+                await websocket.send_json(event)
+
+    robot.add_listener(on_bridge_event)
+    sender = asyncio.create_task(pump())
+    try:
+        while True:
+            message = await websocket.receive_json()
+            command = str(message.get("command", "")).strip().lower()
+            ack = {"type": "ack", "id": message.get("id"), "command": command}
+            if command not in VALID_COMMANDS:
+                offer({**ack, "status": "rejected", "detail": "Unknown hardware command"})
+                continue
+            try:
+                # Off the loop: a stop writes straight to the port
+                offer({**ack, "status": await loop.run_in_executor(None, robot.enqueue_command, command)})
+            except Exception as e:
+                offer({**ack, "status": "error", "detail": str(e)})
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        print(f"[Hardware WS] {e}")
+    finally:
+        robot.remove_listener(on_bridge_event)
+        sender.cancel()
+
+@router.get("/sequences")
+def list_sequences():
+    return {
+        name: {"title": s["title"], "steps": len(s["timeline"]), "duration": round(s["duration"], 3)}
+        for name, s in choreographer.scripts.items()
+    }
+
+@router.get("/sequences/status")
+def sequence_status():
+    return choreographer.status()
+
+@router.post("/sequences/{name}/play")
+def play_sequence(name: str):
+    if name not in choreographer.scripts:
+        raise HTTPException(status_code=404, detail="Unknown motion sequence")
+    if not robot.connected:
+        raise HTTPException(status_code=503, detail="Arduino is disconnected.")
+    choreographer.play(name)
+    return choreographer.status()
+
+@router.post("/sequences/pause")
+def pause_sequence():
+    choreographer.pause()
+    return choreographer.status()
+
+@router.post("/sequences/resume")
+def resume_sequence():
+    choreographer.resume()
+    return choreographer.status()
+
+@router.post("/sequences/abort")
+def abort_sequence():
+    # Same path as the big red button: flush, stop, and the player aborts on the stop event
+    try:
+        robot.enqueue_command("s")
+    except RobotUnavailable:
+        choreographer.abort()
+    return choreographer.status()
@@ -1,21 +1,29 @@
 import os
-import io
-import base64
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, HTTPException, Request
 from groq import AsyncGroq
-from PIL import Image as PILImage
 from functools import wraps
 import logging
+from image_prep import prepare_image_async
+import uploads
+import speech
 
 router = APIRouter()
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
+# Every graded answer opens with one of these and every quiz is read out with QUIZ_PROMPT, so
+# their audio is kept ready in the phrase cache; responses carry a `speech_url` the app plays
+GREETINGS = ("Great job!", "Let's look at this together!")
+QUIZ_PROMPT = "Please write down the answer to: {question}, and hold it up to the camera!"
+speech.phrases.register(*GREETINGS, QUIZ_PROMPT)
+
 # --- Error Controller Wrapper (Agent 6 Pattern) ---
 def agent_6_error_controller(func):
     @wraps(func)
     async def wrapper(*args, **kwargs):
         try:
             return await func(*args, **kwargs)
+        except HTTPException:
+            raise  # Already a deliberate client error (e.g. 413 upload too large)
         except Exception as e:
             logging.error(f"[Math Wizard] Error caught in {func.__name__}: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Math Wizard Error: {str(e)}")
@@ -50,39 +58,25 @@ async def generate_math_quiz():
         question = question[1:-1]
         
     print(f"[Math Wizard] Generated: {question}")
-    return {"question": question}
+    prompt = QUIZ_PROMPT.format(question=question)
+    return {"question": question, "prompt": prompt, "speech_url": speech.say_url(prompt)}
 
 
-@router.post("/evaluate")
+@router.post("/evaluate", openapi_extra=uploads.openapi_form("file", "expected_question"))
 @agent_6_error_controller
-async def evaluate_math_problem(
-    file: UploadFile = File(...),
-    expected_question: str = Form(None)
-):
+async def evaluate_math_problem(request: Request):
     """
     Receives an image of a handwritten math problem or answer.
     Uses LLaMA Vision (Groq) to read, solve, and grade it.
     If expected_question is provided, it acts in "Quiz Mode" to verify the answer against that question.
     """
-    print(f"[Math Wizard] Received image: {file.filename}")
-    content = await file.read()
-
-    # Determine MIME type
-    ext = file.filename.split('.')[-1].lower()
-    mime = "image/jpeg"
-    if ext == "png": mime = "image/png"
-    elif ext == "webp": mime = "image/webp"
-
-    # Optimize Image
-    img = PILImage.open(io.BytesIO(content))
-    img.thumbnail((800, 800))
-    buffer = io.BytesIO()
-    img.save(buffer, format="JPEG", quality=80)
-    optimized_content = buffer.getvalue()
-    
-    # Encode Base64
-    b64 = base64.b64encode(optimized_content).decode()
-    image_url = f"data:{mime};base64,{b64}"
+    # Optimize Image (off the event loop; always re-encoded as JPEG, so the mime is too).
+    # Only the small re-encoded JPEG outlives the spooled upload.
+    async with uploads.receive(request, "/api/math-wizard/evaluate") as upload:
+        print(f"[Math Wizard] Received image: {upload.filename}")
+        expected_question = upload.fields.get("expected_question") or None
+        prepared = await prepare_image_async(upload.path, "math_wizard", upload.sha256)
+    image_url = prepared.data_url
 
     print(f"[Math Wizard] Calling LLaMA Vision. Mode: {'Quiz' if expected_question else 'Free Scan'}")
     client = AsyncGroq(api_key=GROQ_API_KEY)
@@ -124,4 +118,4 @@ async def evaluate_math_problem(
     feedback = response.choices[0].message.content
     print(f"[Math Wizard] Grading complete: {feedback}")
     
-    return {"feedback": feedback}
+    return {"feedback": feedback, "speech_url": speech.say_url(feedback)}
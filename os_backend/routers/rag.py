@@ -18,13 +18,21 @@ Stack:
   * LangGraph            - multi-step reasoning (classify->retrieve->synthesise)
 """
 
-import io, os, uuid, math, base64, time
-from typing import List, TypedDict
+import os, json, uuid, math, time, asyncio, mimetypes, threading
+from collections import OrderedDict
+from typing import Iterator, List, TypedDict
 
 # -- FastAPI ------------------------------------------------------------
-from fastapi import APIRouter, File, HTTPException, UploadFile
+from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
-from PIL import Image as PILImage
+
+# -- Shared image preprocessing + upload spooling -------------------------
+from image_prep import prepare_image
+import uploads
+
+# -- MyFiles (directory index + full-text index as extraction cache) -----
+from routers import files as myfiles
+from search_index import INDEXED_EXTS
 
 # -- PDF ----------------------------------------------------------------
 import fitz   # PyMuPDF
@@ -187,6 +195,67 @@ def _answer(system: str, question: str) -> tuple[str, str, float]:
     text, t = _groq_chat(system, question)
     return text, f"Groq/{GROQ_MODEL}", t
 
+def _ollama_stream(system: str, question: str) -> Iterator[str]:
+    if len(system) > MAX_CTX_CHARS:
+        system = system[:MAX_CTX_CHARS] + "\n...[context trimmed for model safety]..."
+    # Same 3 s budget as _ollama_chat to connect and start answering; then allow a long answer
+    with _req.post(f"{OLLAMA}/api/generate", json={
+        "model": MODEL, "prompt": question,
+        "system": system, "stream": True,
+        "options": {"temperature": 0.2, "num_ctx": 4096}
+    }, stream=True, timeout=(3, 30)) as r:
+        r.raise_for_status()
+        for line in r.iter_lines():
+            if not line:
+                continue
+            chunk = json.loads(line)
+            if chunk.get("response"):
+                yield chunk["response"]
+            if chunk.get("done"):
+                return
+
+def _groq_stream(system: str, question: str) -> Iterator[str]:
+    if not GROQ_KEY:
+        raise RuntimeError("GROQ_API_KEY not set")
+    if len(system) > MAX_CTX_CHARS:
+        system = system[:MAX_CTX_CHARS] + "\n...[context trimmed]..."
+    client = groq.Groq(api_key=GROQ_KEY)
+    stream = client.chat.completions.create(
+        messages=[
+            {"role": "system", "content": system},
+            {"role": "user", "content": question},
+        ],
+        model=GROQ_MODEL,
+        temperature=0.2,
+        max_tokens=1024,
+        stream=True,
+    )
+    for chunk in stream:
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if delta:
+            yield delta
+
+def _answer_stream(system: str, question: str) -> Iterator[tuple[str, str]]:
+    # Same 2-tier chain as _answer, yielding (model, text piece) as tokens arrive.
+    # Falls through to Groq only if Ollama fails before producing anything.
+    t0 = time.perf_counter()
+    for name, stream in ((f"Ollama/{MODEL}", _ollama_stream), (f"Groq/{GROQ_MODEL}", _groq_stream)):
+        produced = 0
+        try:
+            for piece in stream(system, question):
+                if not produced:
+                    _log("STREAM", f"{name} first token {time.perf_counter() - t0:.2f}s")
+                produced += len(piece)
+                yield name, piece
+        except Exception as e:
+            if produced or name.startswith("Groq"):
+                _log("STREAM", f"FAIL {name}: {e}")
+                raise RuntimeError(f"{name}: {e}")
+            _log("STREAM", f"{name} failed ({e}), trying Groq...")
+            continue
+        _log("STREAM", f"OK {name} {time.perf_counter() - t0:.2f}s - {produced} chars")
+        return
+
 # ----------------------------------------------------------------------
 # Local TF-IDF + BM25 vector store
 # ----------------------------------------------------------------------
@@ -220,76 +289,85 @@ class LocalVectorStore:
 # Document extraction
 # ----------------------------------------------------------------------
 
-def _extract_pdf(data: bytes) -> List[Document]:
+def _page_fallback_text(page, n: int) -> str:
+    """Text for an image-heavy page (< 20 chars): pytesseract OCR, then layout blocks."""
+    text = ""
+    # Try pytesseract first (fully local OCR)
+    try:
+        import pytesseract
+        from PIL import Image as PILImage
+        pix    = page.get_pixmap(dpi=150)
+        img    = PILImage.frombytes("RGB", [pix.width, pix.height], pix.samples)
+        text   = pytesseract.image_to_string(img).strip()
+        if text:
+            _log("PDF", f"Page {n}: OCR extracted {len(text)} chars")
+    except Exception as ocr_err:
+        _log("PDF", f"Page {n}: OCR unavailable ({ocr_err.__class__.__name__}), using layout blocks")
+        text = ""
+
+    if len(text) < 10:
+        # Layout block fallback - grab any text fragments from the page structure
+        blocks = page.get_text("blocks")
+        text   = " ".join(
+            str(b[4]).strip() for b in blocks
+            if len(b) > 4 and str(b[4]).strip()
+        ).strip()
+    return text
+
+def _page_doc(n: int, text: str, source: str = "pdf") -> Document:
+    if not text:
+        text = f"[Page {n}: image-only - no extractable text. Ask about visible content.]"
+    return Document(
+        page_content=f"[PAGE {n}]\n{text}",
+        metadata={"page": n, "source": source}
+    )
+
+def _extract_pdf(source: str) -> List[Document]:
     """
-    100% LOCAL - zero Gemini API calls.
+    100% LOCAL - zero Gemini API calls. `source` is a file path (read in place by PyMuPDF).
     Strategy:
       1. PyMuPDF direct text extraction (fast, accurate for text PDFs)
       2. For image-heavy pages (< 20 chars): try pytesseract OCR (local)
       3. Final fallback: layout blocks text join
     """
 
-    pdf  = fitz.open(stream=data, filetype="pdf")
+    pdf  = fitz.open(source, filetype="pdf")
     docs = []
     for n, page in enumerate(pdf, 1):
         text = page.get_text().strip()
-
         if len(text) < 20:
-            # Try pytesseract first (fully local OCR)
-            try:
-                import pytesseract
-                from PIL import Image as PILImage
-                pix    = page.get_pixmap(dpi=150)
-                img    = PILImage.frombytes("RGB", [pix.width, pix.height], pix.samples)
-                text   = pytesseract.image_to_string(img).strip()
-                if text:
-                    _log("PDF", f"Page {n}: OCR extracted {len(text)} chars")
-            except Exception as ocr_err:
-                _log("PDF", f"Page {n}: OCR unavailable ({ocr_err.__class__.__name__}), using layout blocks")
-                text = ""
-
-        if len(text) < 10:
-            # Layout block fallback - grab any text fragments from the page structure
-            blocks = page.get_text("blocks")
-            text   = " ".join(
-                str(b[4]).strip() for b in blocks
-                if len(b) > 4 and str(b[4]).strip()
-            ).strip()
-
-        if not text:
-            text = f"[Page {n}: image-only - no extractable text. Ask about visible content.]"
-
-        docs.append(Document(
-            page_content=f"[PAGE {n}]\n{text}",
-            metadata={"page": n, "source": "pdf"}
-        ))
+            text = _page_fallback_text(page, n)
+        docs.append(_page_doc(n, text))
     pdf.close()
     _log("PDF", f"Extracted {len(docs)} pages (0 Gemini calls)")
     return docs
 
-def _extract_image(data: bytes, mime: str) -> List[Document]:
+def _pdf_from_cached_pages(path: str, cached: List[tuple]) -> List[Document]:
+    """
+    Build page documents from the MyFiles search index's stored text. Only image-heavy
+    pages, which the indexer doesn't OCR, are opened in the PDF (by path, nothing copied).
+    """
+    is_pdf = path.lower().endswith(".pdf")
+    docs, pdf = [], None
+    try:
+        for n, text in cached:
+            if len(text) < 20 and is_pdf:
+                pdf = pdf or fitz.open(path)
+                text = _page_fallback_text(pdf[n - 1], n)
+            docs.append(_page_doc(n, text, "pdf" if is_pdf else "text"))
+    finally:
+        if pdf is not None:
+            pdf.close()
+    return docs
+
+def _extract_image(source: str, mime: str, digest: str = None) -> List[Document]:
     # Image files: compress/resize and then call Groq Vision. Wrapped with 429 retry.
     prompt = "Analyse this image comprehensively. Extract ALL visible text, labels, figures, charts, tables, diagrams, arrows, annotations and structural elements. Structure your analysis clearly."
     
     try:
-        # Preprocess image for Groq (Max 4MB, standard jpeg/png works best)
-        img = PILImage.open(io.BytesIO(data))
-        if img.mode != 'RGB':
-             img = img.convert('RGB')
-             
-        # Resize to max 2048x2048 while preserving aspect ratio
-        img.thumbnail((2048, 2048))
-        
-        # Save back to bytes as JPEG
-        out = io.BytesIO()
-        img.save(out, format="JPEG", quality=85)
-        out.seek(0)
-        
-        # Encode
-        b64  = base64.b64encode(out.read()).decode()
-        safe_mime = "image/jpeg"
-        
-        text, t = _groq_vision(prompt, b64, safe_mime)
+        # Preprocess image for Groq (Max 4MB): shared downscale + JPEG re-encode
+        prepared = prepare_image(source, "rag", digest)
+        text, t = _groq_vision(prompt, prepared.b64, prepared.mime)
         return [Document(page_content=text, metadata={"page": 1, "source": "image"})]
     except Exception as e:
         _log("GROQ_VISION", f"FAIL image vision error: {e}")
@@ -415,53 +493,134 @@ splitter  = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=100)
 # Upload endpoint
 # ----------------------------------------------------------------------
 
-@router.post("/upload")
-async def upload_document(file: UploadFile = File(...)):
-    data     = await file.read()
-    filename = file.filename or "document"
-    mime     = file.content_type or ""
+def _start_session(sid: str, store: LocalVectorStore, filename: str, doc_type: str, pages: List[Document], **extra) -> dict:
+    # Store in global dict - NOT in LangGraph state
+    sessions[sid] = {
+        "store":    store,
+        "filename": filename,
+        "type":     doc_type,
+        "pages":    len(pages),
+        "chunks":   len(store.docs),
+    }
+
+    preview = pages[0].page_content[:500].strip() if pages else ""
+    return {
+        "success":    True,
+        "session_id": sid,
+        "filename":   filename,
+        "type":       doc_type,
+        "pages":      len(pages),
+        "chunks":     len(store.docs),
+        "preview":    preview + ("?" if len(preview) >= 500 else ""),
+        **extra,
+    }
+
+@router.post("/upload", openapi_extra=uploads.openapi_form("file"))
+async def upload_document(request: Request):
     sid      = str(uuid.uuid4())[:12]
 
+    # PyMuPDF, PIL and the (blocking, retrying) Groq client all run in a worker thread
+    loop = asyncio.get_event_loop()
     try:
-        print(f"[RAG] Upload: {filename} ({mime})")
-        if mime == "application/pdf" or filename.lower().endswith(".pdf"):
-            pages    = _extract_pdf(data)
-            doc_type = "pdf"
-        elif mime.startswith("image/"):
-            pages    = _extract_image(data, mime)
-            doc_type = "image"
-        else:
-            raise HTTPException(415, detail=f"Unsupported type: {mime}. Use PDF or image.")
+        # Spooled to a per-request temp file (size-capped, hashed), deleted once indexed
+        async with uploads.receive(request, "/api/rag/upload") as upload:
+            filename = upload.filename
+            mime     = upload.content_type
+            print(f"[RAG] Upload: {filename} ({mime}, {upload.size} bytes)")
+            if mime == "application/pdf" or filename.lower().endswith(".pdf"):
+                pages    = await loop.run_in_executor(None, _extract_pdf, upload.path)
+                doc_type = "pdf"
+            elif mime.startswith("image/"):
+                pages    = await loop.run_in_executor(None, _extract_image, upload.path, mime, upload.sha256)
+                doc_type = "image"
+            else:
+                raise HTTPException(415, detail=f"Unsupported type: {mime}. Use PDF or image.")
 
         chunks = splitter.split_documents(pages)
         store  = LocalVectorStore(chunks)
-
-        # Store in global dict - NOT in LangGraph state
-        sessions[sid] = {
-            "store":    store,
-            "filename": filename,
-            "type":     doc_type,
-            "pages":    len(pages),
-            "chunks":   len(chunks),
-        }
-
-        preview = pages[0].page_content[:500].strip()
         print(f"[RAG] OK {filename} -> {len(pages)} pages, {len(chunks)} chunks indexed")
-        return {
-            "success":    True,
-            "session_id": sid,
-            "filename":   filename,
-            "type":       doc_type,
-            "pages":      len(pages),
-            "chunks":     len(chunks),
-            "preview":    preview + ("?" if len(preview) >= 500 else "")
-        }
+        return _start_session(sid, store, filename, doc_type, pages)
     except HTTPException:
         raise
     except Exception as e:
         import traceback; traceback.print_exc()
         raise HTTPException(500, detail=f"Processing failed: {e}")
 
+# ----------------------------------------------------------------------
+# Open a MyFiles document (no upload)
+# ----------------------------------------------------------------------
+# Built vector stores for MyFiles documents, keyed by (path, size, mtime_ns): re-opening the
+# same book skips extraction *and* TF-IDF fitting. Sessions share the (read-only) store.
+OPEN_CACHE_SIZE = 8
+_open_cache: "OrderedDict[tuple, dict]" = OrderedDict()
+_open_lock  = threading.Lock()
+
+class OpenRequest(BaseModel):
+    path: str   # Relative to data/myfiles, as returned by /api/files/list
+
+def _load_myfile(rel_path: str, full_path: str, key: tuple) -> dict:
+    ext  = os.path.splitext(rel_path)[1].lower()
+    mime = mimetypes.guess_type(full_path)[0] or ""
+    t0   = time.perf_counter()
+    if ext in INDEXED_EXTS:
+        # Text the search indexer already pulled out of the file, if it's still current
+        cached = myfiles.text_index.cached_pages(rel_path)
+        if cached is None:
+            myfiles.text_index.index_file(rel_path)  # Extract once, shared with /api/files/search
+            cached = myfiles.text_index.cached_pages(rel_path)
+        pages    = _pdf_from_cached_pages(full_path, cached or [])
+        doc_type = "pdf" if ext == ".pdf" else "text"
+    elif mime.startswith("image/"):
+        pages = _extract_image(full_path, mime)
+        doc_type = "image"
+    else:
+        raise HTTPException(415, detail=f"Unsupported type: {mime or ext}. Use PDF, text or image.")
+    if not pages:
+        raise HTTPException(422, detail="No readable content in this file.")
+
+    chunks = splitter.split_documents(pages)
+    entry  = {"store": LocalVectorStore(chunks), "pages": pages, "type": doc_type}
+    with _open_lock:
+        _open_cache[key] = entry
+        while len(_open_cache) > OPEN_CACHE_SIZE:
+            _open_cache.popitem(last=False)
+    _log("OPEN", f"{rel_path}: {len(pages)} pages, {len(chunks)} chunks ({time.perf_counter() - t0:.2f}s)")
+    return entry
+
+@router.post("/open")
+async def open_myfile(req: OpenRequest):
+    """Start a chat session on a document already in MyFiles, without re-uploading it."""
+    full_path = myfiles.index.resolve(req.path)
+    if full_path is None:
+        raise HTTPException(403, detail="Access denied")
+    try:
+        st = os.stat(full_path)
+    except OSError:
+        raise HTTPException(404, detail="File not found")
+    # Canonical form, so "a/../b.pdf", "./b.pdf" and "b.pdf" share one cache entry
+    rel_path = os.path.relpath(full_path, os.path.realpath(myfiles.index.root)).replace(os.sep, "/")
+    key      = (rel_path, st.st_size, st.st_mtime_ns)
+
+    with _open_lock:
+        entry = _open_cache.get(key)
+        if entry is not None:
+            _open_cache.move_to_end(key)
+    cached = entry is not None
+    if entry is None:
+        loop = asyncio.get_event_loop()
+        try:
+            entry = await loop.run_in_executor(None, _load_myfile, rel_path, full_path, key)
+        except HTTPException:
+            raise
+        except Exception as e:
+            import traceback; traceback.print_exc()
+            raise HTTPException(500, detail=f"Processing failed: {e}")
+
+    sid = str(uuid.uuid4())[:12]
+    print(f"[RAG] Open: {rel_path} -> session {sid}{' (cached)' if cached else ''}")
+    return _start_session(sid, entry["store"], os.path.basename(rel_path), entry["type"], entry["pages"],
+                          path=rel_path, cached=cached)
+
 # ----------------------------------------------------------------------
 # Query endpoint
 # ----------------------------------------------------------------------
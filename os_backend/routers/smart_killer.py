@@ -1,16 +1,26 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from groq import AsyncGroq
+import asyncio
+import difflib
+import hashlib
 import json
 import logging
 import os
+import re
+import time
+import sqlite3
+import threading
 import fitz  # PyMuPDF
-import io
-import base64
-from PIL import Image as PILImage
 from functools import wraps
 from datetime import datetime
-from database import SessionLocal, Student, QuizResult
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from database import SessionLocal, QuizResult, get_or_create_student
+from image_prep import prepare_image_async
+import uploads
+import rollups
+import speech
 
 router = APIRouter()
 
@@ -38,156 +48,414 @@ def agent_6_error_controller(func):
     async def wrapper(*args, **kwargs):
         try:
             return await func(*args, **kwargs)
+        except HTTPException:
+            raise  # Already a deliberate client error (e.g. 413 upload too large)
         except Exception as e:
             logging.error(f"[Agent 6 - System Debugger] Error caught in {func.__name__}: {str(e)}")
             # Restart or fallback logic could be triggered here
             raise HTTPException(status_code=500, detail=f"Agent Failure: {str(e)}")
     return wrapper
 
-# --- AGENT 1: Curriculum Builder ---
-async def agent_1_extract_topics_and_questions(text: str):
-    import re
-    print("[Leader] Delegating to Agent 1: Content Extraction & Quiz Generation (Groq)...")
-    client = AsyncGroq(api_key=GROQ_API_KEY)
+# --- Curriculum Pipeline Settings ---
+TEXT_MODEL = "llama-3.1-8b-instant"
+MAX_TOPICS = 5
+QUESTIONS_PER_TOPIC = 8
+# Cap on simultaneous Groq calls across every running pipeline (free-tier rate limits)
+LLM_CONCURRENCY = int(os.getenv("SMART_KILLER_CONCURRENCY", "4"))
+_llm_slots = asyncio.Semaphore(LLM_CONCURRENCY)
+
+# Long documents are split and scouted chunk by chunk (map), then topics are merged (reduce)
+CHUNK_CHARS = 6000
+CHUNK_OVERLAP = 300
+TOPIC_SIMILARITY = 0.8
+_chunk_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_CHARS, chunk_overlap=CHUNK_OVERLAP)
+
+# sha256(chunk) -> concepts, on disk so re-uploading the same material skips the scouting
+# calls across restarts and between workers. Least recently used rows go past CHUNK_CACHE_SIZE.
+TOPIC_CACHE_DB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "topic_cache.db")
+CHUNK_CACHE_SIZE = 5000
+_topic_cache_local = threading.local()  # One connection per thread
+
+FALLBACK_IMAGE_PROMPT = "Educational cute vector art, bright colors, white background."
+FALLBACK_TOPIC = {
+    "concept": "Error Parsing Content",
+    "questions": [{"question": "Document was too complex. Try a smaller text?", "options": ["OK", "Try Again", "Close", "Skip"], "correct_index": 0}],
+    "image_prompt": FALLBACK_IMAGE_PROMPT,
+    "robot_speech": "Hmm, I could not read that one. Can you try a smaller text?",
+}
+
+# Lines the robot says constantly: their audio is cached (templates: all but the placeholder)
+ROBOT_SPEECH = "Let's learn about {concept}! Can you answer this? "
+CORRECT_FEEDBACK = "Amazing job, superstar! You got it right! 🎉"
+WRONG_FEEDBACK = "Oh, nice try! But the correct answer was actually {answer}. You'll get it next time! 💪"
+speech.phrases.register(ROBOT_SPEECH, CORRECT_FEEDBACK, WRONG_FEEDBACK, FALLBACK_TOPIC["robot_speech"])
+
+def _robot_speech(concept: str) -> str:
+    return ROBOT_SPEECH.format(concept=concept)
+
+class IncrementalJSONItems:
+    """
+    Incremental scanner for streamed LLM JSON. `feed()` takes the next text fragment and
+    returns every element of the outermost JSON array that has fully closed so far, e.g.
+    each question in {"questions": [...]} the moment its closing brace arrives. Chatter and
+    code fences around the JSON are ignored, and a truncated tail only loses the open element.
+    """
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.stack = []         # (bracket, start offset) of every open container
+        self.string_start = -1  # offset of the opening quote while inside a string
+        self.escaped = False
+
+    def _is_item_level(self) -> bool:
+        return bool(self.stack) and self.stack[-1][0] == "[" and sum(1 for b, _ in self.stack if b == "[") == 1
+
+    def feed(self, fragment: str) -> list:
+        self.buffer += fragment
+        items = []
+        while self.pos < len(self.buffer):
+            ch = self.buffer[self.pos]
+            if self.string_start >= 0:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    if self._is_item_level():
+                        self._emit(items, self.string_start)
+                    self.string_start = -1
+            elif ch == '"' and self.stack:
+                self.string_start = self.pos
+            elif ch in "{[":
+                self.stack.append((ch, self.pos))
+            elif ch in "}]" and self.stack:
+                _, start = self.stack.pop()
+                if ch == "}" and self._is_item_level():
+                    self._emit(items, start)
+            self.pos += 1
+        return items
+
+    def _emit(self, items: list, start: int):
+        try:
+            items.append(json.loads(self.buffer[start:self.pos + 1]))
+        except json.JSONDecodeError:
+            pass  # malformed element: skip it, keep the rest
+
+async def _ask_llm(client: AsyncGroq, prompt: str, temperature: float, max_tokens: int) -> str:
+    # Every agent call takes a slot so a burst of topics cannot trip Groq's 429s
+    async with _llm_slots:
+        response = await client.chat.completions.create(
+            messages=[{"role": "user", "content": prompt}],
+            model=TEXT_MODEL,
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+    return response.choices[0].message.content
+
+async def _stream_llm_items(client: AsyncGroq, prompt: str, temperature: float, max_tokens: int):
+    """Streams a completion and yields each JSON array element as soon as it closes."""
+    parser = IncrementalJSONItems()
+    async with _llm_slots:
+        stream = await client.chat.completions.create(
+            messages=[{"role": "user", "content": prompt}],
+            model=TEXT_MODEL,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True
+        )
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                for item in parser.feed(delta):
+                    yield item
+
+# --- AGENT 1: Topic Scout ---
+async def agent_1_extract_topics(client: AsyncGroq, text: str) -> list:
+    """Cheap first pass: only names the topics, so question writing can fan out per topic."""
+    print("[Leader] Delegating to Agent 1: Topic Extraction (Groq)...")
     prompt = f"""
-    Task: Extract up to 5 major topics from this text. For each topic, create exactly 8 multiple-choice questions suitable for 1st-3rd grade students.
+    Task: Extract up to {MAX_TOPICS} major topics from this text that 1st-3rd grade students could be quizzed on.
     Text: {text}
     
     Return EXACTLY this JSON structure, and nothing else:
     {{
-        "topics": [
+        "topics": ["Topic Name"]
+    }}
+    """
+    concepts = []
+    try:
+        async for topic in _stream_llm_items(client, prompt, temperature=0.2, max_tokens=300):
+            # Tolerate the model answering with objects instead of plain strings
+            concept = topic.get("concept", "") if isinstance(topic, dict) else str(topic)
+            if concept.strip() and concept.strip() not in concepts:
+                concepts.append(concept.strip())
+    except Exception as e:
+        if not concepts:
+            raise
+        print(f"[Agent 1 Error] Stream cut off after {len(concepts)} topic(s): {e}")
+    return concepts[:MAX_TOPICS]
+
+def _topic_cache() -> sqlite3.Connection:
+    conn = getattr(_topic_cache_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(TOPIC_CACHE_DB, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("CREATE TABLE IF NOT EXISTS chunk_topics "
+                     "(sha256 TEXT PRIMARY KEY, concepts TEXT NOT NULL, used_at REAL NOT NULL)")
+        _topic_cache_local.conn = conn
+    return conn
+
+def _cached_concepts(key: str):
+    conn = _topic_cache()
+    row = conn.execute("SELECT concepts FROM chunk_topics WHERE sha256 = ?", (key,)).fetchone()
+    if row is None:
+        return None
+    with conn:
+        conn.execute("UPDATE chunk_topics SET used_at = ? WHERE sha256 = ?", (time.time(), key))
+    return json.loads(row[0])
+
+def _remember_concepts(key: str, concepts: list):
+    conn = _topic_cache()
+    with conn:
+        conn.execute("INSERT OR REPLACE INTO chunk_topics (sha256, concepts, used_at) VALUES (?, ?, ?)",
+                     (key, json.dumps(concepts), time.time()))
+        conn.execute("DELETE FROM chunk_topics WHERE sha256 IN "
+                     "(SELECT sha256 FROM chunk_topics ORDER BY used_at DESC LIMIT -1 OFFSET ?)", (CHUNK_CACHE_SIZE,))
+
+async def _scout_chunk(client: AsyncGroq, chunk: str) -> list:
+    """Map step: Agent 1 on one chunk, memoised by content hash so re-uploads skip Groq."""
+    key = hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+    loop = asyncio.get_event_loop()
+    try:
+        cached = await loop.run_in_executor(None, _cached_concepts, key)
+    except sqlite3.Error as e:
+        print(f"[Agent 1] Topic cache unavailable: {e}")
+        cached = None
+    if cached is not None:
+        return cached
+    try:
+        concepts = await agent_1_extract_topics(client, chunk)
+    except Exception as e:
+        # One bad chunk should not sink a 300-page book
+        print(f"[Agent 1 Error] Chunk scouting failed: {e}")
+        return []
+    if concepts:
+        try:
+            await loop.run_in_executor(None, _remember_concepts, key, concepts)
+        except sqlite3.Error as e:
+            print(f"[Agent 1] Could not cache chunk topics: {e}")
+    return concepts
+
+def _topic_key(concept: str) -> str:
+    words = re.sub(r"[^a-z0-9 ]", " ", concept.lower()).split()
+    return " ".join(w for w in words if w not in ("the", "a", "an", "of", "and"))
+
+def _same_topic(a: str, b: str) -> bool:
+    if a == b or difflib.SequenceMatcher(None, a, b).ratio() >= TOPIC_SIMILARITY:
+        return True
+    # Word overlap catches reorderings like "Water Cycle" vs "Cycle of Water"
+    wa, wb = set(a.split()), set(b.split())
+    return bool(wa and wb) and len(wa & wb) / len(wa | wb) >= TOPIC_SIMILARITY
+
+def _merge_topics(chunk_concepts: list) -> list:
+    """
+    Reduce step: folds near-duplicate concepts from every chunk together, keeps the
+    MAX_TOPICS most frequently mentioned, and returns them in document order as
+    dicts of {concept, chunks} where `chunks` are the chunk indices that mentioned them.
+    """
+    clusters = []
+    for chunk_index, concepts in enumerate(chunk_concepts):
+        for concept in concepts:
+            key = _topic_key(concept)
+            match = next((c for c in clusters if _same_topic(c["key"], key)), None)
+            if match is None:
+                clusters.append({"key": key, "concept": concept, "votes": 1, "chunks": [chunk_index], "order": len(clusters)})
+            else:
+                match["votes"] += 1
+                if chunk_index not in match["chunks"]:
+                    match["chunks"].append(chunk_index)
+
+    top = sorted(clusters, key=lambda c: (-c["votes"], c["order"]))[:MAX_TOPICS]
+    return [{"concept": c["concept"], "chunks": c["chunks"]} for c in sorted(top, key=lambda c: c["order"])]
+
+async def agent_1_map_reduce_topics(client: AsyncGroq, text: str):
+    """Splits the document, scouts every chunk in parallel, and merges the results."""
+    chunks = _chunk_splitter.split_text(text) or [text]
+    if len(chunks) > 1:
+        print(f"[Leader] Long document: scouting {len(chunks)} chunks in parallel...")
+    chunk_concepts = await asyncio.gather(*(_scout_chunk(client, chunk) for chunk in chunks))
+    return chunks, _merge_topics(chunk_concepts)
+
+# --- AGENT 1c: Quiz Writer ---
+def _valid_question(q) -> bool:
+    return (isinstance(q, dict) and bool(q.get("question")) and isinstance(q.get("options"), list)
+            and isinstance(q.get("correct_index"), int) and 0 <= q["correct_index"] < len(q["options"]))
+
+async def agent_1_stream_topic_questions(client: AsyncGroq, concept: str, text: str):
+    """Writes the multiple-choice questions for a single topic, yielding each one as it streams in."""
+    print(f"[Agent 1c] Writing questions for '{concept}'...")
+    prompt = f"""
+    Task: Create exactly {QUESTIONS_PER_TOPIC} multiple-choice questions about the topic "{concept}", suitable for 1st-3rd grade students.
+    Base the questions on this text: {text}
+    
+    Return EXACTLY this JSON structure, and nothing else:
+    {{
+        "questions": [
             {{
-                "concept": "Topic Name",
-                "questions": [
-                    {{
-                        "question": "Question text?",
-                        "options": ["A", "B", "C", "D"],
-                        "correct_index": 0
-                    }}
-                ]
+                "question": "Question text?",
+                "options": ["A", "B", "C", "D"],
+                "correct_index": 0
             }}
         ]
     }}
     """
-    
-    response = await client.chat.completions.create(
-        messages=[{"role": "user", "content": prompt}],
-        model="llama-3.1-8b-instant",
-        temperature=0.2,
-        max_tokens=8000
-    )
-    raw_text = response.choices[0].message.content
-    
-    # Safely extract JSON block using regex
-    match = re.search(r'\{.*\}', raw_text, re.DOTALL)
-    if match:
-        raw_json = match.group(0)
-    else:
-        raw_json = raw_text.replace('```json', '').replace('```', '').strip()
-        
-    try:
-        return json.loads(raw_json)
-    except json.JSONDecodeError as e:
-        print(f"[Agent 1 Error] JSON Decode Failed: {e}. Raw text snippet: {raw_text[-200:]}")
-        # Return a safe fallback so the frontend doesn't hit a 500 error
-        return {"topics": [{"concept": "Error Parsing Content", "questions": [{"question": "Document was too complex. Try a smaller text?", "options": ["OK", "Try Again", "Close", "Skip"], "correct_index": 0}]}]}
+    async for q in _stream_llm_items(client, prompt, temperature=0.2, max_tokens=1800):
+        # Drop malformed questions instead of letting them crash the quiz UI
+        if _valid_question(q):
+            yield q
 
 # --- AGENT 2: Visual Prompt Architect ---
-async def agent_2_generate_image_prompts(topics_data: dict):
-    print("[Leader] Delegating to Agent 2: Visual Architect Image Prompts (Batched Groq)...")
-    import json
-    import re
-    
-    client = AsyncGroq(api_key=GROQ_API_KEY)
-    topics = topics_data.get("topics", [])
-    
-    if not topics:
-        return topics_data
-        
-    concepts = [t.get("concept", "") for t in topics]
-    
+async def agent_2_generate_image_prompt(client: AsyncGroq, concept: str) -> str:
+    print(f"[Leader] Delegating to Agent 2: Visual Architect Image Prompt for '{concept}'...")
     prompt = f"""
-    Create a Stable Diffusion style image prompt for each of these concepts: {concepts}.
+    Create a Stable Diffusion style image prompt for this concept: {concept}.
     Target audience: 1st-3rd grade children.
     Constraints: Must mention 'white background', 'vector art', and 'bright colors'. 
     
-    Return EXACTLY a JSON list of strings, in the exact same order as the concepts.
-    Example: [ "Prompt 1", "Prompt 2" ]
+    Return ONLY the prompt text, nothing else.
     """
-    
     try:
-        response = await client.chat.completions.create(
-            messages=[{"role": "user", "content": prompt}],
-            model="llama-3.1-8b-instant",
-            temperature=0.7,
-            max_tokens=2000
-        )
-        raw_text = response.choices[0].message.content
-        
-        # Safely extract JSON array
-        match = re.search(r'\[.*\]', raw_text, re.DOTALL)
-        if match:
-            prompts_list = json.loads(match.group(0))
-        else:
-            prompts_list = json.loads(raw_text.replace('```json', '').replace('```', '').strip())
-            
-        for i, topic in enumerate(topics):
-            topic["image_prompt"] = prompts_list[i] if i < len(prompts_list) else "Cute vector art, bright colors, white background."
-            topic["robot_speech"] = f"Let's learn about {topic.get('concept', '')}! Can you answer this? "
-            
+        image_prompt = (await _ask_llm(client, prompt, temperature=0.7, max_tokens=200)).strip().strip('"')
+        return image_prompt or FALLBACK_IMAGE_PROMPT
     except Exception as e:
-        print(f"[Agent 2] Error generating prompts: {e}")
-        # Fallback if the batch fails
-        for topic in topics:
-            topic["image_prompt"] = "Educational cute vector art, bright colors, white background."
-            topic["robot_speech"] = f"Let's learn about {topic.get('concept', '')}! Can you answer this? "
-            
-    return topics_data
+        print(f"[Agent 2] Error generating prompt for '{concept}': {e}")
+        return FALLBACK_IMAGE_PROMPT
+
+async def _build_topic(client: AsyncGroq, index: int, concept: str, text: str, events: asyncio.Queue):
+    """Runs the quiz writer and image agent for one topic, pushing `question` events as they close."""
+    async def collect_questions():
+        questions = []
+        try:
+            async for q in agent_1_stream_topic_questions(client, concept, text):
+                # Drain rather than break, so the stream (and its LLM slot) is released promptly
+                if len(questions) < QUESTIONS_PER_TOPIC:
+                    questions.append(q)
+                    events.put_nowait({"event": "question", "index": index, "concept": concept, "question": q})
+        except Exception as e:
+            # Whatever closed before the failure is still a perfectly good quiz
+            print(f"[Agent 1c Error] Questions for '{concept}' stopped after {len(questions)}: {e}")
+        return questions
+
+    questions, image_prompt = [], FALLBACK_IMAGE_PROMPT
+    try:
+        # Questions and artwork for one topic are independent, so both agents run together
+        questions, image_prompt = await asyncio.gather(
+            collect_questions(),
+            agent_2_generate_image_prompt(client, concept),
+        )
+    finally:
+        # Always report back, otherwise stream_curriculum would wait forever for this topic
+        events.put_nowait({"event": "topic", "index": index, "topic": {
+            "concept": concept,
+            "questions": questions,
+            "image_prompt": image_prompt,
+            "robot_speech": _robot_speech(concept),
+        }})
+
+async def stream_curriculum(text: str):
+    """
+    Async generator behind every Smart Killer endpoint. Yields a `topics` event once
+    the topic list is known, a `question` event for every question as it streams in, then
+    one `topic` event per finished topic, in completion order, interleaved with `progress` events.
+    If no topic comes out usable, the only `topic` event is FALLBACK_TOPIC, so every consumer
+    (streamed or not) ends up with the same playable curriculum.
+    """
+    client = AsyncGroq(api_key=GROQ_API_KEY)
+    yield {"event": "progress", "stage": "extracting_topics", "chars": len(text)}
+    chunks, topics = await agent_1_map_reduce_topics(client, text)
+    if not topics:
+        yield {"event": "topic", "index": 0, "topic": dict(FALLBACK_TOPIC)}
+        return
+    yield {"event": "topics", "concepts": [t["concept"] for t in topics], "chunks": len(chunks)}
+
+    # Each topic's questions are written only from the chunks that mentioned it,
+    # so the prompt stays small no matter how long the document is
+    events = asyncio.Queue()
+    tasks = [
+        asyncio.create_task(_build_topic(client, i, t["concept"], "\n\n".join(chunks[c] for c in t["chunks"][:2]), events))
+        for i, t in enumerate(topics)
+    ]
+    try:
+        completed = delivered = 0
+        while completed < len(tasks):
+            event = await events.get()
+            if event["event"] == "question":
+                yield event
+                continue
+            completed += 1
+            topic = event["topic"]
+            if topic["questions"]:
+                delivered += 1
+                yield event
+            else:
+                print(f"[Leader] Topic '{topic['concept']}' produced no usable questions. Skipping.")
+            yield {"event": "progress", "stage": "generating", "completed": completed, "total": len(tasks)}
+        if not delivered:
+            print("[Leader] No topic produced usable questions. Sending the fallback topic.")
+            yield {"event": "topic", "index": 0, "topic": dict(FALLBACK_TOPIC)}
+    finally:
+        # Consumer went away (or a task blew up): don't leave orphaned Groq calls running
+        for task in tasks:
+            task.cancel()
+
+async def build_curriculum(text: str) -> dict:
+    """Drains `stream_curriculum` into the classic `{"topics": [...]}` shape, in document order."""
+    finished = {}
+    async for event in stream_curriculum(text):
+        if event["event"] == "topic":
+            finished[event["index"]] = event["topic"]
+    return {"topics": [finished[i] for i in sorted(finished)]}
 
 # --- LEADER AGENT: Master Orchestrator ---
 @router.post("/learn")
 @agent_6_error_controller
 async def leader_agent_orchestrate(request: LearnRequest):
     """
-    Leader Agent receives the document, coordinates Agent 1 and Agent 2, 
-    and returns the compiled curriculum to the frontend.
+    Leader Agent receives the document, fans out topic extraction, per-topic quiz writing
+    and image prompts, and returns the compiled curriculum to the frontend.
     """
     print(f"\n[Leader] Received new study material ({len(request.document_text)} chars). Initiating Pipeline.")
     
-    # Step 1: Route to Agent 1
-    quiz_data = await agent_1_extract_topics_and_questions(request.document_text)
-    
-    # Step 2: Route to Agent 2
-    final_curriculum = await agent_2_generate_image_prompts(quiz_data)
+    final_curriculum = await build_curriculum(request.document_text)
     
     print("[Leader] Pipeline Complete. Sending data to UI.")
     return {"curriculum": final_curriculum}
 
 # --- AGENT 1b: Vision/Document Extractor ---
-@router.post("/upload-learn")
-@agent_6_error_controller
-async def upload_learn_agent(file: UploadFile = File(...)):
-    """Receives a raw file (PDF, image, txt) and extracts text for the Quiz Agents"""
-    content = await file.read()
-    ext = file.filename.split('.')[-1].lower() if file.filename else ""
-    mime = file.content_type or ""
+def _read_pdf_text(path: str) -> str:
+    with fitz.open(path, filetype="pdf") as doc:
+        return "".join(page.get_text() for page in doc)
+
+async def agent_1b_extract_text(upload: uploads.Upload) -> str:
+    """Turns a raw upload (PDF, image, txt) into plain study text for the Quiz Agents"""
+    filename, mime = upload.filename, upload.content_type
+    ext = filename.split('.')[-1].lower() if filename else ""
     
     text = ""
-    print(f"[Agent 1b] Extracting text from uploaded file: {file.filename} ({len(content)} bytes)")
+    print(f"[Agent 1b] Extracting text from uploaded file: {filename} ({upload.size} bytes)")
     
     if "pdf" in ext or "pdf" in mime:
-        doc = fitz.open(stream=content, filetype="pdf")
-        for page in doc:
-            text += page.get_text()
-        doc.close()
+        # PyMuPDF reads the spooled upload in place, off the event loop
+        text = await asyncio.get_event_loop().run_in_executor(None, _read_pdf_text, upload.path)
     elif "text" in mime or ext in ["txt", "md", "csv"]:
-        text = content.decode("utf-8")
+        with upload.mmap() as data:
+            text = bytes(data).decode("utf-8")
     elif "image" in mime or ext in ["png", "jpg", "jpeg"]:
         # Use Groq Vision to extract text from image
         print(f"[Agent 1b] Querying Groq Vision Model...")
         client = AsyncGroq(api_key=GROQ_API_KEY)
-        b64 = base64.b64encode(content).decode()
-        image_url = f"data:{mime or 'image/jpeg'};base64,{b64}"
+        prepared = await prepare_image_async(upload.path, "smart_killer", upload.sha256)
+        image_url = prepared.data_url
         
         response = await client.chat.completions.create(
             messages=[{
@@ -203,17 +471,74 @@ async def upload_learn_agent(file: UploadFile = File(...)):
     else:
         raise HTTPException(status_code=400, detail="Unsupported file format.")
         
-    print(f"[Agent 1b] Extracted {len(text)} chars from {file.filename}. Triggering Leader...")
+    print(f"[Agent 1b] Extracted {len(text)} chars from {filename}. Triggering Leader...")
+    return text
+
+@router.post("/upload-learn", openapi_extra=uploads.openapi_form("file"))
+@agent_6_error_controller
+async def upload_learn_agent(request: Request):
+    """Receives a raw file (PDF, image, txt) and extracts text for the Quiz Agents"""
+    async with uploads.receive(request, "/api/smart-killer/upload-learn") as upload:
+        text = await agent_1b_extract_text(upload)
     # Pass the extracted text to the main orchestrator (re-use the logic)
-    
-    request = LearnRequest(document_text=text)
-    # Step 1: Route to Agent 1
-    quiz_data = await agent_1_extract_topics_and_questions(request.document_text)
-    # Step 2: Route to Agent 2
-    final_curriculum = await agent_2_generate_image_prompts(quiz_data)
+    final_curriculum = await build_curriculum(text)
     
     return {"curriculum": final_curriculum}
 
+# --- Streaming Delivery ---
+# Same pipeline as /learn and /upload-learn, but every event goes out the moment it exists,
+# so the robot can start talking about topic 1 while topics 2-5 are still being written.
+# Events: progress, topics, question, topic, error, done. NDJSON by default, SSE with ?format=sse.
+
+async def _guarded_events(events):
+    # Agent 6 for generators: headers are already sent, so failures become an `error` event
+    delivered = 0
+    try:
+        async for event in events:
+            if event["event"] == "topic":
+                delivered += 1
+            yield event
+    except Exception as e:
+        logging.error(f"[Agent 6 - System Debugger] Error caught in curriculum stream: {str(e)}")
+        yield {"event": "error", "detail": f"Agent Failure: {str(e)}"}
+    yield {"event": "done", "topics": delivered}
+
+def _curriculum_stream_response(events, format: str) -> StreamingResponse:
+    if format == "sse":
+        async def encode():
+            async for event in _guarded_events(events):
+                yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+        media_type = "text/event-stream"
+    else:
+        async def encode():
+            async for event in _guarded_events(events):
+                yield json.dumps(event) + "\n"
+        media_type = "application/x-ndjson"
+    # X-Accel-Buffering stops nginx-style proxies from holding events back
+    return StreamingResponse(encode(), media_type=media_type, headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.post("/learn/stream")
+async def leader_agent_stream(request: LearnRequest, format: str = "ndjson"):
+    print(f"\n[Leader] Streaming pipeline for new study material ({len(request.document_text)} chars).")
+    return _curriculum_stream_response(stream_curriculum(request.document_text), format)
+
+@router.post("/upload-learn/stream", openapi_extra=uploads.openapi_form("file"))
+async def upload_learn_stream(request: Request, format: str = "ndjson"):
+    # Receive the body now: it can't be read any more once the response has started
+    upload = await uploads.save(request, "/api/smart-killer/upload-learn/stream")
+
+    async def events():
+        try:
+            yield {"event": "progress", "stage": "reading_file", "filename": upload.filename}
+            text = await agent_1b_extract_text(upload)
+        finally:
+            uploads.discard(upload)  # Only the extracted text is needed from here on
+        yield {"event": "progress", "stage": "file_read", "chars": len(text)}
+        async for event in stream_curriculum(text):
+            yield event
+
+    return _curriculum_stream_response(events(), format)
+
 # --- AGENT 5: Evaluator ---
 @router.post("/check-answer")
 @agent_6_error_controller
@@ -226,30 +551,27 @@ async def agent_5_evaluator(request: AnswerCheckRequest):
     is_correct = request.selected_answer.strip().lower() == request.correct_answer.strip().lower()
     
     if is_correct:
-        feedback = "Amazing job, superstar! You got it right! 🎉"
+        feedback = CORRECT_FEEDBACK
     else:
-        feedback = f"Oh, nice try! But the correct answer was actually {request.correct_answer}. You'll get it next time! 💪"
+        feedback = WRONG_FEEDBACK.format(answer=request.correct_answer)
         
     return {
         "is_correct": is_correct,
-        "feedback": feedback
+        "feedback": feedback,
+        "speech_url": speech.say_url(feedback),  # Cached audio: plays instantly
     }
 
 @router.post("/save-score")
 def save_quiz_score(req: ScoreSaveRequest):
     db = SessionLocal()
     try:
-        student = db.query(Student).filter(Student.name == req.student_name).first()
-        if not student:
-            # Auto-enroll
-            student = Student(name=req.student_name, grade="Auto-Enrolled")
-            db.add(student)
-            db.commit()
-            db.refresh(student)
+        # Auto-enroll
+        student = get_or_create_student(db, req.student_name)
             
         today = datetime.now().strftime("%Y-%m-%d")
         qr = QuizResult(student_id=student.id, topic=req.topic, score=req.score, total=req.total, date=today)
         db.add(qr)
+        rollups.record_quiz(db, student.id, req.topic, req.score, req.total, today)
         db.commit()
         return {"success": True, "message": "Score saved to SQLite"}
     except Exception as e:
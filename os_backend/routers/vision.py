@@ -3,15 +3,19 @@ import base64
 import numpy as np
 import os
 import json
+import time
 import uuid
 import asyncio
 import urllib.request
 import threading
 from datetime import datetime
+from typing import Optional
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 from pydantic import BaseModel
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from database import SessionLocal, Student, Attendance
+from database import SessionLocal, Attendance, get_or_create_student
+import rollups
 
 router = APIRouter()
 
@@ -202,8 +206,13 @@ def _log_attendance(db: Session, student_id: int):
         time_now = datetime.now().strftime("%H:%M:%S")
         record = Attendance(student_id=student_id, date=today, status="Present", time=time_now)
         db.add(record)
-        db.commit()
-        print(f"[Attendance] Successfully logged {student_id} as Present at {time_now}")
+        rollups.record_attendance(db, student_id, today, time_now)
+        try:
+            db.commit()
+            print(f"[Attendance] Successfully logged {student_id} as Present at {time_now}")
+        except IntegrityError:
+            # Another recognition thread marked them present first
+            db.rollback()
     
     _daily_attendance_cache.add(cache_key)
 
@@ -247,17 +256,9 @@ def _process_frame(data: str):
                             if name != "Unknown":
                                 db = SessionLocal()
                                 try:
-                                    # Find student by name
-                                    student = db.query(Student).filter(Student.name == name).first()
-                                    if student:
-                                        _log_attendance(db, student.id)
-                                    else:
-                                        # Auto-create phantom student in SQL if FaceRec folder had them but DB didn't
-                                        new_student = Student(name=name, grade="Auto-Enrolled")
-                                        db.add(new_student)
-                                        db.commit()
-                                        db.refresh(new_student)
-                                        _log_attendance(db, new_student.id)
+                                    # Find student by name; auto-create phantom student in SQL if FaceRec folder had them but DB didn't
+                                    student = get_or_create_student(db, name)
+                                    _log_attendance(db, student.id)
                                         
                                 finally:
                                     db.close()
@@ -290,3 +291,206 @@ async def video_feed(websocket: WebSocket):
         pass
     except Exception as e:
         print(f"[Vision WS] {e}")
+
+
+# ──────────────────────────────────────────────
+# WebSocket: Attention tracking (Focus Timer)
+# ──────────────────────────────────────────────
+# Presence and a head-pose check only: no LBPH recognition, no attendance writes.
+# At most one frame is analysed per interval (the rest are dropped undecoded) and the
+# client is only told when the state changes.
+#
+# Head pose: 68 facial landmarks (OpenCV's LBF facemark) -> solvePnP against a generic 3D
+# face -> yaw and pitch. Looking down at the desk is normal work, so only a turned head (or
+# one tipped far back) counts as looking away. Until the ~55 MB landmark model has been
+# downloaded in the background, the facing check falls back to the eye cascade, which can
+# only ever say "facing" or "can't tell".
+
+LBF_PATH = os.path.join(MODEL_DIR, "lbfmodel.yaml")
+LBF_URL  = "https://raw.githubusercontent.com/kurnianggoro/GSOC2017/master/data/lbfmodel.yaml"
+
+eye_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_eye.xml")
+facemark = None  # Loaded on the first attention session
+facemark_lock = threading.Lock()  # Facemark.fit is not thread-safe either
+_facemark_loading = threading.Event()
+
+# Generic face (mm; x right, y up, z toward the camera) and the matching 68-point landmarks:
+# nose tip, chin, outer eye corners, mouth corners
+HEAD_MODEL = np.array([
+    (0.0, 0.0, 0.0), (0.0, -330.0, -65.0),
+    (-225.0, 170.0, -135.0), (225.0, 170.0, -135.0),
+    (-150.0, -150.0, -125.0), (150.0, -150.0, -125.0),
+], dtype=np.float64)
+HEAD_LANDMARKS = [30, 8, 36, 45, 48, 54]
+MODEL_TO_CAMERA = np.diag([1.0, -1.0, -1.0])  # Image y points down, camera z points away
+
+ATTENTION_WIDTH           = 320
+ATTENTION_INTERVAL        = 1.0   # Seconds between analysed frames while things are changing
+ATTENTION_STEADY_INTERVAL = 2.0   # ...and while the student sits still and focused
+ABSENT_AFTER              = 2     # Empty detections in a row before "away" (one miss is noise)
+LOOK_AWAY_AFTER           = 2     # Turned-head observations in a row before "distracted"
+YAW_LIMIT                 = 35.0  # Degrees left/right before the head counts as turned away
+PITCH_UP_LIMIT            = 30.0  # Degrees tipped back (looking at the ceiling); looking down is fine
+EYE_OFFSET_LIMIT          = 0.18  # Fallback: eye midpoint this far (x face width) off centre = not sure
+STABLE_IOU                = 0.5   # Box overlap with the previous one to count as sitting still
+MIN_EYE_CHECK_WIDTH       = 60    # Smaller faces are too far away to judge the head pose
+
+def _load_facemark():
+    global facemark
+    try:
+        if not os.path.exists(LBF_PATH):
+            print("[Attention] Downloading LBF landmark model (~55 MB) …")
+            urllib.request.urlretrieve(LBF_URL, LBF_PATH + ".part")
+            os.replace(LBF_PATH + ".part", LBF_PATH)
+        model = cv2.face.createFacemarkLBF()
+        model.loadModel(LBF_PATH)
+        facemark = model
+        print("[Attention] Landmark head pose ready")
+    except Exception as e:
+        print(f"[Attention] Landmark model unavailable, using the eye cascade: {e}")
+
+def _ensure_facemark():
+    if not _facemark_loading.is_set():
+        _facemark_loading.set()
+        threading.Thread(target=_load_facemark, daemon=True, name="facemark-load").start()
+
+def head_pose(gray, box) -> Optional[tuple]:
+    """(yaw, pitch) in degrees from facial landmarks (pitch > 0 = looking down); None if not available."""
+    if facemark is None:
+        return None
+    with facemark_lock:
+        ok, landmarks = facemark.fit(gray, np.array([box], dtype=np.int32))
+    if not ok or not len(landmarks):
+        return None
+    points = np.asarray(landmarks[0], dtype=np.float64).reshape(-1, 2)[HEAD_LANDMARKS]
+    h, w = gray.shape[:2]
+    camera = np.array([[w, 0, w / 2], [0, w, h / 2], [0, 0, 1]], dtype=np.float64)
+    ok, rvec, _ = cv2.solvePnP(HEAD_MODEL, points, camera, None, flags=cv2.SOLVEPNP_ITERATIVE)
+    if not ok:
+        return None
+    rotation, _ = cv2.Rodrigues(rvec)
+    pitch, yaw, _ = cv2.RQDecomp3x3(MODEL_TO_CAMERA @ rotation)[0]
+    return yaw, pitch
+
+def _decode_attention_frame(message: dict):
+    """Binary JPEG, or the data URL string the other vision sockets use."""
+    if message.get("bytes"):
+        buf = message["bytes"]
+    elif message.get("text"):
+        buf = base64.b64decode(message["text"].split(",", 1)[-1])
+    else:
+        return None
+    frame = cv2.imdecode(np.frombuffer(buf, np.uint8), cv2.IMREAD_COLOR)
+    if frame is None:
+        return None
+    h, w = frame.shape[:2]
+    if w > ATTENTION_WIDTH:
+        frame = cv2.resize(frame, (ATTENTION_WIDTH, int(h * ATTENTION_WIDTH / w)), interpolation=cv2.INTER_AREA)
+    return frame
+
+def _iou(a, b) -> float:
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    iw = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    ih = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = iw * ih
+    return inter / float(aw * ah + bw * bh - inter or 1)
+
+class AttentionTracker:
+    """Per-connection focus state: unknown -> focused / distracted / away, with debouncing."""
+
+    def __init__(self):
+        _ensure_facemark()
+        self.state  = "unknown"
+        self.since  = time.time()
+        self.stable = False
+        self._box   = None
+        self._misses = 0
+        self._turned = 0
+
+    @property
+    def interval(self) -> float:
+        steady = self.state == "focused" and self.stable
+        return ATTENTION_STEADY_INTERVAL if steady else ATTENTION_INTERVAL
+
+    def _facing(self, gray, box) -> Optional[bool]:
+        """True/False from the head pose; None when it can't be told (never a penalty)."""
+        x, y, w, h = box
+        if w < MIN_EYE_CHECK_WIDTH:
+            return None
+        pose = head_pose(gray, box)
+        if pose is not None:
+            yaw, pitch = pose
+            return abs(yaw) <= YAW_LIMIT and pitch >= -PITCH_UP_LIMIT
+        if eye_cascade.empty():
+            return None
+        roi  = gray[y:y + int(h * 0.6), x:x + w]
+        eyes = eye_cascade.detectMultiScale(roi, scaleFactor=1.1, minNeighbors=4, minSize=(w // 8, w // 8))
+        if len(eyes) < 2:
+            return None  # Blinking, glasses glare, reading at the desk... not evidence of looking away
+        (ex1, _, ew1, _), (ex2, _, ew2, _) = sorted(eyes, key=lambda e: e[2] * e[3], reverse=True)[:2]
+        midpoint = (ex1 + ew1 / 2 + ex2 + ew2 / 2) / 2
+        return True if abs(midpoint - w / 2) / w <= EYE_OFFSET_LIMIT else None
+
+    def observe(self, frame) -> Optional[dict]:
+        """Analyse one frame; returns the message to send if the state changed."""
+        boxes = get_faces(frame)
+        if not boxes:
+            self._misses += 1
+            self.stable = False
+            state = "away" if self._misses >= ABSENT_AFTER else self.state
+        else:
+            self._misses = 0
+            box = max(boxes, key=lambda b: b[2] * b[3])
+            self.stable = self._box is not None and _iou(box, self._box) >= STABLE_IOU
+            self._box = box
+            facing = self._facing(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), box)
+            if facing is False:
+                self._turned += 1
+            elif facing:
+                self._turned = 0
+            state = "distracted" if self._turned >= LOOK_AWAY_AFTER else "focused"
+
+        if state == self.state:
+            return None
+        self.state, self.since = state, time.time()
+        return {"type": "state", "state": state, "present": state != "away", "since": round(self.since, 3)}
+
+def _observe_attention(tracker: AttentionTracker, message: dict) -> Optional[dict]:
+    try:
+        frame = _decode_attention_frame(message)
+        return tracker.observe(frame) if frame is not None else None
+    except Exception as e:
+        print(f"[Attention] frame error: {e}")
+        return None
+
+@router.websocket("/ws")
+async def attention_feed(websocket: WebSocket):
+    """
+    Focus Timer channel. Client sends camera frames (binary JPEG or data-URL text) at any rate;
+    server answers only with {"type": "state", "state": focused|distracted|away, ...} on change.
+    """
+    await websocket.accept()
+    loop = asyncio.get_event_loop()
+    tracker = AttentionTracker()
+    next_due, analysed, dropped = 0.0, 0, 0
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            now = time.monotonic()
+            if now < next_due:
+                dropped += 1  # Not even decoded
+                continue
+            change = await loop.run_in_executor(None, _observe_attention, tracker, message)
+            analysed += 1
+            next_due = now + tracker.interval
+            if change is not None:
+                await websocket.send_json(change)
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        print(f"[Attention WS] {e}")
+    finally:
+        print(f"[Attention] Session closed: {analysed} frame(s) analysed, {dropped} dropped")
@@ -1,39 +1,310 @@
-from fastapi import APIRouter, UploadFile, File
-import shutil
+from fastapi import APIRouter, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
 import os
-import subprocess
+import re
+import json
 import time
+import uuid
+import asyncio
+import threading
+import uploads
+import speech
+from static_serving import file_response, file_stat
+from routers.rag import _answer, _answer_stream
 
 router = APIRouter()
 
-# Define the local save paths
-TEMP_DIR = "temp_audio"
+# Spoken replies, served back through /api/voice/audio/<name>
+TEMP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "temp_audio")
 os.makedirs(TEMP_DIR, exist_ok=True)
+REPLY_TTL = 3600
+REPLY_NAME = re.compile(r"^response_[0-9a-f]{12}\.wav$")
 
-@router.post("/process")
-async def process_voice(audio: UploadFile = File(...)):
+VOICE_SYSTEM = (
+    "You are Monk, a friendly classroom robot talking out loud with a child. "
+    "Answer in two or three short sentences of plain spoken English: no markdown, lists or emoji."
+)
+NOT_HEARD = "Sorry, I didn't catch that. Could you say it again?"
+
+PARTIAL_EVERY_MS = 800  # Live captions: re-transcribe the utterance so far at most this often
+HISTORY_TURNS = 3       # Earlier exchanges given to the model on the voice socket
+
+MAX_SAY_CHARS = 500
+
+# Whisper and Piper load in the background from the app's startup hook (main.py), never on a request
+speech.phrases.register(NOT_HEARD)
+
+def _warming(detail: str) -> HTTPException:
+    return HTTPException(status_code=503, detail=detail, headers={"Retry-After": "5"})
+
+def _sweep_replies():
+    cutoff = time.time() - REPLY_TTL
+    for entry in os.scandir(TEMP_DIR):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+def _write_reply(text: str, path: str):
+    pcm = speech.tts.synthesize(text)
+    with open(path + ".tmp", "wb") as f:
+        f.write(speech.to_wav(pcm, speech.tts.sample_rate))
+    os.replace(path + ".tmp", path)
+    _sweep_replies()
+
+@router.get("/status")
+def voice_status():
+    return {
+        "stt": speech.stt.status(), "stt_backend": speech.stt.backend,
+        "tts": speech.tts.status(),
+        "voice": speech.tts.voice,
+    }
+
+@router.post("/process", openapi_extra=uploads.openapi_form("audio"))
+async def process_voice(request: Request):
     """
-    Receives an audio blob from React, transcribes with Whisper,
-    gets response from Ollama, and converts back to speech via Piper.
+    Receives an audio blob from React, transcribes it with the resident Whisper worker,
+    answers through the RAG router's Ollama -> Groq chain and speaks the answer with Piper.
     """
-    input_path = os.path.join(TEMP_DIR, "input_audio.webm")
-    output_wav = os.path.join(TEMP_DIR, f"response_{int(time.time())}.wav")
-
-    with open(input_path, "wb") as buffer:
-        shutil.copyfileobj(audio.file, buffer)
-
-    # Note: Full ML pipeline deferred until exact hardware models are configured
-    # 1. Transcribe (Whisper)
-    user_text = "Simulated transcription: Hello Monk AI."
-    
-    # 2. Get AI Response (Ollama)
-    ai_response = f"I heard you say: {user_text}. I am currently operating in a simulated backend state until Piper TTS is configured."
-
-    # 3. Generate Speech (Piper)
-    # Command template: echo 'AI_RESPONSE' | piper --model voice.onnx --output_file OUTPUT.wav
-    
+    if not speech.stt.ready:
+        raise _warming(f"Speech recognition is {speech.stt.status()}")
+
+    t0 = time.perf_counter()
+    async with uploads.receive(request, "/api/voice/process", "audio") as recording:
+        try:
+            heard = await speech.stt.transcribe_async(path=recording.path)
+        except speech.SpeechUnavailable as e:
+            raise _warming(str(e))
+        except RuntimeError as e:
+            raise HTTPException(status_code=422, detail=f"Could not decode audio: {e}")
+    t_stt = time.perf_counter() - t0
+
+    user_text = heard.text
+    loop = asyncio.get_running_loop()
+    model = None
+    if user_text:
+        try:
+            ai_response, model, _ = await loop.run_in_executor(None, _answer, VOICE_SYSTEM, user_text)
+        except Exception as e:
+            raise HTTPException(status_code=502, detail=f"No language model answered: {e}")
+    else:
+        ai_response = NOT_HEARD
+    t_llm = time.perf_counter() - t0 - t_stt
+
+    audio_url = None
+    if speech.tts.ready:
+        name = f"response_{uuid.uuid4().hex[:12]}.wav"
+        try:
+            await loop.run_in_executor(None, _write_reply, ai_response, os.path.join(TEMP_DIR, name))
+            audio_url = f"/api/voice/audio/{name}"
+        except Exception as e:
+            print(f"[Voice] TTS failed: {e}")
+
+    print(f"[Voice] stt {t_stt:.2f}s, llm {t_llm:.2f}s, total {time.perf_counter() - t0:.2f}s")
     return {
         "user_said": user_text,
         "ai_response": ai_response,
-        "audio_url": "/api/static/temp_audio/" + os.path.basename(output_wav) # Placeholder
+        "audio_url": audio_url,  # None if Piper isn't available: show the text only
+        "model": model,
     }
+
+@router.api_route("/audio/{name}", methods=["GET", "HEAD"])
+def get_reply_audio(name: str, request: Request):
+    if not REPLY_NAME.match(name):
+        raise HTTPException(status_code=404, detail="Not found")
+    path = os.path.join(TEMP_DIR, name)
+    try:
+        stat = file_stat(path)
+    except OSError:
+        raise HTTPException(status_code=404, detail="Not found")
+    return file_response(request, stat, media_type="audio/wav")
+
+def _wav_stream(text: str, headers: dict = None) -> StreamingResponse:
+    """WAV whose PCM is sent chunk by chunk as it is synthesized (cached phrases go out at once)."""
+    if not speech.tts.ready:
+        raise _warming(f"Text-to-speech is {speech.tts.status()}")
+    chunks = speech.tts.stream(text)
+    try:
+        # Waiting for the first chunk lets a failure still be a proper error status,
+        # and the sample rate is known once Piper has answered
+        first = next(chunks, b"")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"TTS failed: {e}")
+
+    def generate():
+        yield speech.wav_header(speech.tts.sample_rate)
+        yield first
+        yield from chunks
+
+    return StreamingResponse(generate(), media_type="audio/wav", headers=headers)
+
+@router.get("/say")
+def say(text: str):
+    """
+    WAV of a short line, answered from the phrase cache where possible (registered robot lines
+    and the fixed parts of templated ones are pre-rendered). Same text -> same audio, so the
+    browser may cache it too.
+    """
+    if len(text) > MAX_SAY_CHARS:
+        raise HTTPException(status_code=400, detail=f"text is limited to {MAX_SAY_CHARS} characters (use /speak)")
+    return _wav_stream(text, {"Cache-Control": "public, max-age=86400"})
+
+class SpeakRequest(BaseModel):
+    text: str
+
+@router.post("/speak")
+def speak(req: SpeakRequest):
+    """Streams a WAV of the text: the first sentence plays while Piper is still on the next."""
+    return _wav_stream(req.text)
+
+def _with_history(history: list) -> str:
+    if not history:
+        return VOICE_SYSTEM
+    turns = "\n".join(f"Child: {q}\nMonk: {a}" for q, a in history[-HISTORY_TURNS:])
+    return f"{VOICE_SYSTEM}\n\nConversation so far:\n{turns}"
+
+@router.websocket("/ws")
+async def voice_socket(websocket: WebSocket):
+    """
+    Live voice conversation. The client streams 16 kHz mono 16-bit PCM as binary messages
+    (any chunk size); VAD cuts it into utterances. Server -> client JSON events:
+      speech_start, partial {text}, final {text}, reply {text} (one per sentence),
+      reply_end {text, model}, interrupted, error {detail}
+    and, right after each `reply`, that sentence as a binary WAV message.
+    The reply starts generating the moment the utterance ends and each sentence is spoken while
+    the model is still writing the next. Speaking over the robot interrupts it.
+    Client may send {"type": "end"} (force end of utterance) or {"type": "reset"} (forget history).
+    """
+    await websocket.accept()
+    if not speech.stt.ready:
+        await websocket.send_json({"type": "error", "detail": f"Speech recognition is {speech.stt.status()}"})
+        await websocket.close(code=1013)  # Try again later
+        return
+
+    loop = asyncio.get_event_loop()
+    outbox = asyncio.Queue()
+    segmenter = speech.Segmenter()
+    history = []
+    partial = {"task": None, "at_ms": 0}
+    reply = {"task": None, "cancel": None}
+
+    async def pump():
+        # The only sender, so JSON events and WAV chunks never interleave mid-message
+        while True:
+            message = await outbox.get()
+            if isinstance(message, bytes):
+                await websocket.send_bytes(message)
+            else:
+                await websocket.send_json(message)
+
+    async def send_partial(pcm: bytes):
+        try:
+            heard = await speech.stt.transcribe_async(pcm=pcm, partial=True)
+        except Exception:
+            return  # Captions are best-effort
+        if segmenter.in_speech and heard.text:
+            outbox.put_nowait({"type": "partial", "text": heard.text})
+
+    def stop_reply():
+        if reply["task"] is not None and not reply["task"].done():
+            reply["cancel"].set()
+            reply["task"].cancel()
+            outbox.put_nowait({"type": "interrupted"})
+
+    async def respond(pcm: bytes, cancel: threading.Event):
+        t0 = time.perf_counter()
+        try:
+            heard = await speech.stt.transcribe_async(pcm=pcm)
+        except Exception as e:
+            outbox.put_nowait({"type": "error", "detail": f"Transcription failed: {e}"})
+            return
+        outbox.put_nowait({"type": "final", "text": heard.text})
+        if not heard.text:
+            return
+
+        sentences = asyncio.Queue()
+        put = lambda item: loop.call_soon_threadsafe(sentences.put_nowait, item)
+
+        def generate():
+            # Worker thread: LLM tokens -> whole sentences, handed over as each one completes
+            buffer, model = speech.SentenceBuffer(), None
+            try:
+                for model, piece in _answer_stream(_with_history(history), heard.text):
+                    if cancel.is_set():
+                        return
+                    for sentence in buffer.feed(piece):
+                        put(("sentence", sentence))
+                for sentence in buffer.flush():
+                    put(("sentence", sentence))
+                put(("done", model))
+            except Exception as e:
+                put(("error", str(e)))
+
+        loop.run_in_executor(None, generate)
+        spoken, first = [], True
+        try:
+            while True:
+                kind, value = await sentences.get()
+                if kind == "error":
+                    outbox.put_nowait({"type": "error", "detail": f"No language model answered: {value}"})
+                    return
+                if kind == "done":
+                    text = " ".join(spoken)
+                    history.append((heard.text, text))
+                    outbox.put_nowait({"type": "reply_end", "text": text, "model": value})
+                    print(f"[Voice WS] stt {heard.seconds:.2f}s, reply done {time.perf_counter() - t0:.2f}s")
+                    return
+                spoken.append(value)
+                outbox.put_nowait({"type": "reply", "text": value})
+                if speech.tts.ready:
+                    pcm_out = await loop.run_in_executor(None, speech.tts.synthesize, value)
+                    outbox.put_nowait(speech.to_wav(pcm_out, speech.tts.sample_rate))
+                    if first:
+                        print(f"[Voice WS] first audio {time.perf_counter() - t0:.2f}s after end of speech")
+                        first = False
+        finally:
+            cancel.set()  # Stops the generator thread if we were interrupted
+
+    async def on_event(event: str, pcm: bytes):
+        if event == "start":
+            stop_reply()  # Barge-in
+            partial["at_ms"] = 0
+            outbox.put_nowait({"type": "speech_start"})
+        elif event == "end" and pcm:
+            reply["cancel"] = threading.Event()
+            reply["task"] = asyncio.create_task(respond(pcm, reply["cancel"]))
+
+    sender = asyncio.create_task(pump())
+    outbox.put_nowait({"type": "ready", "sample_rate": speech.PCM_RATE, "vad": segmenter.backend,
+                       "tts": speech.tts.ready, "tts_sample_rate": speech.tts.sample_rate})
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes"):
+                for event, pcm in segmenter.feed(message["bytes"]):
+                    await on_event(event, pcm)
+                idle = partial["task"] is None or partial["task"].done()
+                if segmenter.in_speech and idle and segmenter.speech_ms - partial["at_ms"] >= PARTIAL_EVERY_MS:
+                    partial["at_ms"] = segmenter.speech_ms
+                    partial["task"] = asyncio.create_task(send_partial(segmenter.audio()))
+            elif message.get("text"):
+                try:
+                    control = json.loads(message["text"])
+                except ValueError:
+                    continue
+                if control.get("type") == "end":
+                    await on_event("end", segmenter.flush())
+                elif control.get("type") == "reset":
+                    stop_reply()
+                    history.clear()
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        print(f"[Voice WS] {e}")
+    finally:
+        stop_reply()
+        sender.cancel()
@@ -0,0 +1,245 @@
+"""
+Full-text search over the documents in MyFiles (PDF, TXT, MD).
+
+Text is extracted page by page (PyMuPDF for PDFs) and stored in its own SQLite database,
+data/search_index.db, with an FTS5 index over it, so searches never touch the app's main
+database. A background thread keeps it in step with the directory index (file_index.py):
+a file is only re-extracted when its size/mtime changed *and* its content hash differs.
+
+The stored page text doubles as an extraction cache: routers/rag.py opens MyFiles documents
+from it instead of parsing the PDF again.
+"""
+import os
+import re
+import time
+import queue
+import sqlite3
+import hashlib
+import threading
+from typing import List, Optional, Tuple
+
+import fitz  # PyMuPDF
+
+INDEX_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "search_index.db")
+INDEXED_EXTS = {".pdf", ".txt", ".md"}
+TEXT_PAGE_CHARS = 4000  # Plain text files are split into "pages" of about this size for snippets
+MAX_RESULTS = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    pages INTEGER NOT NULL,
+    indexed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    id INTEGER PRIMARY KEY,
+    doc_id INTEGER NOT NULL REFERENCES documents(id),
+    page INTEGER NOT NULL,
+    text TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_pages_doc ON pages (doc_id, page);
+CREATE VIRTUAL TABLE IF NOT EXISTS pages_fts USING fts5(
+    text, content='pages', content_rowid='id', tokenize='porter unicode61'
+);
+"""
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(INDEX_DB, timeout=10, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def file_sha256(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def extract_pages(path: str) -> List[Tuple[int, str]]:
+    """[(page number, text)] for a PDF or plain-text file. PyMuPDF reads the file in place."""
+    if path.lower().endswith(".pdf"):
+        with fitz.open(path) as pdf:
+            return [(n, page.get_text().strip()) for n, page in enumerate(pdf, 1)]
+
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        text = f.read()
+    pages, start = [], 0
+    while start < len(text):
+        end = min(len(text), start + TEXT_PAGE_CHARS)
+        if end < len(text):
+            # Break on a paragraph or line boundary rather than mid-word
+            cut = max(text.rfind("\n\n", start, end), text.rfind("\n", start, end))
+            end = cut + 1 if cut > start else end
+        pages.append((len(pages) + 1, text[start:end].strip()))
+        start = end
+    return pages or [(1, "")]
+
+
+def _fts_query(query: str) -> Optional[str]:
+    """User text -> a safe FTS5 query: every word must match, the last one as a prefix."""
+    words = re.findall(r"\w+", query.lower())
+    if not words:
+        return None
+    terms = [f'"{w}"' for w in words[:-1]] + [f'"{words[-1]}"*']
+    return " ".join(terms)
+
+
+class SearchIndex:
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._queue: "queue.Queue[Tuple[str, str]]" = queue.Queue()
+        self._started = False
+        with self._write_lock:
+            self._conn().executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = _connect()
+        return conn
+
+    # --- Indexing ---
+
+    def _delete(self, conn: sqlite3.Connection, doc_id: int):
+        # External-content FTS5 rows must be removed with the text they were indexed with
+        conn.execute(
+            "INSERT INTO pages_fts (pages_fts, rowid, text) SELECT 'delete', id, text FROM pages WHERE doc_id = ?",
+            (doc_id,),
+        )
+        conn.execute("DELETE FROM pages WHERE doc_id = ?", (doc_id,))
+        conn.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
+
+    def remove(self, rel_path: str):
+        with self._write_lock:
+            conn = self._conn()
+            row = conn.execute("SELECT id FROM documents WHERE path = ?", (rel_path,)).fetchone()
+            if row:
+                with conn:
+                    self._delete(conn, row[0])
+
+    def index_file(self, rel_path: str) -> bool:
+        """(Re-)index one file if it changed. Returns True if its text was extracted again."""
+        full_path = os.path.join(self.root, rel_path)
+        try:
+            st = os.stat(full_path)
+        except OSError:
+            self.remove(rel_path)
+            return False
+
+        conn = self._conn()
+        row = conn.execute("SELECT id, size, mtime_ns, sha256 FROM documents WHERE path = ?", (rel_path,)).fetchone()
+        if row and row[1] == st.st_size and row[2] == st.st_mtime_ns:
+            return False  # Unchanged
+
+        digest = file_sha256(full_path)
+        if row and row[3] == digest:
+            # Touched or copied back, same bytes: just remember the new stat
+            with self._write_lock, conn:
+                conn.execute("UPDATE documents SET size = ?, mtime_ns = ? WHERE id = ?",
+                             (st.st_size, st.st_mtime_ns, row[0]))
+            return False
+
+        t0 = time.perf_counter()
+        pages = extract_pages(full_path)  # Slow part, done outside the write lock
+        with self._write_lock, conn:
+            # Look again under the lock: another indexer may have added this path meanwhile
+            current = conn.execute("SELECT id FROM documents WHERE path = ?", (rel_path,)).fetchone()
+            if current:
+                self._delete(conn, current[0])
+            cur = conn.execute(
+                "INSERT INTO documents (path, size, mtime_ns, sha256, pages, indexed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (rel_path, st.st_size, st.st_mtime_ns, digest, len(pages), time.time()),
+            )
+            doc_id = cur.lastrowid
+            for page, text in pages:
+                if not text:
+                    continue
+                page_id = conn.execute("INSERT INTO pages (doc_id, page, text) VALUES (?, ?, ?)",
+                                       (doc_id, page, text)).lastrowid
+                conn.execute("INSERT INTO pages_fts (rowid, text) VALUES (?, ?)", (page_id, text))
+        print(f"[Search] Indexed {rel_path}: {len(pages)} page(s) in {time.perf_counter() - t0:.2f}s")
+        return True
+
+    def cached_pages(self, rel_path: str) -> Optional[List[Tuple[int, str]]]:
+        """Stored page texts if the file is indexed and unchanged since; None otherwise."""
+        try:
+            st = os.stat(os.path.join(self.root, rel_path))
+        except OSError:
+            return None
+        conn = self._conn()
+        row = conn.execute("SELECT id, size, mtime_ns, pages FROM documents WHERE path = ?", (rel_path,)).fetchone()
+        if not row or row[1] != st.st_size or row[2] != st.st_mtime_ns:
+            return None
+        stored = dict(conn.execute("SELECT page, text FROM pages WHERE doc_id = ? ORDER BY page", (row[0],)).fetchall())
+        # Pages with no text aren't stored; give them back as empty so numbering stays intact
+        return [(n, stored.get(n, "")) for n in range(1, row[3] + 1)]
+
+    def document_hash(self, rel_path: str) -> Optional[str]:
+        row = self._conn().execute("SELECT sha256 FROM documents WHERE path = ?", (rel_path,)).fetchone()
+        return row[0] if row else None
+
+    # --- Search ---
+
+    def search(self, query: str, limit: int = 20, offset: int = 0) -> Tuple[List[dict], bool]:
+        """(hits best-first, has_more). Each hit is one matching page with a highlighted snippet."""
+        match = _fts_query(query)
+        if match is None:
+            return [], False
+        limit = max(1, min(limit, MAX_RESULTS))
+        rows = self._conn().execute(
+            "SELECT d.path, p.page, d.pages, "
+            "       snippet(pages_fts, 0, '<mark>', '</mark>', '…', 16), bm25(pages_fts) AS rank "
+            "FROM pages_fts JOIN pages p ON p.id = pages_fts.rowid JOIN documents d ON d.id = p.doc_id "
+            "WHERE pages_fts MATCH ? ORDER BY rank LIMIT ? OFFSET ?",
+            (match, limit + 1, offset),
+        ).fetchall()
+        hits = [{
+            "path": path,
+            "name": os.path.basename(path),
+            "page": page,
+            "pages": pages,
+            "snippet": snippet,
+            "score": round(-rank, 3),  # bm25() is lower-is-better; flip it for readability
+        } for path, page, pages, snippet, rank in rows[:limit]]
+        return hits, len(rows) > limit
+
+    # --- Background worker ---
+
+    def on_index_change(self, change: str, entry):
+        """FileIndex listener (called with the index lock held): just queue the work."""
+        if os.path.splitext(entry.name)[1].lower() in INDEXED_EXTS:
+            self._queue.put((change, entry.path))
+
+    def start(self):
+        if self._started:
+            return
+        self._started = True
+        threading.Thread(target=self._worker, daemon=True, name="search-index").start()
+
+    def _prune(self):
+        """Drop documents whose file disappeared while the server was down."""
+        for (rel_path,) in self._conn().execute("SELECT path FROM documents").fetchall():
+            if not os.path.isfile(os.path.join(self.root, rel_path)):
+                self.remove(rel_path)
+
+    def _worker(self):
+        self._prune()
+        while True:
+            change, rel_path = self._queue.get()
+            try:
+                if change == "removed":
+                    self.remove(rel_path)
+                else:
+                    self.index_file(rel_path)
+            except Exception as e:
+                print(f"[Search] Could not index {rel_path}: {e}")
@@ -0,0 +1,825 @@
+"""
+Local speech for the voice router: Whisper speech-to-text and Piper text-to-speech.
+
+No model is ever loaded on the request path (the app's lifespan calls `start()` and `stop()`):
+- STT runs in one persistent worker process (this file, run as a script) that loads the model
+  once when the server starts. faster-whisper (CTranslate2, int8 on CPU) is used when it is
+  installed, openai-whisper otherwise. Jobs go over the worker's stdin/stdout as JSON lines, so
+  decoding never competes with the event loop for the GIL, and a crashed worker is restarted.
+- TTS is a second long-lived worker process holding the Piper voice (piper Python API), fed
+  one sentence at a time over the same kind of JSON-line pipe. Audio comes back in PCM chunks
+  as Piper produces them, so a reply can be streamed while the rest is still being synthesized.
+  A worker that doesn't answer in time is killed and respawned, never left holding the lock.
+- `PhraseCache` keeps synthesized audio for the lines the robot repeats all day on disk, so
+  they play without running Piper; templated lines reuse their fixed parts.
+- For the live voice channel, `Segmenter` cuts a raw PCM stream into utterances with voice
+  activity detection and `SentenceBuffer` turns streamed LLM tokens into speakable sentences.
+"""
+import os
+import re
+import sys
+import json
+import time
+import wave
+import base64
+import hashlib
+import struct
+import asyncio
+import itertools
+import queue
+import threading
+import subprocess
+import unicodedata
+from collections import deque
+from concurrent.futures import Future
+from urllib.parse import quote
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+try:
+    import webrtcvad
+except ImportError:
+    webrtcvad = None  # Falls back to an adaptive energy threshold
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "base.en")
+WHISPER_LANGUAGE = os.getenv("WHISPER_LANGUAGE", "en") or None  # Empty = auto-detect
+WHISPER_THREADS = int(os.getenv("WHISPER_THREADS", "4"))
+
+PIPER_MODEL = os.getenv("PIPER_MODEL", os.path.join(BASE_DIR, "data", "voices", "en_US-lessac-medium.onnx"))
+PIPER_SPEAKER = os.getenv("PIPER_SPEAKER")
+PIPER_LENGTH_SCALE = float(os.getenv("PIPER_LENGTH_SCALE", "1.0"))  # >1 speaks slower
+TTS_LOAD_TIMEOUT = 120  # Seconds for the worker to load the voice
+TTS_TIMEOUT = 20        # Seconds for one sentence before the worker is considered stuck
+
+TTS_CACHE_DIR = os.path.join(BASE_DIR, "data", "tts_cache")
+TTS_CACHE_LIMIT = int(os.getenv("TTS_CACHE_MB", "50")) * 1024 * 1024
+SHORT_PHRASE_CHARS = 40  # Unregistered sentences up to this long are cached too ("Great job!")
+
+PCM_RATE = 16000  # What the STT worker and the VAD expect for raw PCM (mono, 16-bit)
+MAX_RESTART_DELAY = 60
+
+VAD_AGGRESSIVENESS = int(os.getenv("VAD_AGGRESSIVENESS", "2"))  # webrtcvad 0 (lenient) .. 3 (strict)
+FRAME_MS = 30
+FRAME_BYTES = PCM_RATE * FRAME_MS // 1000 * 2
+
+
+class SpeechUnavailable(Exception):
+    pass
+
+
+class Transcript(NamedTuple):
+    text: str
+    language: Optional[str]
+    seconds: float  # Decode time inside the worker
+
+
+# ----------------------------------------------------------------------
+# WAV helpers (everything internal is mono 16-bit PCM)
+# ----------------------------------------------------------------------
+
+def wav_header(sample_rate: int, data_bytes: Optional[int] = None) -> bytes:
+    """44-byte WAV header. Without a length it is a streaming header (players read until EOF)."""
+    size = 0xFFFFFFFF - 36 if data_bytes is None else data_bytes
+    return struct.pack("<4sI4s4sIHHIIHH4sI", b"RIFF", min(36 + size, 0xFFFFFFFF), b"WAVE", b"fmt ", 16, 1, 1,
+                       sample_rate, sample_rate * 2, 2, 16, b"data", size)
+
+
+def to_wav(pcm: bytes, sample_rate: int) -> bytes:
+    return wav_header(sample_rate, len(pcm)) + pcm
+
+
+def split_sentences(text: str) -> List[str]:
+    """Spoken text in sentence-sized pieces, each worth one Piper call."""
+    parts = re.split(r"(?<=[.!?;:])\s+|\n+", _speakable(text))
+    return [p.strip() for p in parts if re.search(r"\w", p)]
+
+
+def _speakable(text: str) -> str:
+    # Emoji and markdown read aloud as noise (or are skipped unevenly by the phonemizer)
+    text = "".join(c for c in text if unicodedata.category(c) != "So")
+    text = re.sub(r"[*_#`>]+", " ", text)
+    return re.sub(r"[ \t]+", " ", text).strip()
+
+
+class SentenceBuffer:
+    """Collects streamed LLM text and hands back each sentence as soon as it is complete."""
+
+    END = re.compile(r"[.!?]+[\"')\]]*\s+|\n+")
+    MIN_CHARS = 12  # Don't send "1." or "Ok." to TTS on its own
+
+    def __init__(self):
+        self._text = ""
+
+    def feed(self, piece: str) -> List[str]:
+        self._text += piece
+        sentences, start = [], 0
+        for m in self.END.finditer(self._text):
+            if m.end() - start >= self.MIN_CHARS:
+                sentences.append(self._text[start:m.end()].strip())
+                start = m.end()
+        self._text = self._text[start:]
+        return [s for s in sentences if s]
+
+    def flush(self) -> List[str]:
+        rest, self._text = self._text.strip(), ""
+        return [rest] if rest else []
+
+
+# ----------------------------------------------------------------------
+# Voice activity detection: live PCM -> utterances
+# ----------------------------------------------------------------------
+
+class Segmenter:
+    """
+    Splits a live 16 kHz PCM stream into utterances. feed() returns events:
+    ("start", b"") when speech begins and ("end", pcm) with the whole utterance once the
+    speaker has been quiet for END_MS. webrtcvad decides speech per 30 ms frame when installed;
+    otherwise frames louder than a multiple of the running noise floor count as speech.
+    """
+
+    START_WINDOW = 6      # Frames looked at to decide speech has started...
+    START_VOICED = 4      # ...and how many of them must be voiced
+    PREROLL_FRAMES = 10   # 300 ms kept from before the start, so the first syllable isn't clipped
+    END_MS = 700
+    MAX_MS = 15000        # Force an end on a never-ending utterance (a TV in the background)
+    ENERGY_FLOOR = 300.0
+    ENERGY_RATIO = 3.0
+
+    def __init__(self):
+        self._vad = webrtcvad.Vad(VAD_AGGRESSIVENESS) if webrtcvad is not None else None
+        self._rest = b""
+        self._recent: deque = deque(maxlen=self.PREROLL_FRAMES)  # (frame, voiced) while idle
+        self._frames: List[bytes] = []
+        self._silent = 0
+        self._noise: Optional[float] = None
+        self.in_speech = False
+
+    @property
+    def backend(self) -> str:
+        return "webrtcvad" if self._vad is not None else "energy"
+
+    @property
+    def speech_ms(self) -> int:
+        return len(self._frames) * FRAME_MS
+
+    def audio(self) -> bytes:
+        """PCM of the utterance so far (for partial transcripts)."""
+        return b"".join(self._frames)
+
+    def _is_speech(self, frame: bytes) -> bool:
+        if self._vad is not None:
+            return self._vad.is_speech(frame, PCM_RATE)
+        rms = float(np.sqrt(np.mean(np.frombuffer(frame, dtype=np.int16).astype(np.float32) ** 2)))
+        if self._noise is None:
+            self._noise = rms
+        voiced = rms > max(self.ENERGY_FLOOR, self._noise * self.ENERGY_RATIO)
+        if not voiced:
+            self._noise = 0.95 * self._noise + 0.05 * rms
+        return voiced
+
+    def feed(self, data: bytes) -> List[Tuple[str, bytes]]:
+        events = []
+        data = self._rest + data
+        usable = len(data) - len(data) % FRAME_BYTES
+        self._rest = data[usable:]
+        for i in range(0, usable, FRAME_BYTES):
+            frame = data[i:i + FRAME_BYTES]
+            voiced = self._is_speech(frame)
+            if not self.in_speech:
+                self._recent.append((frame, voiced))
+                window = list(self._recent)[-self.START_WINDOW:]
+                if sum(v for _, v in window) >= self.START_VOICED:
+                    self.in_speech = True
+                    self._frames = [f for f, _ in self._recent]
+                    self._recent.clear()
+                    self._silent = 0
+                    events.append(("start", b""))
+                continue
+            self._frames.append(frame)
+            self._silent = 0 if voiced else self._silent + 1
+            if self._silent * FRAME_MS >= self.END_MS or self.speech_ms >= self.MAX_MS:
+                events.append(("end", self.flush()))
+        return events
+
+    def flush(self) -> bytes:
+        """End the current utterance now (e.g. the user let go of push-to-talk)."""
+        pcm = self.audio() if self.in_speech else b""
+        self.in_speech = False
+        self._frames = []
+        self._silent = 0
+        return pcm
+
+
+# ----------------------------------------------------------------------
+# Speech-to-text: persistent Whisper worker process
+# ----------------------------------------------------------------------
+
+class SpeechToText:
+    def __init__(self, model: str = WHISPER_MODEL):
+        self.model = model
+        self.backend: Optional[str] = None
+        self.error: Optional[str] = None
+        self._proc: Optional[subprocess.Popen] = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()  # Guards _pending and writes to the worker's stdin
+        self._pending: Dict[int, Future] = {}
+        self._ids = itertools.count(1)
+        self._started = False
+        self._stopping = False
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def status(self) -> str:
+        if self.ready:
+            return "ready"
+        if self.error:
+            return f"unavailable ({self.error})"
+        return "warming up" if self._started else "not started"
+
+    def start(self):
+        if self._started:
+            return
+        self._started, self._stopping = True, False
+        threading.Thread(target=self._supervise, daemon=True, name="stt-supervisor").start()
+
+    def stop(self):
+        """Kill the worker for good (app shutdown); pending jobs fail with SpeechUnavailable."""
+        self._stopping = True
+        self._started = False
+        proc = self._proc
+        if proc is not None and proc.poll() is None:
+            proc.kill()
+
+    def _supervise(self):
+        delay = 1
+        while True:
+            started_at = time.time()
+            self._run_worker()
+            if self._stopping:
+                return
+            if self.error:
+                print(f"[Speech] Whisper unavailable: {self.error}")
+                return  # The model can't load here; restarting would only fail again
+            if time.time() - started_at > MAX_RESTART_DELAY:
+                delay = 1  # It ran fine for a while: restart right away
+            print(f"[Speech] Whisper worker exited, restarting in {delay}s")
+            time.sleep(delay)
+            delay = min(delay * 2, MAX_RESTART_DELAY)
+
+    def _run_worker(self):
+        t0 = time.perf_counter()
+        try:
+            proc = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), "stt-worker", self.model],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1,
+            )
+        except OSError as e:
+            self.error = str(e)
+            return
+        self._proc = proc
+        for line in proc.stdout:
+            try:
+                msg = json.loads(line)
+            except ValueError:
+                continue
+            if msg.get("ready"):
+                self.backend = msg["backend"]
+                self._ready.set()
+                print(f"[Speech] Whisper ready: {self.backend} in {time.perf_counter() - t0:.1f}s")
+            elif "fatal" in msg:
+                self.error = msg["fatal"]
+            else:
+                with self._lock:
+                    future = self._pending.pop(msg.get("id"), None)
+                if future is None:
+                    continue
+                if "error" in msg:
+                    future.set_exception(RuntimeError(msg["error"]))
+                else:
+                    future.set_result(Transcript(msg["text"], msg.get("language"), msg.get("seconds", 0.0)))
+        proc.wait()
+        with self._lock:
+            self._ready.clear()
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.set_exception(SpeechUnavailable("Speech worker exited"))
+
+    def transcribe(self, path: Optional[str] = None, pcm: Optional[bytes] = None, partial: bool = False) -> Future:
+        """
+        Queue one job: an audio file of any format ffmpeg reads, or raw 16 kHz mono 16-bit PCM.
+        `partial` trades accuracy for speed (greedy decoding) for live captions.
+        Returns a Future resolving to a Transcript.
+        """
+        job = {"partial": partial}
+        if pcm is not None:
+            job["pcm"] = base64.b64encode(pcm).decode("ascii")
+        else:
+            job["path"] = path
+        future = Future()
+        with self._lock:
+            if not self._ready.is_set():
+                raise SpeechUnavailable(f"Speech recognition is {self.status()}")
+            job["id"] = next(self._ids)
+            self._pending[job["id"]] = future
+            try:
+                self._proc.stdin.write(json.dumps(job) + "\n")
+                self._proc.stdin.flush()
+            except (OSError, ValueError) as e:
+                self._pending.pop(job["id"], None)
+                raise SpeechUnavailable(f"Speech worker unreachable: {e}")
+        return future
+
+    async def transcribe_async(self, path: Optional[str] = None, pcm: Optional[bytes] = None,
+                               partial: bool = False) -> Transcript:
+        return await asyncio.wrap_future(self.transcribe(path=path, pcm=pcm, partial=partial))
+
+
+def _load_whisper(name: str):
+    """(transcribe(audio, fast) -> (text, language), backend label). Runs inside the worker."""
+    try:
+        from faster_whisper import WhisperModel
+    except ImportError:
+        WhisperModel = None
+
+    if WhisperModel is not None:
+        model = WhisperModel(name, device="cpu", compute_type="int8", cpu_threads=WHISPER_THREADS)
+
+        def transcribe(audio, fast):
+            segments, info = model.transcribe(audio, language=WHISPER_LANGUAGE, beam_size=1 if fast else 5,
+                                              condition_on_previous_text=False, vad_filter=not fast)
+            return " ".join(s.text.strip() for s in segments).strip(), info.language
+
+        return transcribe, f"faster-whisper/{name} (int8)"
+
+    import torch
+    import whisper
+    torch.set_num_threads(WHISPER_THREADS)
+    model = whisper.load_model(name, device="cpu")
+
+    def transcribe(audio, fast):
+        result = model.transcribe(audio, language=WHISPER_LANGUAGE, fp16=False, beam_size=None if fast else 5,
+                                  condition_on_previous_text=False)
+        return result["text"].strip(), result.get("language")
+
+    return transcribe, f"openai-whisper/{name}"
+
+
+def _worker_main(name: str):
+    out = sys.stdout
+    sys.stdout = sys.stderr  # Library chatter must not corrupt the protocol
+
+    def send(msg):
+        out.write(json.dumps(msg) + "\n")
+        out.flush()
+
+    try:
+        transcribe, backend = _load_whisper(name)
+        transcribe(np.zeros(PCM_RATE, dtype=np.float32), True)  # First decode is slow; pay for it now
+    except Exception as e:
+        send({"fatal": f"{type(e).__name__}: {e}"})
+        return
+    send({"ready": True, "backend": backend})
+
+    for line in sys.stdin:
+        try:
+            job = json.loads(line)
+        except ValueError:
+            continue
+        t0 = time.perf_counter()
+        try:
+            if "pcm" in job:
+                audio = np.frombuffer(base64.b64decode(job["pcm"]), dtype=np.int16).astype(np.float32) / 32768.0
+            else:
+                audio = job["path"]
+            text, language = transcribe(audio, job.get("partial", False))
+            send({"id": job["id"], "text": text, "language": language,
+                  "seconds": round(time.perf_counter() - t0, 3)})
+        except Exception as e:
+            send({"id": job.get("id"), "error": f"{type(e).__name__}: {e}"})
+
+
+# ----------------------------------------------------------------------
+# Phrase cache: synthesized audio for recurring robot lines
+# ----------------------------------------------------------------------
+
+class PhraseCache:
+    """
+    WAVs of spoken phrases in data/tts_cache, keyed by (text, voice, rate) and trimmed least
+    recently used first once past TTS_CACHE_MB. Routers register the lines they say all the
+    time; fixed lines are rendered ahead of time once Piper is up and are never evicted.
+
+    A registered line may be a template ("Let's learn about {concept}! ..."): text matching it is
+    spoken as the cached fixed parts with only the filled-in parts synthesized, joined as PCM.
+    """
+
+    def __init__(self, tts: "TextToSpeech", directory: str = TTS_CACHE_DIR, limit: int = TTS_CACHE_LIMIT):
+        self.tts = tts
+        self.directory = directory
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._pinned: set = set()  # Normalized fixed phrases (never evicted)
+        self._templates: List[Tuple[re.Pattern, List[str]]] = []
+        os.makedirs(directory, exist_ok=True)
+        self._bytes = sum(e.stat().st_size for e in os.scandir(directory) if e.is_file())
+
+    def _path(self, text: str) -> str:
+        key = hashlib.sha256(f"{self.tts.voice}\0{self.tts.rate}\0{text}".encode()).hexdigest()[:32]
+        return os.path.join(self.directory, f"{key}.wav")
+
+    # --- Registration ---
+
+    def register(self, *lines: str):
+        """Fixed phrases or `{placeholder}` templates. New fixed parts are pre-rendered in the background."""
+        added = []
+        for line in lines:
+            parts = re.split(r"\{(\w+)\}", _speakable(line))
+            if len(parts) > 1:
+                literals = parts[0::2]
+                pattern = "".join(
+                    r"\s*".join(map(re.escape, part.split())) if i % 2 == 0 else r"\s*(.+?)\s*"
+                    for i, part in enumerate(parts)
+                )
+                self._templates.append((re.compile(pattern, re.IGNORECASE), literals))
+                fixed = [text for text, pinned in self._pieces(literals, ["x"] * (len(parts) // 2)) if pinned]
+            else:
+                fixed = split_sentences(line)
+            added += [f for f in fixed if f not in self._pinned]
+            self._pinned.update(fixed)
+        if added and self.tts.ready:
+            threading.Thread(target=self.warm, args=(added,), daemon=True, name="tts-phrase-warmup").start()
+
+    def warm(self, phrases: Optional[List[str]] = None):
+        rendered, t0 = 0, time.perf_counter()
+        for phrase in phrases or sorted(self._pinned):
+            if not os.path.exists(self._path(phrase)):
+                try:
+                    self.put(phrase, self.tts._synthesize(phrase))
+                    rendered += 1
+                except Exception as e:
+                    print(f"[Speech] Could not pre-render '{phrase}': {e}")
+                    return
+        if rendered:
+            print(f"[Speech] Pre-rendered {rendered} phrase(s) in {time.perf_counter() - t0:.1f}s")
+
+    # --- Splitting ---
+
+    def _pieces(self, literals: List[str], values: List[str]) -> List[Tuple[str, bool]]:
+        """Interleave fixed parts (split into sentences, pinned) with filled-in values (not pinned)."""
+        pieces: List[Tuple[str, bool]] = []
+        for i, literal in enumerate(literals):
+            if pieces and not pieces[-1][1]:
+                # Punctuation right after a value belongs with it: "{concept}!" not "! Can you..."
+                lead = re.match(r"[^\w\s]*", literal.lstrip()).group()
+                pieces[-1] = (pieces[-1][0] + lead, False)
+                literal = literal.lstrip()[len(lead):]
+            pieces += [(sentence, True) for sentence in split_sentences(literal)]
+            if i < len(values) and values[i].strip():
+                pieces.append((values[i].strip(), False))
+        return pieces
+
+    def pieces(self, text: str) -> List[Tuple[str, bool]]:
+        """(piece, pinned) in speaking order: a template's parts, or else the text's sentences."""
+        spoken = _speakable(text)
+        for pattern, literals in self._templates:
+            match = pattern.fullmatch(spoken)
+            if match:
+                return self._pieces(literals, list(match.groups()))
+        return [(sentence, sentence in self._pinned) for sentence in split_sentences(spoken)]
+
+    # --- Storage ---
+
+    def get(self, text: str) -> Optional[bytes]:
+        path = self._path(text)
+        try:
+            with wave.open(path, "rb") as w:
+                pcm = w.readframes(w.getnframes())
+            os.utime(path)  # Recently used
+            return pcm
+        except (OSError, EOFError, wave.Error):
+            return None
+
+    def put(self, text: str, pcm: bytes):
+        path = self._path(text)
+        data = to_wav(pcm, self.tts.sample_rate)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        with self._lock:
+            # Replacing an existing entry (same line rendered twice, or two threads racing) frees its old size
+            try:
+                replaced = os.stat(path).st_size
+            except OSError:
+                replaced = 0
+            os.replace(tmp, path)
+            self._bytes += len(data) - replaced
+            if self._bytes > self.limit:
+                self._evict()
+
+    def _evict(self):
+        pinned = {self._path(text) for text in self._pinned}
+        entries = sorted((e.stat().st_mtime, e.stat().st_size, e.path) for e in os.scandir(self.directory) if e.is_file())
+        for _, size, path in entries:
+            if self._bytes <= self.limit * 0.9:
+                break
+            if path in pinned:
+                continue
+            try:
+                os.remove(path)
+                self._bytes -= size
+            except OSError:
+                pass
+
+    def speak(self, piece: str, pinned: bool, on_chunk: Optional[Callable[[bytes], None]] = None) -> bytes:
+        """
+        PCM for one piece: from disk if cached, else from Piper (and kept if worth keeping).
+        `on_chunk` is handed the audio as it becomes available.
+        """
+        cacheable = pinned or len(piece) <= SHORT_PHRASE_CHARS
+        pcm = self.get(piece) if cacheable else None
+        if pcm is not None:
+            if on_chunk is not None:
+                on_chunk(pcm)
+            return pcm
+        pcm = self.tts._synthesize(piece, on_chunk)
+        if cacheable:
+            self.put(piece, pcm)
+        return pcm
+
+
+# ----------------------------------------------------------------------
+# Text-to-speech: long-lived Piper process
+# ----------------------------------------------------------------------
+
+def _voice_sample_rate(model: str) -> int:
+    try:
+        with open(model + ".json", "r", encoding="utf-8") as f:
+            return int(json.load(f)["audio"]["sample_rate"])
+    except (OSError, ValueError, KeyError):
+        return 22050
+
+
+def _load_piper(model: str):
+    """
+    synthesize(text) -> iterator of (pcm, sample_rate) through the piper Python API, one chunk
+    per sentence as Piper finishes it. Runs inside the worker.
+    """
+    from piper import PiperVoice
+    try:
+        from piper import SynthesisConfig  # piper-tts >= 1.3
+    except ImportError:
+        SynthesisConfig = None
+
+    voice = PiperVoice.load(model)
+    speaker = int(PIPER_SPEAKER) if PIPER_SPEAKER else None
+
+    if SynthesisConfig is not None:
+        config = SynthesisConfig(speaker_id=speaker, length_scale=PIPER_LENGTH_SCALE)
+
+        def synthesize(text):
+            for chunk in voice.synthesize(text, syn_config=config):
+                yield chunk.audio_int16_bytes, chunk.sample_rate
+    else:
+        def synthesize(text):
+            for pcm in voice.synthesize_stream_raw(text, speaker_id=speaker, length_scale=PIPER_LENGTH_SCALE):
+                yield pcm, voice.config.sample_rate
+
+    return synthesize
+
+
+def _tts_worker_main(model: str):
+    out = sys.stdout
+    sys.stdout = sys.stderr  # Library chatter must not corrupt the protocol
+
+    def send(msg):
+        out.write(json.dumps(msg) + "\n")
+        out.flush()
+
+    sample_rate = _voice_sample_rate(model)
+    try:
+        synthesize = _load_piper(model)
+        for _, sample_rate in synthesize("Hello."):  # Loads the ONNX session before the first real line
+            pass
+    except Exception as e:
+        send({"fatal": f"{type(e).__name__}: {e}"})
+        return
+    send({"ready": True, "sample_rate": sample_rate})
+
+    for line in sys.stdin:
+        try:
+            job = json.loads(line)
+        except ValueError:
+            continue
+        try:
+            # Each chunk goes out the moment Piper has it; `done` closes the job
+            for pcm, sample_rate in synthesize(job["text"]):
+                send({"id": job["id"], "pcm": base64.b64encode(pcm).decode("ascii"), "sample_rate": sample_rate})
+            send({"id": job["id"], "done": True})
+        except Exception as e:
+            send({"id": job.get("id"), "error": f"{type(e).__name__}: {e}"})
+
+
+class TextToSpeech:
+    def __init__(self, model: str = PIPER_MODEL, length_scale: float = PIPER_LENGTH_SCALE):
+        self.model = model
+        self.voice = os.path.splitext(os.path.basename(model))[0] + (f"#{PIPER_SPEAKER}" if PIPER_SPEAKER else "")
+        self.rate = length_scale
+        self.sample_rate = _voice_sample_rate(model)
+        self.error: Optional[str] = None
+        self._proc: Optional[subprocess.Popen] = None
+        self._replies: Optional[queue.Queue] = None  # Messages from the current worker; None = it exited
+        self._ids = itertools.count(1)
+        self._ready = threading.Event()
+        self._lock = threading.Lock()  # The worker handles one line at a time
+        self._started = False
+        self._stopping = False
+        self.phrases = PhraseCache(self)
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def status(self) -> str:
+        if self.ready:
+            return "ready"
+        if self.error:
+            return f"unavailable ({self.error})"
+        return "warming up" if self._started else "not started"
+
+    def start(self):
+        if self._started:
+            return
+        self._started, self._stopping = True, False
+        threading.Thread(target=self._warm_up, daemon=True, name="tts-warmup").start()
+
+    def stop(self):
+        """Kill the worker for good (app shutdown). A call in progress fails, later ones get SpeechUnavailable."""
+        self._stopping = True
+        self._started = False
+        self._ready.clear()
+        proc = self._proc
+        if proc is not None and proc.poll() is None:
+            proc.kill()
+
+    def _warm_up(self):
+        if not os.path.exists(self.model):
+            self.error = f"voice model {self.model} not found"
+            print(f"[Speech] Piper unavailable: {self.error}")
+            return
+        t0 = time.perf_counter()
+        try:
+            with self._lock:
+                self._spawn()
+        except Exception as e:
+            self.error = str(e)
+            print(f"[Speech] Piper failed to start: {e}")
+            return
+        if self._stopping:
+            self._kill()
+            return
+        self._ready.set()
+        print(f"[Speech] Piper ready: {self.voice} @ {self.sample_rate} Hz in {time.perf_counter() - t0:.1f}s")
+        self.phrases.warm()
+
+    def _read_replies(self, proc: subprocess.Popen, replies: queue.Queue):
+        for line in proc.stdout:
+            try:
+                replies.put(json.loads(line))
+            except ValueError:
+                continue
+        replies.put(None)
+
+    def _kill(self):
+        if self._proc is not None:
+            self._proc.kill()
+        self._proc = None
+
+    def _spawn(self):
+        """Start the worker and wait until its voice is loaded. Caller holds the lock."""
+        proc = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "tts-worker", self.model],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, bufsize=1,
+        )
+        replies = queue.Queue()
+        threading.Thread(target=self._read_replies, args=(proc, replies), daemon=True, name="tts-reader").start()
+        self._proc, self._replies = proc, replies
+        try:
+            msg = replies.get(timeout=TTS_LOAD_TIMEOUT)
+        except queue.Empty:
+            msg = {"fatal": f"voice did not load within {TTS_LOAD_TIMEOUT}s"}
+        if not msg or not msg.get("ready"):
+            self._kill()
+            raise RuntimeError((msg or {}).get("fatal", "Piper worker exited"))
+        self.sample_rate = msg["sample_rate"]
+
+    def _synthesize(self, sentence: str, on_chunk: Optional[Callable[[bytes], None]] = None) -> bytes:
+        """PCM for one sentence; `on_chunk` gets each piece of it the moment the worker sends it."""
+        with self._lock:
+            if self._stopping:
+                raise SpeechUnavailable("Text-to-speech is stopped")
+            if self._proc is None or self._proc.poll() is not None:
+                self._spawn()
+            job_id = next(self._ids)
+            try:
+                self._proc.stdin.write(json.dumps({"id": job_id, "text": sentence.replace("\n", " ")}) + "\n")
+                self._proc.stdin.flush()
+            except (OSError, ValueError) as e:
+                self._kill()
+                raise RuntimeError(f"Piper: {e}")
+            chunks = []
+            while True:
+                try:
+                    # The timeout runs per chunk: a long sentence is fine as long as audio keeps coming
+                    msg = self._replies.get(timeout=TTS_TIMEOUT)
+                except queue.Empty:
+                    # A wedged worker must not hold the lock forever: kill it, the next call respawns
+                    self._kill()
+                    raise RuntimeError(f"Piper: no audio within {TTS_TIMEOUT}s")
+                if msg is None:
+                    self._kill()
+                    raise RuntimeError("Piper: worker exited")
+                if msg.get("id") != job_id:
+                    continue  # A late reply to a job that already timed out
+                if "error" in msg:
+                    raise RuntimeError(f"Piper: {msg['error']}")
+                if msg.get("done"):
+                    return b"".join(chunks)
+                self.sample_rate = msg["sample_rate"]
+                pcm = base64.b64decode(msg["pcm"])
+                chunks.append(pcm)
+                if on_chunk is not None:
+                    on_chunk(pcm)
+
+    def synthesize(self, text: str) -> bytes:
+        """Blocking: mono 16-bit PCM at `sample_rate` for the whole text."""
+        if not self.ready:
+            raise SpeechUnavailable(f"Text-to-speech is {self.status()}")
+        return b"".join(self.phrases.speak(piece, pinned) for piece, pinned in self.phrases.pieces(text))
+
+    def stream(self, text: str) -> Iterator[bytes]:
+        """
+        PCM chunks as they are produced: cached phrases straight from disk, the rest sentence by
+        sentence as Piper finishes it. Synthesis runs on its own thread, so a chunk is yielded
+        while Piper is already working on the next one.
+        """
+        if not self.ready:
+            raise SpeechUnavailable(f"Text-to-speech is {self.status()}")
+        chunks = queue.Queue()
+        abandoned = threading.Event()
+
+        def produce():
+            try:
+                for piece, pinned in self.phrases.pieces(text):
+                    if abandoned.is_set():
+                        break  # The listener went away
+                    self.phrases.speak(piece, pinned, chunks.put)
+            except Exception as e:
+                chunks.put(e)
+            chunks.put(None)
+
+        threading.Thread(target=produce, daemon=True, name="tts-stream").start()
+        try:
+            while True:
+                chunk = chunks.get()
+                if chunk is None:
+                    return
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+        finally:
+            abandoned.set()
+
+
+stt = SpeechToText()
+tts = TextToSpeech()
+phrases = tts.phrases  # Routers register their recurring lines here
+
+
+def say_url(text: str) -> str:
+    """Where the frontend fetches `text` spoken (voice router's /say: cached phrases play instantly)."""
+    return f"/api/voice/say?text={quote(text)}"
+
+
+def start():
+    """Load both models in the background; requests get a 503 until they are ready. Called at app startup."""
+    stt.start()
+    tts.start()
+
+
+def stop():
+    """Kill both workers. Called at app shutdown."""
+    stt.stop()
+    tts.stop()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 2 and sys.argv[1] == "stt-worker":
+        _worker_main(sys.argv[2] if len(sys.argv) > 2 else WHISPER_MODEL)
+    elif len(sys.argv) >= 2 and sys.argv[1] == "tts-worker":
+        _tts_worker_main(sys.argv[2] if len(sys.argv) > 2 else PIPER_MODEL)
+    else:
+        print("usage: python speech.py stt-worker|tts-worker [model]", file=sys.stderr)
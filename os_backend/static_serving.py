@@ -0,0 +1,338 @@
+"""
+Static file serving for MyFiles (routers/files.py) and the compiled React bundle (main.py).
+
+- Byte ranges (206 / 416) so the browser can seek in a lesson video without re-downloading it
+- Strong ETag + Last-Modified validators, answered with 304 Not Modified
+- Vite's content-hashed /assets/* are cached for a year as immutable; index.html revalidates
+- Pre-compressed `.br` / `.gz` siblings are served when the client accepts them. The bundle
+  compresses any that are missing into data/static_cache (gzip always, brotli if the module
+  is installed); the build output itself is never written to.
+"""
+import os
+import gzip
+import hashlib
+import mimetypes
+import threading
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CHUNK_SIZE = 256 * 1024
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"  # May be stored, but must be revalidated (cheap 304) before every use
+
+COMPRESSIBLE_EXTS = {".js", ".mjs", ".css", ".html", ".json", ".svg", ".txt", ".map", ".wasm", ".xml", ".ico"}
+MIN_COMPRESS_SIZE = 1024
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))  # Preference order
+COMPRESS_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "static_cache")
+
+
+class FileStat(NamedTuple):
+    path: str
+    size: int
+    mtime: float
+    etag: str
+
+
+def file_stat(path: str, st: os.stat_result = None, suffix: str = "") -> FileStat:
+    st = st or os.stat(path)
+    # Strong validator: changes whenever the file is rewritten (size or nanosecond mtime)
+    return FileStat(path, st.st_size, st.st_mtime, f'"{st.st_size:x}-{st.st_mtime_ns:x}{suffix}"')
+
+
+def _not_modified(request: Request, stat: FileStat) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match takes precedence over If-Modified-Since (RFC 9110 13.1.3)
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or stat.etag in tags or f"W/{stat.etag}" in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(stat.mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """(start, end inclusive) for a single 'bytes=' range; None if unsatisfiable. Raises ValueError if malformed."""
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        raise ValueError("unsupported range")  # Multipart ranges aren't worth it here: send the whole file
+    first, _, last = spec.strip().partition("-")
+    if not first:
+        length = int(last)  # Suffix range: the last N bytes
+        if length <= 0:
+            return None
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+def _iter_file(path: str, start: int, length: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def file_response(request: Request, stat: FileStat, media_type: str = None, cache_control: str = REVALIDATE,
+                  content_encoding: str = None, vary: bool = False) -> Response:
+    """Serve one file with validators, 304s and byte ranges."""
+    media_type = media_type or mimetypes.guess_type(stat.path)[0] or "application/octet-stream"
+    headers = {
+        "ETag": stat.etag,
+        "Last-Modified": formatdate(stat.mtime, usegmt=True),
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes",
+    }
+    if content_encoding:
+        headers["Content-Encoding"] = content_encoding
+    if vary:
+        headers["Vary"] = "Accept-Encoding"
+
+    if _not_modified(request, stat):
+        return Response(status_code=304, headers=headers)
+
+    start, end, status = 0, stat.size - 1, 200
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    # If-Range: only honour the range if the client's copy is still the current one
+    if range_header and (not if_range or if_range.strip() in (stat.etag, headers["Last-Modified"])):
+        try:
+            byte_range = _parse_range(range_header, stat.size)
+        except ValueError:
+            byte_range = (0, stat.size - 1)
+        if byte_range is None:
+            headers["Content-Range"] = f"bytes */{stat.size}"
+            return Response(status_code=416, headers=headers)
+        start, end = byte_range
+        if (start, end) != (0, stat.size - 1):
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{stat.size}"
+
+    length = max(0, end - start + 1)
+    headers["Content-Length"] = str(length)
+    if request.method == "HEAD":
+        return Response(status_code=status, headers=headers, media_type=media_type)
+    return StreamingResponse(_iter_file(stat.path, start, length), status_code=status,
+                             headers=headers, media_type=media_type)
+
+
+def _accepted_encodings(request: Request) -> set:
+    accepted = set()
+    for part in request.headers.get("accept-encoding", "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if coding and params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(coding.lower())
+    return accepted
+
+
+class _BundleFile(NamedTuple):
+    stat: FileStat
+    media_type: str
+    variants: Dict[str, FileStat]  # content-encoding -> pre-compressed copy
+
+
+class StaticBundle:
+    """
+    The Vite `dist/` directory, scanned once into memory. Each request costs one stat of the
+    directory itself (to notice a rebuild) and one of the file being served (to notice an
+    in-place overwrite) instead of exists/isfile checks per file.
+
+    Compressed copies the build didn't ship are made in the background and kept in
+    `cache_dir`, never inside `dist/`: it may be read-only, and a rebuild should leave it clean.
+    """
+
+    def __init__(self, root: str, index_file: str = "index.html", precompress: bool = True,
+                 cache_dir: str = COMPRESS_CACHE_DIR):
+        self.root = os.path.abspath(root)
+        self.index_file = index_file
+        self.cache_dir = cache_dir
+        self._files: Dict[str, _BundleFile] = {}
+        self._root_mtime_ns = None
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()  # One rescan at a time, however many requests notice the rebuild
+        self._precompress = precompress
+        self._compressing = False
+        self._load()
+
+    def _cache_key(self, rel: str) -> str:
+        return hashlib.sha1(f"{self.root}/{rel}".encode()).hexdigest()[:16]
+
+    def _cache_path(self, rel: str, stat: FileStat, suffix: str) -> str:
+        # Keyed by path and validator: a rebuilt or overwritten file never matches an old copy
+        version = stat.etag.strip('"')
+        return os.path.join(self.cache_dir, f"{self._cache_key(rel)}-{version}{suffix}")
+
+    def _cached_variants(self, rel: str, stat: FileStat) -> Dict[str, FileStat]:
+        variants = {}
+        for coding, suffix in ENCODINGS:
+            try:
+                size = os.stat(self._cache_path(rel, stat, suffix)).st_size
+            except OSError:
+                continue
+            # Same validators as the original, so a rebuild that changes it changes these too
+            variants[coding] = FileStat(self._cache_path(rel, stat, suffix), size, stat.mtime,
+                                        f'{stat.etag[:-1]}-{coding}"')
+        return variants
+
+    def _load(self):
+        root_mtime_ns = os.stat(self.root).st_mtime_ns
+        found = {}
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                full = os.path.join(dirpath, filename)
+                found[os.path.relpath(full, self.root).replace(os.sep, "/")] = full
+
+        files = {}
+        for rel, full in found.items():
+            if any(rel.endswith(suffix) and rel[:-len(suffix)] in found for _, suffix in ENCODINGS):
+                continue  # A pre-compressed sibling, served through its original
+            try:
+                stat = file_stat(full)
+                variants = self._cached_variants(rel, stat)
+                # Siblings shipped by the build win over our own copies
+                variants.update({
+                    coding: file_stat(found[rel + suffix], suffix=f"-{coding}")
+                    for coding, suffix in ENCODINGS if rel + suffix in found
+                })
+            except OSError:
+                continue
+            files[rel] = _BundleFile(stat, mimetypes.guess_type(rel)[0] or "application/octet-stream", variants)
+
+        with self._lock:
+            self._files = files
+            self._root_mtime_ns = root_mtime_ns
+        print(f"[Static] Loaded {len(files)} frontend file(s) from {self.root}")
+        self._start_compressing()
+
+    def _start_compressing(self):
+        with self._lock:
+            if not self._precompress or self._compressing:
+                return
+            if not any(self._needs_variants(rel, f) for rel, f in self._files.items()):
+                return
+            self._compressing = True
+        threading.Thread(target=self._compress_missing, daemon=True, name="static-precompress").start()
+
+    def _needs_variants(self, rel: str, entry: _BundleFile) -> bool:
+        if os.path.splitext(rel)[1].lower() not in COMPRESSIBLE_EXTS or entry.stat.size < MIN_COMPRESS_SIZE:
+            return False
+        return "gzip" not in entry.variants or (brotli is not None and "br" not in entry.variants)
+
+    def _compress_missing(self):
+        """Compress files that have no .gz/.br copy yet into the cache dir, then swap them in."""
+        written = 0
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with self._lock:
+                pending = list(self._files.items())
+            for rel, entry in pending:
+                if not self._needs_variants(rel, entry):
+                    continue
+                with open(entry.stat.path, "rb") as f:
+                    data = f.read()
+                if file_stat(entry.stat.path) != entry.stat:
+                    continue  # Rewritten while we read it; the next serve() notices and retries
+                if "gzip" not in entry.variants:
+                    self._write_cached(rel, entry.stat, ".gz", gzip.compress(data, compresslevel=9))
+                    written += 1
+                if brotli is not None and "br" not in entry.variants:
+                    self._write_cached(rel, entry.stat, ".br", brotli.compress(data, quality=11))
+                    written += 1
+                with self._lock:
+                    # Only if the table still holds the version we compressed
+                    current = self._files.get(rel)
+                    if current is not None and current.stat == entry.stat:
+                        self._files[rel] = current._replace(
+                            variants={**self._cached_variants(rel, entry.stat), **current.variants})
+            self._prune_cache()
+        except OSError as e:
+            print(f"[Static] Could not pre-compress: {e}")
+        finally:
+            with self._lock:
+                self._compressing = False
+        print(f"[Static] Wrote {written} compressed file(s) to {self.cache_dir}")
+
+    def _write_cached(self, rel: str, stat: FileStat, suffix: str, data: bytes):
+        target = self._cache_path(rel, stat, suffix)
+        with open(target + ".tmp", "wb") as out:
+            out.write(data)
+        os.replace(target + ".tmp", target)
+
+    def _prune_cache(self):
+        """Drop compressed copies of files that no longer exist in that form (left by a rebuild)."""
+        with self._lock:
+            keep = {os.path.basename(v.path) for f in self._files.values() for v in f.variants.values()}
+        for name in os.listdir(self.cache_dir):
+            if name not in keep:
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except OSError:
+                    pass
+
+    def _current(self) -> Dict[str, _BundleFile]:
+        try:
+            if os.stat(self.root).st_mtime_ns != self._root_mtime_ns:
+                with self._reload_lock:
+                    # Requests that queued behind the first rescan find it already done
+                    if os.stat(self.root).st_mtime_ns != self._root_mtime_ns:
+                        self._load()  # `npm run build` replaced the bundle
+        except OSError:
+            pass
+        return self._files
+
+    def _fresh(self, rel: str, entry: _BundleFile) -> _BundleFile:
+        """The entry, re-stat'd: a file overwritten in place doesn't always touch the directory mtime."""
+        try:
+            stat = file_stat(entry.stat.path)
+        except OSError:
+            return entry  # Gone mid-rebuild; the rescan will catch up
+        if stat == entry.stat:
+            return entry
+        # Its compressed copies describe the old bytes; serve identity until they're redone
+        entry = entry._replace(stat=stat, variants=self._cached_variants(rel, stat))
+        with self._lock:
+            self._files[rel] = entry
+        self._start_compressing()
+        return entry
+
+    def serve(self, request: Request, path: str) -> Response:
+        files = self._current()
+        rel = path.strip("/")
+        entry = files.get(rel)
+        if entry is None:
+            if rel.startswith("assets/"):
+                return Response(status_code=404)  # A stale hashed asset: don't answer with HTML
+            entry = files.get(self.index_file)  # Client-side route: let React Router handle it
+            if entry is None:
+                return Response(status_code=404)
+            rel = self.index_file
+        entry = self._fresh(rel, entry)
+
+        cache_control = IMMUTABLE if rel.startswith("assets/") else REVALIDATE
+        stat, encoding = entry.stat, None
+        if entry.variants and not request.headers.get("range"):
+            accepted = _accepted_encodings(request)
+            for coding, _ in ENCODINGS:
+                if coding in accepted and coding in entry.variants:
+                    stat, encoding = entry.variants[coding], coding
+                    break
+        return file_response(request, stat, media_type=entry.media_type, cache_control=cache_control,
+                             content_encoding=encoding, vary=bool(entry.variants))
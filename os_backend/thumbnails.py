@@ -0,0 +1,220 @@
+"""
+Thumbnails for the MyFiles explorer, so the grid never has to download full media.
+
+- PDFs: first page rendered by PyMuPDF at thumbnail scale
+- Images: PIL `draft()` decodes JPEGs straight at reduced scale, then `thumbnail()`
+- Videos: an OpenCV poster frame taken ~10% in (the very first frame is often black)
+
+Thumbnails are JPEGs in data/thumbnails, named by a content fingerprint of the source and
+the requested size, so a renamed or copied file reuses its thumbnail. The cache is trimmed
+least-recently-used first once it grows past THUMB_CACHE_MB.
+
+Requests are rendered in a small worker pool; files the directory index reports as new or
+changed are rendered ahead of time by a single low-priority worker.
+"""
+import io
+import os
+import time
+import hashlib
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+import cv2
+import fitz  # PyMuPDF
+from PIL import Image as PILImage, ImageOps
+
+THUMB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "thumbnails")
+os.makedirs(THUMB_DIR, exist_ok=True)
+
+SIZES = (128, 256, 512)
+DEFAULT_SIZE = 256
+JPEG_QUALITY = 80
+CACHE_LIMIT = int(os.getenv("THUMB_CACHE_MB", "200")) * 1024 * 1024
+
+SAMPLE_BYTES = 64 * 1024  # Fingerprint = size + first and last 64 KB: cheap even for a 2 GB video
+
+_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="thumbnail")
+_background = ThreadPoolExecutor(max_workers=1, thread_name_prefix="thumbnail-eager")
+_pending: Dict[str, Future] = {}
+_lock = threading.Lock()
+_fingerprints: Dict[Tuple[str, int, int], str] = {}  # (path, size, mtime_ns) -> digest
+# Cache hits are recorded here rather than by touching the file, whose mtime must stay put:
+# it feeds the Last-Modified validator. Entries for files that are gone are pruned as it grows.
+_last_used: Dict[str, float] = {}
+_prune_at = 1024
+_cache_bytes = sum(entry.stat().st_size for entry in os.scandir(THUMB_DIR) if entry.is_file())
+
+
+class ThumbnailError(Exception):
+    pass
+
+
+def fingerprint(path: str, st: os.stat_result = None) -> str:
+    st = st or os.stat(path)
+    key = (path, st.st_size, st.st_mtime_ns)
+    digest = _fingerprints.get(key)
+    if digest is None:
+        sha = hashlib.sha256(str(st.st_size).encode())
+        with open(path, "rb") as f:
+            sha.update(f.read(SAMPLE_BYTES))
+            if st.st_size > 2 * SAMPLE_BYTES:
+                f.seek(-SAMPLE_BYTES, os.SEEK_END)
+                sha.update(f.read(SAMPLE_BYTES))
+        digest = sha.hexdigest()[:32]
+        if len(_fingerprints) > 10000:
+            _fingerprints.clear()
+        _fingerprints[key] = digest
+    return digest
+
+
+def _fit(width: int, height: int, size: int) -> float:
+    return min(1.0, size / max(width, height, 1))
+
+
+def _render_image(path: str, size: int) -> PILImage.Image:
+    img = PILImage.open(path)
+    img.draft("RGB", (size, size))
+    img = ImageOps.exif_transpose(img)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    img.thumbnail((size, size))
+    return img
+
+
+def _render_pdf(path: str, size: int) -> PILImage.Image:
+    with fitz.open(path) as doc:
+        if doc.page_count == 0:
+            raise ThumbnailError("PDF has no pages")
+        page = doc[0]
+        zoom = size / max(page.rect.width, page.rect.height)
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+        return PILImage.frombytes("RGB", (pix.width, pix.height), pix.samples)
+
+
+def _render_video(path: str, size: int) -> PILImage.Image:
+    cap = cv2.VideoCapture(path)
+    try:
+        if not cap.isOpened():
+            raise ThumbnailError("Cannot open video")
+        frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        if frames > 10:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, frames // 10)
+        ok, frame = cap.read()
+        if not ok:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = cap.read()
+        if not ok:
+            raise ThumbnailError("No decodable frame")
+    finally:
+        cap.release()
+    h, w = frame.shape[:2]
+    scale = _fit(w, h, size)
+    if scale < 1.0:
+        frame = cv2.resize(frame, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+    return PILImage.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+
+
+RENDERERS = {"image": _render_image, "pdf": _render_pdf, "video": _render_video}
+
+
+def _thumb_path(digest: str, size: int) -> str:
+    return os.path.join(THUMB_DIR, f"{digest}_{size}.jpg")
+
+
+def _evict(keep: str):
+    """Delete the least recently used thumbnails until the cache is back under its limit."""
+    global _cache_bytes
+    entries = sorted((_last_used.get(e.path, e.stat().st_mtime), e.stat().st_size, e.path)
+                     for e in os.scandir(THUMB_DIR) if e.is_file())
+    for _, size, path in entries:
+        if _cache_bytes <= CACHE_LIMIT * 0.9:
+            break
+        if path == keep:
+            continue  # The thumbnail we are about to serve
+        try:
+            os.remove(path)
+            _cache_bytes -= size
+            _last_used.pop(path, None)
+        except OSError:
+            pass
+
+
+def _generate(path: str, file_type: str, size: int, target: str) -> str:
+    global _cache_bytes
+    if os.path.exists(target):
+        return target
+    img = RENDERERS[file_type](path, size)
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=JPEG_QUALITY)
+    tmp = f"{target}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(out.getvalue())
+    os.replace(tmp, target)
+    with _lock:
+        _cache_bytes += len(out.getvalue())
+        over = _cache_bytes > CACHE_LIMIT
+    if over:
+        with _lock:
+            _evict(keep=target)
+    return target
+
+
+def _submit(pool: ThreadPoolExecutor, path: str, file_type: str, size: int) -> Tuple[str, Optional[Future]]:
+    """(thumbnail path, future or None if already cached). Concurrent requests share one render."""
+    target = _thumb_path(fingerprint(path), size)
+    if os.path.exists(target):
+        return target, None
+    with _lock:
+        future = _pending.get(target)
+        if future is None:
+            future = pool.submit(_generate, path, file_type, size, target)
+            _pending[target] = future
+            future.add_done_callback(lambda _: _pending.pop(target, None))
+    return target, future
+
+
+def get_thumbnail(path: str, file_type: str, size: int = DEFAULT_SIZE, timeout: float = 30.0) -> str:
+    """Blocking: path of the cached JPEG thumbnail, rendering it first if needed."""
+    if file_type not in RENDERERS:
+        raise ThumbnailError(f"No preview for {file_type} files")
+    target, future = _submit(_pool, path, file_type, size)
+    if future is not None:
+        future.result(timeout=timeout)
+    _touch(target)
+    return target
+
+
+def _touch(target: str):
+    """Record a use of `target` (recency for eviction), dropping entries whose file has vanished."""
+    global _prune_at
+    with _lock:
+        _last_used[target] = time.time()
+        if len(_last_used) <= _prune_at:
+            return
+        for path in [p for p in _last_used if not os.path.exists(p)]:
+            del _last_used[path]
+        _prune_at = max(1024, 2 * len(_last_used))  # Amortised: the next prune waits for real growth
+
+
+def _prerender(path: str, file_type: str):
+    target = _thumb_path(fingerprint(path), DEFAULT_SIZE)
+    with _lock:
+        if os.path.exists(target) or target in _pending:
+            return
+        future = _pending[target] = Future()  # Lets a request for this file wait on us instead
+    try:
+        future.set_result(_generate(path, file_type, DEFAULT_SIZE, target))
+    except Exception as e:
+        future.set_exception(e)
+        print(f"[Thumbnails] Could not pre-render {path}: {e}")
+    finally:
+        with _lock:
+            _pending.pop(target, None)
+
+
+def on_index_change(change: str, entry, root: str):
+    """FileIndex listener (after its initial scan): queue new or changed media for a default-size thumbnail."""
+    if change == "removed" or entry.type not in RENDERERS:
+        return
+    _background.submit(_prerender, os.path.join(root, entry.path), entry.type)
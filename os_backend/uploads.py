@@ -0,0 +1,281 @@
+"""
+Shared upload handling for every router that accepts files (RAG, Smart Killer, Math Wizard, Voice).
+
+- `UploadLimitMiddleware` enforces the caps of the upload routes in ROUTE_LIMITS while the
+  body is still arriving: an oversized Content-Length is refused with 413 before anything is
+  read, and a chunked body is cut off with 413 as soon as it crosses the cap. Other routes
+  are left alone.
+- `receive()` (or `save()` + `discard()`) parses the multipart body of the request itself as
+  it streams in, writing the file part straight into its own uniquely named temp file and
+  hashing it on the way; the temp file is deleted when the request is done. Upload routes
+  take the raw `Request` instead of an `UploadFile`, so Starlette never spools a second copy.
+  Downstream code gets a path (PyMuPDF and PIL open files directly) and the sha256 instead
+  of the whole upload as bytes.
+"""
+import os
+import mmap
+import time
+import asyncio
+import hashlib
+import tempfile
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, NamedTuple, Optional
+
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+UPLOAD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "uploads")
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+MB = 1024 * 1024
+STALE_AFTER = 3600  # Leftovers from a crash are swept at startup
+
+# Caps on the whole request body of each upload route; no other route is limited here
+ROUTE_LIMITS = {
+    "/api/rag/upload":                  50 * MB,  # Full textbooks
+    "/api/smart-killer/upload-learn":   25 * MB,
+    "/api/smart-killer/upload-learn/stream": 25 * MB,
+    "/api/math-wizard/evaluate":        15 * MB,  # One phone photo
+    "/api/voice/process":               10 * MB,  # A spoken question
+}
+MAX_FIELD_BYTES = 64 * 1024  # Plain form fields sent alongside the file
+
+
+def limit_for(path: str) -> Optional[int]:
+    return ROUTE_LIMITS.get(path.rstrip("/"))
+
+
+def _too_large(limit: int) -> HTTPException:
+    readable = f"{limit // MB} MB" if limit >= MB else f"{limit} bytes"
+    return HTTPException(status_code=413, detail=f"Upload too large (limit {readable})")
+
+
+class UploadLimitMiddleware:
+    """ASGI middleware: reject request bodies over the route's limit before they are buffered."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT", "PATCH"):
+            return await self.app(scope, receive, send)
+
+        limit = limit_for(scope["path"])
+        if limit is None:
+            return await self.app(scope, receive, send)
+        for name, value in scope.get("headers", []):
+            if name == b"content-length":
+                try:
+                    declared = int(value)
+                except ValueError:
+                    break
+                if declared > limit:
+                    response = JSONResponse({"detail": _too_large(limit).detail}, status_code=413)
+                    return await response(scope, receive, send)
+                break
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Surfaces through the body parser as a normal 413 response
+                    raise _too_large(limit)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+class Upload(NamedTuple):
+    path: str
+    filename: str
+    content_type: str
+    size: int
+    sha256: str
+    fields: Dict[str, str] = {}  # The other (text) form fields
+
+    @property
+    def ext(self) -> str:
+        return os.path.splitext(self.filename)[1].lower()
+
+    def read_bytes(self) -> bytes:
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    @contextmanager
+    def mmap(self):
+        """Read-only memory map of the upload (nothing is copied into Python memory)."""
+        with open(self.path, "rb") as f:
+            if self.size == 0:
+                yield b""
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                yield mapped
+
+
+class _FormSink:
+    """
+    MultipartParser callbacks: the part named `field` goes to `fd` (hashed chunk by chunk),
+    small text parts are kept in `fields`.
+    """
+
+    def __init__(self, field: str, fd: int, max_bytes: Optional[int]):
+        self.field = field
+        self.out = os.fdopen(fd, "wb")
+        self.max_bytes = max_bytes
+        self.sha = hashlib.sha256()
+        self.size = 0
+        self.found = False
+        self.filename = None
+        self.content_type = ""
+        self.fields: Dict[str, str] = {}
+        self._header_name = b""
+        self._header_value = b""
+        self._headers: Dict[bytes, bytes] = {}
+        self._name = None
+        self._is_file = False
+        self._value = bytearray()
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self._part_begin,
+            "on_header_field": self._header_field,
+            "on_header_value": self._header_value_data,
+            "on_header_end": self._header_end,
+            "on_headers_finished": self._headers_finished,
+            "on_part_data": self._part_data,
+            "on_part_end": self._part_end,
+        }
+
+    def _part_begin(self):
+        self._headers, self._name, self._is_file = {}, None, False
+        self._value = bytearray()
+
+    def _header_field(self, data: bytes, start: int, end: int):
+        self._header_name += data[start:end]
+
+    def _header_value_data(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _header_end(self):
+        self._headers[self._header_name.lower()] = self._header_value
+        self._header_name = self._header_value = b""
+
+    def _headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        self._name = options.get(b"name", b"").decode("latin-1")
+        if self._name == self.field and not self.found:
+            self._is_file = True
+            self.found = True
+            self.filename = options.get(b"filename", b"upload").decode("utf-8", "replace")
+            self.content_type = self._headers.get(b"content-type", b"").decode("latin-1")
+
+    def _part_data(self, data: bytes, start: int, end: int):
+        if self._is_file:
+            self.size += end - start
+            if self.max_bytes and self.size > self.max_bytes:
+                raise _too_large(self.max_bytes)
+            chunk = data[start:end]
+            self.sha.update(chunk)
+            self.out.write(chunk)
+        else:
+            self._value += data[start:end]
+            if len(self._value) > MAX_FIELD_BYTES:
+                raise HTTPException(status_code=413, detail=f"Form field '{self._name}' is too large")
+
+    def _part_end(self):
+        if not self._is_file and self._name:
+            self.fields[self._name] = self._value.decode("utf-8", "replace")
+        self._is_file = False
+
+
+async def save(request: Request, route: str, field: str = "file", max_bytes: Optional[int] = None) -> Upload:
+    """
+    Stream the multipart body into a unique temp file, one chunk at a time as it arrives.
+    The caller must `discard()` it (or use `receive()`).
+    """
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in options:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data upload")
+
+    max_bytes = max_bytes or limit_for(route)
+    prefix = route.strip("/").replace("/", "_")[:40] + "-"
+    fd, path = tempfile.mkstemp(prefix=prefix, dir=UPLOAD_DIR)
+    sink = _FormSink(field, fd, max_bytes)
+    parser = MultipartParser(options[b"boundary"], sink.callbacks())
+    loop = asyncio.get_event_loop()
+    try:
+        try:
+            async for chunk in request.stream():
+                if chunk:
+                    # Parsing, hashing and the disk write happen off the event loop
+                    await loop.run_in_executor(None, parser.write, chunk)
+            parser.finalize()
+        finally:
+            sink.out.close()
+        if not sink.found:
+            raise HTTPException(status_code=422, detail=f"Missing file field '{field}'")
+    except BaseException:
+        _remove(path)
+        raise
+    filename = os.path.basename(sink.filename) or "upload"
+    suffix = os.path.splitext(filename)[1][:16]
+    if suffix:
+        # The name is only known once the part headers arrive; some readers go by extension
+        os.replace(path, path + suffix)
+        path += suffix
+    return Upload(path, filename, sink.content_type, sink.size, sink.sha.hexdigest(), sink.fields)
+
+
+def openapi_form(field: str = "file", *text_fields: str) -> dict:
+    """`openapi_extra` for a route using `save()`/`receive()`, so /docs still shows the upload form."""
+    properties = {field: {"type": "string", "format": "binary"}}
+    properties.update({name: {"type": "string"} for name in text_fields})
+    return {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+        "type": "object", "properties": properties, "required": [field],
+    }}}}}
+
+
+def discard(upload: Upload):
+    _remove(upload.path)
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+@asynccontextmanager
+async def receive(request: Request, route: str, field: str = "file", max_bytes: Optional[int] = None):
+    """
+    async with receive(request, "/api/rag/upload") as upload: ...
+    Yields an Upload whose temp file is removed when the block exits.
+    """
+    upload = await save(request, route, field, max_bytes)
+    try:
+        yield upload
+    finally:
+        discard(upload)
+
+
+def _sweep_stale():
+    cutoff = time.time() - STALE_AFTER
+    for entry in os.scandir(UPLOAD_DIR):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+
+_sweep_stale()
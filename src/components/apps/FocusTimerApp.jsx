@@ -10,8 +10,10 @@ const FocusTimerApp = ({ onClose }) => {
     const [isActive, setIsActive] = useState(false);
     const [faceDetected, setFaceDetected] = useState(false);
     const [absentSeconds, setAbsentSeconds] = useState(0);
+    const [attention, setAttention] = useState('unknown'); // 'focused' | 'distracted' | 'away'
     const { stream, cameraError, requestCamera, releaseCamera } = useCamera();
     const wsRef = useRef(null);
+    const isActiveRef = useRef(false);
     const videoRef = useRef(null);
 
     useEffect(() => {
@@ -59,46 +61,51 @@ const FocusTimerApp = ({ onClose }) => {
         return () => clearInterval(interval);
     }, [isActive, faceDetected, cameraError]);
 
-    // WebSocket Face Detection
+    // WebSocket Attention Tracking: the server only messages us when the state changes
     useEffect(() => {
-        // Connect to existing Vision WebSocket
-        wsRef.current = new WebSocket('ws://localhost:8000/api/vision/ws');
+        isActiveRef.current = isActive;
+    }, [isActive]);
 
-        wsRef.current.onmessage = (event) => {
+    useEffect(() => {
+        if (stream && videoRef.current) {
+            videoRef.current.srcObject = stream;
+        }
+
+        const ws = new WebSocket(`ws://${window.location.hostname}:8000/api/vision/ws`);
+        ws.binaryType = 'arraybuffer';
+        wsRef.current = ws;
+
+        ws.onmessage = (event) => {
             try {
-                const results = JSON.parse(event.data);
-                if (results.length > 0) {
-                    setFaceDetected(true);
-                } else {
-                    setFaceDetected(false);
+                const msg = JSON.parse(event.data);
+                if (msg.type === 'state') {
+                    setAttention(msg.state);
+                    setFaceDetected(msg.present);
                 }
             } catch (err) {
                 console.error("Focus Timer WS Error", err);
             }
         };
 
-        // ── Bind Global Camera Stream ──
-        if (stream && videoRef.current) {
-            videoRef.current.srcObject = stream;
-
-            const canvas = document.createElement('canvas');
-            canvas.width = 300;
-            canvas.height = 300;
-            const ctx = canvas.getContext('2d');
+        const canvas = document.createElement('canvas');
+        canvas.width = 320;
+        canvas.height = 240;
+        const ctx = canvas.getContext('2d');
 
-            setInterval(() => {
-                if (wsRef.current?.readyState === WebSocket.OPEN && isActive && videoRef.current) {
-                    ctx.drawImage(videoRef.current, 0, 0, canvas.width, canvas.height);
-                    const frameData = canvas.toDataURL('image/jpeg', 0.5);
-                    wsRef.current.send(frameData);
-                }
-            }, 1000);
-        }
+        // Small binary JPEGs, only while the timer runs; the server analyses at its own (lower) rate
+        const sender = setInterval(() => {
+            if (ws.readyState !== WebSocket.OPEN || !isActiveRef.current || !videoRef.current) return;
+            ctx.drawImage(videoRef.current, 0, 0, canvas.width, canvas.height);
+            canvas.toBlob((blob) => {
+                if (blob && ws.readyState === WebSocket.OPEN) ws.send(blob);
+            }, 'image/jpeg', 0.5);
+        }, 1000);
 
         return () => {
-            if (wsRef.current) wsRef.current.close();
+            clearInterval(sender);
+            ws.close();
         };
-    }, [isActive, stream]);
+    }, [stream]);
 
     const toggleTimer = () => {
         setIsActive(!isActive);
@@ -183,9 +190,11 @@ const FocusTimerApp = ({ onClose }) => {
 
                 <div className="ft-time-display">
                     <h1>{formatTime(timeLeft)}</h1>
-                    <span className={`ft-status-pill ${isActive ? (faceDetected || cameraError ? 'focusing' : 'away') : 'paused'}`}>
+                    <span className={`ft-status-pill ${isActive ? (faceDetected || cameraError ? (attention === 'distracted' ? 'distracted' : 'focusing') : 'away') : 'paused'}`}>
                         {isActive
-                            ? (faceDetected || cameraError ? 'FOCUSING...' : 'STUDENT AWAY ⚠️')
+                            ? (faceDetected || cameraError
+                                ? (attention === 'distracted' ? 'EYES ON YOUR WORK 👀' : 'FOCUSING...')
+                                : 'STUDENT AWAY ⚠️')
                             : 'PAUSED'}
                     </span>
                 </div>
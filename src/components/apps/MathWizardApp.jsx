@@ -2,6 +2,7 @@ import React, { useRef, useState, useEffect } from 'react';
 import { Camera, RefreshCw, Volume2, ArrowLeft, Brain, BookOpen, Play } from 'lucide-react';
 import { useCamera } from '../../context/CameraContext';
 import CameraDiagnosticAgent from '../CameraDiagnosticAgent';
+import { playRobotVoice, stopRobotVoice } from './robotVoice';
 import './MathWizard.css';
 
 const BACKEND_URL = `http://${window.location.hostname}:8000`;
@@ -21,7 +22,7 @@ const MathWizardApp = ({ onClose }) => {
 
     // Stop speaking when unmounted
     useEffect(() => {
-        return () => window.speechSynthesis.cancel();
+        return () => stopRobotVoice();
     }, []);
 
     // Request camera on mount, release on unmount
@@ -37,27 +38,28 @@ const MathWizardApp = ({ onClose }) => {
         }
     }, [stream]);
 
-    const playVoice = (text) => {
-        window.speechSynthesis.cancel();
-        if ('speechSynthesis' in window) {
-            const utterance = new SpeechSynthesisUtterance(text);
-
-            // Try to find a friendly female voice for the "Teacher" persona
-            const voices = window.speechSynthesis.getVoices();
-            const femaleVoice = voices.find(v => v.name.includes('Female') || v.name.includes('Zira') || v.name.includes('Samantha'));
-            if (femaleVoice) utterance.voice = femaleVoice;
-
-            utterance.pitch = 1.2;
-            utterance.rate = 0.95;
-            window.speechSynthesis.speak(utterance);
-        }
+    // The robot's voice (greetings and prompts come from the backend's phrase cache),
+    // or the browser's as a fallback
+    const playVoice = (text, speechUrl) => {
+        playRobotVoice(text, {
+            speechUrl,
+            configure: (utterance) => {
+                // Try to find a friendly female voice for the "Teacher" persona
+                const voices = window.speechSynthesis.getVoices();
+                const femaleVoice = voices.find(v => v.name.includes('Female') || v.name.includes('Zira') || v.name.includes('Samantha'));
+                if (femaleVoice) utterance.voice = femaleVoice;
+
+                utterance.pitch = 1.2;
+                utterance.rate = 0.95;
+            },
+        });
     };
 
     const generateQuiz = async () => {
         setIsGenerating(true);
         setFeedback(null);
         setCapturedImage(null);
-        window.speechSynthesis.cancel();
+        stopRobotVoice();
 
         try {
             const res = await fetch(`${BACKEND_URL}/api/math-wizard/generate-quiz`);
@@ -65,7 +67,7 @@ const MathWizardApp = ({ onClose }) => {
             const data = await res.json();
 
             setQuizQuestion(data.question);
-            playVoice(`Please write down the answer to: ${data.question}, and hold it up to the camera!`);
+            playVoice(data.prompt || `Please write down the answer to: ${data.question}, and hold it up to the camera!`, data.speech_url);
         } catch (err) {
             console.error(err);
             setQuizQuestion("Failed to connect to the Math Engine. Are you offline?");
@@ -77,7 +79,7 @@ const MathWizardApp = ({ onClose }) => {
     const captureAndGrade = async () => {
         if (!videoRef.current) return;
 
-        window.speechSynthesis.cancel();
+        stopRobotVoice();
         setIsThinking(true);
         setFeedback(null);
 
@@ -113,7 +115,7 @@ const MathWizardApp = ({ onClose }) => {
 
             const data = await response.json();
             setFeedback(data.feedback);
-            playVoice(data.feedback); // Read the grading aloud!
+            playVoice(data.feedback, data.speech_url); // Read the grading aloud!
 
         } catch (err) {
             console.error("Grading error:", err);
@@ -126,7 +128,7 @@ const MathWizardApp = ({ onClose }) => {
     const resetScanner = () => {
         setCapturedImage(null);
         setFeedback(null);
-        window.speechSynthesis.cancel();
+        stopRobotVoice();
         if (mode === 'quiz') {
             setQuizQuestion(null); // Force user to click "Next Question"
         }
@@ -139,7 +139,14 @@ const MyFilesApp = ({ onClose }) => {
                                 onClick={() => handleFileClick(file)}
                             >
                                 <div className="file-icon-wrapper">
-                                    {getFileIcon(file.type)}
+                                    {file.thumbnail ? (
+                                        <img
+                                            src={`${API_BASE_URL}${file.thumbnail}`}
+                                            alt={file.name}
+                                            loading="lazy"
+                                            className="file-thumbnail"
+                                        />
+                                    ) : getFileIcon(file.type)}
                                 </div>
                                 <div className="file-info">
                                     <span className="file-name" title={file.name}>{file.name}</span>
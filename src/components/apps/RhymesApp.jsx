@@ -47,9 +47,21 @@ const RhymesApp = ({ onClose }) => {
         }
     };
 
+    // Server-side choreography keeps the moves on beat; fall back to the firmware dance loop
+    // for rhymes that have no motion script yet.
+    const playChoreography = async (rhyme) => {
+        try {
+            const res = await fetch(`${BACKEND_URL}/sequences/${rhyme.id}/play`, { method: 'POST' });
+            if (res.ok) return;
+        } catch (err) {
+            console.error('[Kinematics Sync] Sequence playback failed', err);
+        }
+        sendKinematicCommand('dance start');
+    };
+
     const handleVideoPlay = () => {
         setIsPlaying(true);
-        sendKinematicCommand('dance start');
+        playChoreography(activeRhyme);
     };
 
     const handleVideoPause = () => {
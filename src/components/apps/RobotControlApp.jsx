@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { Bot, ArrowUp, ArrowDown, ArrowLeft, ArrowRight, Hand, Navigation, Disc3, Square, X } from 'lucide-react';
 import './RobotControl.css';
 
@@ -6,11 +6,39 @@ const RobotControlApp = ({ onClose }) => {
     const [status, setStatus] = useState('Checking Connection...');
     const [isConnected, setIsConnected] = useState(false);
     const [isDancing, setIsDancing] = useState(false);
+    const wsRef = useRef(null);
 
     const BACKEND_URL = `http://${window.location.hostname}:8000/api/hardware`;
+    const WS_URL = `ws://${window.location.hostname}:8000/api/hardware/ws`;
 
     useEffect(() => {
         checkStatus();
+
+        // Persistent teleop socket: commands + live status pushes, no per-move HTTP or polling
+        const ws = new WebSocket(WS_URL);
+        wsRef.current = ws;
+        ws.onmessage = (event) => {
+            try {
+                const msg = JSON.parse(event.data);
+                if (msg.type === 'status' || msg.type === 'connection') {
+                    setIsConnected(msg.connected);
+                    if (msg.type === 'connection' || !msg.connected) {
+                        setStatus(msg.connected ? `Connected to ${msg.port}` : 'Disconnected (Check Port/Cable)');
+                    }
+                } else if (msg.type === 'ack') {
+                    if (msg.status === 'rejected' || msg.status === 'error') {
+                        setStatus(`Error: ${msg.detail}`);
+                    } else {
+                        setStatus(`Command Sent: [ ${msg.command.toUpperCase()} ]`);
+                        if (msg.command === 'dance start') setIsDancing(true);
+                        if (msg.command === 'dance stop' || msg.command === 's') setIsDancing(false);
+                    }
+                }
+            } catch (err) {
+                console.error('Robot WS Error', err);
+            }
+        };
+        return () => ws.close();
     }, []);
 
     const checkStatus = async () => {
@@ -26,6 +54,11 @@ const RobotControlApp = ({ onClose }) => {
     };
 
     const sendCommand = async (cmd) => {
+        if (wsRef.current?.readyState === WebSocket.OPEN) {
+            wsRef.current.send(JSON.stringify({ command: cmd }));
+            return;
+        }
+        // Fallback: plain HTTP if the socket is down
         try {
             const res = await fetch(`${BACKEND_URL}/execute`, {
                 method: 'POST',
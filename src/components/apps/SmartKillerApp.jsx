@@ -1,23 +1,34 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { Wand2, Image as ImageIcon, CheckCircle, Mic, Volume2, SkipForward, Users, Download, Home, ArrowLeft } from 'lucide-react';
 import jsPDF from 'jspdf';
 import autoTable from 'jspdf-autotable';
 import Lottie from 'lottie-react';
 import robotAnimation from '../../robot_toon.json';
+import { playRobotVoice, stopRobotVoice } from './robotVoice';
 import './Apps.css';
 
-// Audio Logic (Instantiated per play to avoid state lock)
-const playSound = (type) => {
+// Audio Logic (Instantiated per play to avoid state lock). `then` runs once the sound is over.
+const playSound = (type, then) => {
+    let done = false;
+    const next = () => {
+        if (!done && then) {
+            done = true;
+            then();
+        }
+    };
     try {
         const audio = new Audio(type === 'correct' ? '/correct_chime.mp3' : '/wrong_buzzer.mp3');
         audio.currentTime = 0;
-        audio.play().catch(e => console.warn("Browser blocked autoplay audio:", e));
-    } catch (err) { }
+        audio.onended = next;
+        audio.onerror = next;
+        audio.play().catch(e => { console.warn("Browser blocked autoplay audio:", e); next(); });
+    } catch (err) { next(); }
 };
 
 const SmartKillerApp = ({ onClose }) => {
     // Pipeline States: upload -> learning -> registration -> permissions -> quiz_intro -> quiz_active -> quiz_result -> student_finished -> final_results
     const [state, setState] = useState('upload');
+    const stateRef = useRef(state); // For callbacks that fire after a sound has finished
     const [curriculum, setCurriculum] = useState(null);
     const [tIdx, setTIdx] = useState(0); // Topic Index
     const [qIdx, setQIdx] = useState(0); // Question Index
@@ -51,7 +62,7 @@ const SmartKillerApp = ({ onClose }) => {
         if (state === 'quiz_active' && activeQuestionPool.length > 0) {
             const activeQuestion = activeQuestionPool[qIdx];
             if (activeQuestion && activeQuestion.question) {
-                window.speechSynthesis.cancel();
+                stopRobotVoice();
                 let text = activeQuestion.question;
                 if (activeQuestion.options && activeQuestion.options.length === 4) {
                     text += `. Option A: ${activeQuestion.options[0]}. Option B: ${activeQuestion.options[1]}. Option C: ${activeQuestion.options[2]}. Option D: ${activeQuestion.options[3]}.`;
@@ -64,9 +75,18 @@ const SmartKillerApp = ({ onClose }) => {
         }
     }, [qIdx, state, activeQuestionPool]);
 
+    // Topic intro in the robot's own voice ("Let's learn about ...!" is pre-rendered on the backend)
+    useEffect(() => {
+        stateRef.current = state;
+        const topic = curriculum?.topics[tIdx];
+        if (state === 'quiz_intro' && topic) {
+            playRobotVoice(topic.robot_speech || `Let's see what you learned about ${topic.concept}!`);
+        }
+    }, [state, tIdx, curriculum]);
+
     // Cleanup TTS on unmount
     useEffect(() => {
-        return () => window.speechSynthesis.cancel();
+        return () => stopRobotVoice();
     }, []);
 
     // Leader Agent Interaction (File Upload & 100MB Limit)
@@ -158,7 +178,7 @@ const SmartKillerApp = ({ onClose }) => {
 
     // Agent 5: Check Answer
     const handleCheckAnswer = async (answer) => {
-        window.speechSynthesis.cancel(); // Mute TTS immediately
+        stopRobotVoice(); // Mute TTS immediately
         setState('quiz_result');
         setSelectedAnswer(answer);
 
@@ -179,11 +199,17 @@ const SmartKillerApp = ({ onClose }) => {
             const data = await response.json();
             setFeedback(data);
 
+            // After the chime, the feedback in the robot's voice (cached on the backend), unless the quiz moved on
+            const speakFeedback = () => {
+                if (stateRef.current === 'quiz_result') {
+                    playRobotVoice(data.feedback, { speechUrl: data.speech_url });
+                }
+            };
             if (data.is_correct) {
                 setScore(s => ({ ...s, correct: s.correct + 1 }));
-                playSound('correct');
+                playSound('correct', speakFeedback);
             } else {
-                playSound('wrong');
+                playSound('wrong', speakFeedback);
             }
             setScore(s => ({ ...s, total: s.total + 1 }));
 
@@ -294,7 +320,7 @@ const SmartKillerApp = ({ onClose }) => {
             <button
                 className="app-internal-back-btn"
                 onClick={() => {
-                    window.speechSynthesis.cancel();
+                    stopRobotVoice();
                     if (onClose) onClose();
                     else setState('upload');
                 }}
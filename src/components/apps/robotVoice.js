@@ -0,0 +1,39 @@
+// The robot's own (Piper) voice, served by /api/voice/say: lines the robot repeats all day are
+// pre-rendered on the backend and play instantly. Falls back to the browser's speech synthesis
+// when the backend voice is warming up, unavailable or blocked by autoplay rules.
+
+const BACKEND_URL = `http://${window.location.hostname}:8000`;
+
+let current = null;
+
+export const stopRobotVoice = () => {
+    if (current) {
+        current.pause();
+        current = null;
+    }
+    window.speechSynthesis.cancel();
+};
+
+// speechUrl: the backend's `speech_url` for this text if the response carried one
+// configure: optional (utterance) => void to set voice/pitch/rate for the fallback
+export const playRobotVoice = (text, { speechUrl, configure } = {}) => {
+    stopRobotVoice();
+    if (!text) return;
+
+    const audio = new Audio(`${BACKEND_URL}${speechUrl || `/api/voice/say?text=${encodeURIComponent(text)}`}`);
+    current = audio;
+
+    let fellBack = false;
+    const fallback = () => {
+        if (fellBack || current !== audio) return; // Already handled, or stopped/replaced meanwhile
+        fellBack = true;
+        current = null;
+        if (!('speechSynthesis' in window)) return;
+        const utterance = new SpeechSynthesisUtterance(text);
+        if (configure) configure(utterance);
+        window.speechSynthesis.speak(utterance);
+    };
+
+    audio.onerror = fallback;
+    audio.play().catch(fallback);
+};
@@ -29,10 +29,8 @@ const AdminDashboard = () => {
             const dashData = await dashRes.json();
             setStats(dashData.stats);
             setRecentActivity(dashData.recent_activity);
-
-            const studRes = await fetch('http://127.0.0.1:8000/api/admin/students');
-            const studData = await studRes.json();
-            setStudents(studData);
+            // Roster (with attendance/score aggregates) ships in the same response
+            setStudents(dashData.students);
 
         } catch (error) {
             console.error("Failed to fetch admin data", error);